@@ -8,8 +8,6 @@
 
 """ Client connector to Augmento API.
 
-TODO : - websocket api.
-
 """
 
 # Built-in packages
@@ -17,7 +15,9 @@ TODO : - websocket api.
 # External packages
 
 # Local packages
-from augmento_client import rest_api
+from augmento_client import rest_api, async_rest_api, stream_api
 from augmento_client.rest_api import *
+from augmento_client.async_rest_api import *
+from augmento_client.stream_api import *
 
-__all__ = rest_api.__all__
+__all__ = rest_api.__all__ + async_rest_api.__all__ + stream_api.__all__
@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" Asynchronous client connector to Augmento REST API.
+
+The client speaks HTTP/1.1 over asyncio streams, keeping connections alive
+in a pool with a limit of concurrent requests per host, so a single event
+loop can drive many requests at once.
+
+Examples
+--------
+>>> async def main():
+...     async with AsyncRequestAugmento() as ra:
+...         return await ra.get_dataframe(
+...             source='twitter', coin='bitcoin', bin_size='24H',
+...             start='2019-06-01T00:00:00Z', end='2019-06-02T00:00:00Z'
+...         )
+>>> df = asyncio.run(main())  # doctest: +SKIP
+
+"""
+
+# Built-in packages
+import asyncio
+import json
+import logging
+import ssl
+import urllib.parse
+
+# External packages
+
+# Local packages
+from augmento_client.rest_api import (
+    intel_date, _to_block, _to_dataframe, _merge_blocks, _page_pointers,
+    _read_topics_cache, _write_topics_cache
+)
+
+__all__ = ['AsyncRequestAugmento']
+
+
+class AsyncRequestAugmento:
+    """ Class to request Augmento data from REST public API with asyncio.
+
+    Methods
+    -------
+    send_request(method, **params)
+        Return answere of request in list or dict.
+    get_data(source, coin, bin_size, start, end, start_ptr=0, count_ptr=1000)
+        Return aggregated event data in list of list.
+    get_dataframe(source, coin, bin_size, start, end)
+        Return aggregated event in a dataframe.
+    get_database(source, coin, bin_size, start, end, progress=None)
+        Merge several requests of aggregated event in a dataframe.
+    get_topics()
+        Return the topic names by index, cached.
+    close()
+        Close the pooled connections.
+
+    All methods but `close` are coroutines, and can be cancelled. A client
+    is bound to the event loop it is first used on until it is closed.
+    Redirects are followed, up to 10 in a row.
+
+    Parameters
+    ----------
+    url : str, optional
+        Url of the API.
+    logging_level : str, optional
+        Default is 'WARNING'.
+    max_retries : int, optional
+        Number of times a failed request is retried before raising, default
+        is 5.
+    backoff : float, optional
+        Seconds to wait before the first retry, doubled for each next retry.
+        Default is 1.
+    timeout : float, optional
+        Seconds to wait for an answer, default is 10. The time spent waiting
+        for a free slot of `limit_per_host` doesn't count.
+    limit_per_host : int, optional
+        Maximum number of concurrent requests (and connections) per host,
+        default is 10.
+    topics_path : str, optional
+        JSON file to cache the topics in, between clients. Default is None,
+        the topics are only cached for the lifetime of the client.
+    topics_ttl : float, optional
+        Seconds before the topics cached in `topics_path` are requested
+        again, default is one day.
+
+    """
+
+    def __init__(self, url='http://api-dev.augmento.ai/v0.1/',
+                 logging_level='WARNING', max_retries=5, backoff=1.,
+                 timeout=10., limit_per_host=10, topics_path=None,
+                 topics_ttl=86400.):
+        """ Initialize object. """
+        self.url = url
+        self.logger = logging.getLogger('get_augmento_data.' + __name__)
+        self.logger.setLevel(logging_level)
+        self.logger.debug('Starting async augmento client')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pool = _ConnectionPool(limit_per_host)
+        self.topics_path = topics_path
+        self.topics_ttl = topics_ttl
+        self._topics = None
+        self._topics_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Close the pooled connections, unbinding the client from its
+        event loop. """
+        self.pool.close()
+        self._topics_lock = None
+
+    async def send_request(self, method, **params):
+        """ Send a request to Augmento REST public API.
+
+        Parameters
+        ----------
+        method : str
+            Name of the relevent request.
+        **params : dict
+            Relevent parameters, cf augemento documentation [1]_.
+
+        Returns
+        -------
+        dict
+            Relevant data.
+
+        Raises
+        ------
+        OSError, asyncio.TimeoutError or json.JSONDecodeError
+            If the request still fails after `max_retries` retries.
+        HTTPStatusError
+            If the request fails with a client error (4xx other than 429) or
+            too many redirects, or with a server error after `max_retries`
+            retries.
+        RuntimeError
+            If the client is used from another event loop than its own.
+
+        References
+        ----------
+        .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
+
+        """
+        self.logger.debug(f'{method} request with {params} parameters.')
+
+        url = self.url + method
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+
+        # Retry connection errors, timeouts, invalid JSON, rate limits and
+        # server errors, with an exponential backoff, until the budget is
+        # spent
+        for i in range(self.max_retries + 1):
+            try:
+                status, body = await self.pool.get(url, self.timeout)
+
+                if status != 200:
+                    raise HTTPStatusError(status)
+
+                return json.loads(body)
+
+            except json.decoder.JSONDecodeError as e:
+                self.logger.error('JSON error.')
+                error = e
+
+            except HTTPStatusError as e:
+                if e.status < 500 and e.status != 429:
+                    raise
+
+                self.logger.error(str(e))
+                error = e
+
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    ValueError) as e:
+                self.logger.error('HTTP error {}.'.format(type(e)))
+                error = e
+
+            if i < self.max_retries:
+                await asyncio.sleep(self.backoff * 2 ** i)
+
+        self.logger.error('Request failed after {} retries.'.format(
+            self.max_retries
+        ))
+
+        raise error
+
+    async def get_data(self, source, coin, bin_size, start, end, start_ptr=0,
+                       count_ptr=1000):
+        """ Request data to Augmento REST public API.
+
+        Parameters
+        ----------
+        source : str, {'bitcointalk', 'reddit', 'twitter'}
+            Source of data.
+        coin : str
+            Name of a crypto-currency, cf augemento documentation [1]_.
+        bin_size : str, {'1H', '24H'}
+            Time between two observations.
+        start, end : str, int or datetime
+            Starting date and ending date. If string must be ISO 8601 format
+            such that ('%Y-%m-%dT%H:%M:%SZ'), or if integer must be UTC
+            timestamp, else can be a datetime object.
+        start_ptr : int, optional
+            Default is 0.
+        count_ptr : int, optional
+            Number of observation.
+
+        Returns
+        -------
+        list of list
+            Relevant data from `date_0` to `date_T` as
+            `[[x_1, ..., date_0, ts_0], ..., [x_1, ..., date_T, ts_T]]`.
+
+        References
+        ----------
+        .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
+
+        """
+        data = await self._request_data(source, coin, bin_size, start, end,
+                                        start_ptr=start_ptr,
+                                        count_ptr=count_ptr)
+
+        return [[*x['counts'], x['datetime'], x['t_epoch']] for x in data]
+
+    async def _request_data(self, source, coin, bin_size, start, end,
+                            start_ptr=0, count_ptr=1000):
+        # Request the raw records
+        start = intel_date(start)
+        end = intel_date(end)
+
+        return await self.send_request(
+            'events/aggregated', source=source, coin=coin, bin_size=bin_size,
+            start_datetime=start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            end_datetime=end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            start_ptr=start_ptr, count_ptr=count_ptr
+        )
+
+    async def _get_block(self, source, coin, bin_size, start, end,
+                         start_ptr=0, count_ptr=1000):
+        # Request data as typed columns, counts (rows x topics), dates and
+        # timestamps
+        data = await self._request_data(source, coin, bin_size, start, end,
+                                        start_ptr=start_ptr,
+                                        count_ptr=count_ptr)
+
+        return _to_block(data)
+
+    async def get_dataframe(self, source, coin, bin_size, start, end):
+        """ Request data to Augmento REST public API.
+
+        Parameters
+        ----------
+        source : str, {'bitcointalk', 'reddit', 'twitter'}
+            Source of data.
+        coin : str
+            Name of a crypto-currency, cf augemento documentation [1]_.
+        bin_size : str, {'1H', '24H'}
+            Time between two observations.
+        start, end : str, int or datetime
+            Starting date and ending date. If string must be ISO 8601 format
+            such that ('%Y-%m-%dT%H:%M:%SZ'), or if integer must be UTC
+            timestamp, else can be a datetime object.
+            Warning : `end` and `start` must have less than 1000 observations
+            between.
+
+        Returns
+        -------
+        pd.DataFrame
+            Relevant dataframe.
+
+        References
+        ----------
+        .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
+
+        """
+        block = await self._get_block(
+            source=source, coin=coin, bin_size=bin_size, start=start, end=end
+        )
+
+        return _to_dataframe(*block, await self.get_topics())
+
+    async def get_database(self, source, coin, bin_size, start, end,
+                           progress=None):
+        """ Merge several data request to Augmento REST public API.
+
+        Pages of 1000 observations are requested concurrently (up to the
+        client's `limit_per_host`), and merged in order.
+
+        Parameters
+        ----------
+        source : str, {'bitcointalk', 'reddit', 'twitter'}
+            Source of data.
+        coin : str
+            Name of a crypto-currency, cf augemento documentation [1]_.
+        bin_size : str, {'1H', '24H'}
+            Time between two observations.
+        start, end : str, int or datetime
+            Starting date and ending date. If string must be ISO 8601 format
+            such that ('%Y-%m-%dT%H:%M:%SZ'), or if integer must be UTC
+            timestamp, else can be a datetime object.
+        progress : callable, optional
+            Called as `progress(n_done, n_pages)` each time a page is
+            downloaded.
+
+        Returns
+        -------
+        pd.DataFrame
+            Relevant dataframe.
+
+        References
+        ----------
+        .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
+
+        """
+        start = intel_date(start)
+        end = intel_date(end)
+
+        start_ptrs = _page_pointers(bin_size, start, end)
+        n_done = 0
+
+        async def get_page(ptr):
+            nonlocal n_done
+            page = await self._get_block(source, coin, bin_size, start=start,
+                                         end=end, start_ptr=ptr)
+            n_done += 1
+
+            if progress is not None:
+                progress(n_done, len(start_ptrs))
+
+            return page
+
+        # Concurrent download, merged in order (cancelling the other pages
+        # if one fails)
+        tasks = [asyncio.ensure_future(get_page(ptr)) for ptr in start_ptrs]
+
+        try:
+            pages = await asyncio.gather(*tasks)
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return _to_dataframe(*_merge_blocks(pages), await self.get_topics())
+
+    async def get_topics(self):
+        """ Request the topic names, cached for the lifetime of the client
+        (and in `topics_path` if set).
+
+        Returns
+        -------
+        dict
+            Topic names by index (as str).
+
+        """
+        if self._topics_lock is None:
+            self._topics_lock = asyncio.Lock()
+
+        async with self._topics_lock:
+            if self._topics is None:
+                topics = _read_topics_cache(self.topics_path, self.topics_ttl)
+
+                if topics is None:
+                    topics = await self.send_request('topics')
+                    _write_topics_cache(self.topics_path, topics)
+
+                self._topics = topics
+
+        return self._topics
+
+
+class HTTPStatusError(Exception):
+    """ Request answered with an error status. """
+
+    def __init__(self, status):
+        super().__init__('HTTP error {}.'.format(status))
+        self.status = status
+
+
+class _ConnectionPool:
+    # Keep-alive HTTP/1.1 connections by host, with a limit of concurrent
+    # requests per host, bound to the event loop they are first used on
+
+    _REDIRECTS = (301, 302, 303, 307, 308)
+
+    def __init__(self, limit_per_host=10, max_redirects=10):
+        self.limit_per_host = limit_per_host
+        self.max_redirects = max_redirects
+        self.idle = {}
+        self.semaphores = {}
+        self.loop = None
+
+    def close(self):
+        # The connections went with the loop if it is closed already
+        if self.loop is not None and not self.loop.is_closed():
+            for connections in self.idle.values():
+                for reader, writer in connections:
+                    writer.close()
+
+        self.idle = {}
+        self.semaphores = {}
+        self.loop = None
+
+    async def get(self, url, timeout=None):
+        # GET the url, following redirects, returning the status and body
+        loop = asyncio.get_running_loop()
+
+        if self.loop is None:
+            self.loop = loop
+
+        elif self.loop is not loop:
+            raise RuntimeError('Client used from another event loop than its '
+                               'own, close it first.')
+
+        for i in range(self.max_redirects + 1):
+            status, headers, body = await self._get(url, timeout)
+
+            if status not in self._REDIRECTS or 'location' not in headers:
+                return status, body
+
+            url = urllib.parse.urljoin(url, headers['location'])
+
+        raise HTTPStatusError(status)
+
+    async def _get(self, url, timeout):
+        # GET the url, the timeout only starts once a slot for the host is
+        # free, so waiting behind other requests doesn't count
+        url = urllib.parse.urlsplit(url)
+        https = url.scheme == 'https'
+        port = url.port or (443 if https else 80)
+        key = (url.hostname, port, https)
+        path = url.path + ('?' + url.query if url.query else '')
+
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(self.limit_per_host)
+
+        async with self.semaphores[key]:
+            return await asyncio.wait_for(
+                self._send(key, url, path, https, port), timeout
+            )
+
+    async def _send(self, key, url, path, https, port):
+        # An idle connection may have been closed by the server, in which
+        # case try again on a new one
+        while self.idle.get(key):
+            reader, writer = self.idle[key].pop()
+
+            try:
+                return await self._request(key, reader, writer, url, path)
+
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                pass
+
+        context = ssl.create_default_context() if https else None
+        reader, writer = await asyncio.open_connection(
+            url.hostname, port, ssl=context
+        )
+
+        return await self._request(key, reader, writer, url, path)
+
+    async def _request(self, key, reader, writer, url, path):
+        # Send the request and read the answer, returning the connection to
+        # the pool if it can be reused (never if cancelled or failed)
+        reusable = False
+
+        try:
+            writer.write((
+                'GET {} HTTP/1.1\r\nHost: {}\r\nAccept: application/json\r\n'
+                'Connection: keep-alive\r\n\r\n'
+            ).format(path, url.netloc).encode('latin-1'))
+            await writer.drain()
+
+            status, headers = await _read_head(reader)
+            body = await _read_body(reader, headers)
+            reusable = headers.get('connection', '').lower() != 'close'
+
+            return status, headers, body
+
+        finally:
+            if reusable:
+                self.idle.setdefault(key, []).append((reader, writer))
+
+            else:
+                writer.close()
+
+
+async def _read_head(reader):
+    # Read the status line and the headers
+    line = await reader.readuntil(b'\r\n')
+    parts = line.decode('latin-1').split(None, 2)
+
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ValueError('Invalid status line {!r}.'.format(line))
+
+    headers = {}
+
+    while True:
+        line = await reader.readuntil(b'\r\n')
+
+        if line == b'\r\n':
+            break
+
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    return int(parts[1]), headers
+
+
+async def _read_body(reader, headers):
+    # Read a body of known length, chunked, or up to the end of the stream
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+
+            if size == 0:
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+
+                return b''.join(chunks)
+
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    headers['connection'] = 'close'
+
+    return await reader.read()
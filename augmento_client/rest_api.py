@@ -24,9 +24,13 @@ import logging
 import json
 import time
 import datetime
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # External packages
 import requests
+import numpy as np
 import pandas as pd
 
 # Local packages
@@ -47,18 +51,61 @@ class RequestAugmento:
         Return aggregated event data in list of list.
     get_dataframe(source, coin, bin_size, start, end)
         Return aggregated event in a dataframe.
-    get_database(source, coin, bin_size, start, end)
+    get_database(source, coin, bin_size, start, end, n_workers=None,
+                 progress=None)
         Merge several requests of aggregated event in a dataframe.
+    get_topics()
+        Return the topic names by index, cached.
+
+    Parameters
+    ----------
+    url : str, optional
+        Url of the API.
+    logging_level : str, optional
+        Default is 'WARNING'.
+    max_retries : int, optional
+        Number of times a failed request is retried before raising, default
+        is 5.
+    backoff : float, optional
+        Seconds to wait before the first retry, doubled for each next retry.
+        Default is 1.
+    timeout : float, optional
+        Seconds to wait for an answer, default is 10.
+    n_workers : int, optional
+        Number of pages downloaded concurrently by `get_database`, default
+        is 4.
+    requests_per_second : float, optional
+        Maximum rate of requests, shared by all workers. Default is None (no
+        limit).
+    topics_path : str, optional
+        JSON file to cache the topics in, between clients. Default is None,
+        the topics are only cached for the lifetime of the client.
+    topics_ttl : float, optional
+        Seconds before the topics cached in `topics_path` are requested
+        again, default is one day.
 
     """
 
     def __init__(self, url='http://api-dev.augmento.ai/v0.1/',
-                 logging_level='WARNING'):
+                 logging_level='WARNING', max_retries=5, backoff=1.,
+                 timeout=10., n_workers=4, requests_per_second=None,
+                 topics_path=None, topics_ttl=86400.):
         """ Initialize object. """
         self.url = url
         self.logger = logging.getLogger('get_augmento_data.' + __name__)
         self.logger.setLevel(logging_level)
         self.logger.debug('Starting augmento client')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.n_workers = n_workers
+        self.rate_limiter = _RateLimiter(requests_per_second)
+        self.session = requests.Session()
+        self._mount_adapter(n_workers)
+        self.topics_path = topics_path
+        self.topics_ttl = topics_ttl
+        self._topics = None
+        self._topics_lock = threading.Lock()
 
     def send_request(self, method, **params):
         """ Send a request to Augmento REST public API.
@@ -75,6 +122,12 @@ class RequestAugmento:
         dict
             Relevant data.
 
+        Raises
+        ------
+        requests.exceptions.RequestException or json.JSONDecodeError
+            If the request still fails after `max_retries` retries, or fails
+            with a client error (4xx other than 429).
+
         References
         ----------
         .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
@@ -82,30 +135,51 @@ class RequestAugmento:
         """
         self.logger.debug(f'{method} request with {params} parameters.')
 
-        # Try and catch some exceptions
-        try:
-            ans = requests.get(self.url + method, params)
+        # Retry connection errors, invalid JSON, rate limits and server
+        # errors, with an exponential backoff, until the budget is spent
+        for i in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+
+            try:
+                ans = self.session.get(self.url + method, params=params,
+                                       timeout=self.timeout)
+
+                if ans.status_code == 429 or ans.status_code >= 500:
+                    raise requests.exceptions.HTTPError(
+                        'HTTP error {}.'.format(ans.status_code),
+                        response=ans
+                    )
+
+                ans.raise_for_status()
 
-            return json.loads(ans.text)
+                return json.loads(ans.text)
 
-        except json.decoder.JSONDecodeError:
-            self.logger.error('JSON error.')
-            time.sleep(1)
+            except json.decoder.JSONDecodeError as e:
+                self.logger.error('JSON error.')
+                error = e
 
-            return self.send_request(method, **params)
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code < 500 \
+                        and e.response.status_code != 429:
+                    raise
 
-        except requests.exceptions.ConnectionError:
-            self.logger.error('HTTP error.')
-            time.sleep(1)
+                self.logger.error(str(e))
+                error = e
 
-            return self.send_request(method, **params)
+            except requests.exceptions.RequestException as e:
+                # Connection errors, timeouts, and bodies cut or garbled in
+                # transit
+                self.logger.error('HTTP error {}.'.format(type(e)))
+                error = e
 
-        except Exception as e:
-            self.logger.error('Unknown error {}.'.format(type(e)),
-                              exc_info=True)
-            time.sleep(1)
+            if i < self.max_retries:
+                time.sleep(self.backoff * 2 ** i)
 
-            return self.send_request(method, **params)
+        self.logger.error('Request failed after {} retries.'.format(
+            self.max_retries
+        ))
+
+        raise error
 
     def get_data(self, source, coin, bin_size, start, end, start_ptr=0,
                  count_ptr=1000):
@@ -139,18 +213,32 @@ class RequestAugmento:
         .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
 
         """
+        data = self._request_data(source, coin, bin_size, start, end,
+                                  start_ptr=start_ptr, count_ptr=count_ptr)
+
+        return [[*x['counts'], x['datetime'], x['t_epoch']] for x in data]
+
+    def _request_data(self, source, coin, bin_size, start, end, start_ptr=0,
+                      count_ptr=1000):
+        # Request the raw records
         start = intel_date(start)
         end = intel_date(end)
 
-        # Request data
-        data = self.send_request(
+        return self.send_request(
             'events/aggregated', source=source, coin=coin, bin_size=bin_size,
             start_datetime=start.strftime('%Y-%m-%dT%H:%M:%SZ'),
             end_datetime=end.strftime('%Y-%m-%dT%H:%M:%SZ'),
             start_ptr=start_ptr, count_ptr=count_ptr
         )
 
-        return [[*x['counts'], x['datetime'], x['t_epoch']] for x in data]
+    def _get_block(self, source, coin, bin_size, start, end, start_ptr=0,
+                   count_ptr=1000):
+        # Request data as typed columns, counts (rows x topics), dates and
+        # timestamps
+        data = self._request_data(source, coin, bin_size, start, end,
+                                  start_ptr=start_ptr, count_ptr=count_ptr)
+
+        return _to_block(data)
 
     def get_dataframe(self, source, coin, bin_size, start, end):
         """ Request data to Augmento REST public API.
@@ -182,15 +270,19 @@ class RequestAugmento:
 
         """
         # Request data
-        data = self.get_data(
+        block = self._get_block(
             source=source, coin=coin, bin_size=bin_size, start=start, end=end
         )
 
-        return self._set_dataframe(data)
+        return self._set_dataframe(*block)
 
-    def get_database(self, source, coin, bin_size, start, end):
+    def get_database(self, source, coin, bin_size, start, end, n_workers=None,
+                     progress=None):
         """ Merge several data request to Augmento REST public API.
 
+        Pages of 1000 observations are downloaded concurrently, under the
+        rate limit of the client, and merged in order.
+
         Parameters
         ----------
         source : str, {'bitcointalk', 'reddit', 'twitter'}
@@ -203,6 +295,12 @@ class RequestAugmento:
             Starting date and ending date. If string must be ISO 8601 format
             such that ('%Y-%m-%dT%H:%M:%SZ'), or if integer must be UTC
             timestamp, else can be a datetime object.
+        n_workers : int, optional
+            Number of pages downloaded concurrently, default is the client's
+            `n_workers`.
+        progress : callable, optional
+            Called as `progress(n_done, n_pages)` each time a page is
+            downloaded.
 
         Returns
         -------
@@ -214,49 +312,178 @@ class RequestAugmento:
         .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
 
         """
-        if bin_size == '24H':
-            nb_obs_per_day = 1
-        elif bin_size == '1H':
-            nb_obs_per_day = 24
-        else:
-            raise ValueError('Unknown bin size')
-
         start = intel_date(start)
         end = intel_date(end)
 
-        dt = (end - start).days * nb_obs_per_day
+        start_ptrs = _page_pointers(bin_size, start, end)
+        pages = [None] * len(start_ptrs)
+
+        # Concurrent download
+        n_workers = self.n_workers if n_workers is None else n_workers
+        if n_workers > self._pool_maxsize:
+            self._mount_adapter(n_workers)
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(
+                self._get_block, source, coin, bin_size, start=start, end=end,
+                start_ptr=ptr,
+            ): i for i, ptr in enumerate(start_ptrs)}
+
+            for n_done, future in enumerate(as_completed(futures), 1):
+                pages[futures[future]] = future.result()
+
+                if progress is not None:
+                    progress(n_done, len(pages))
+
+        # Merge pages in order
+        return self._set_dataframe(*_merge_blocks(pages))
+
+    def get_topics(self):
+        """ Request the topic names, cached for the lifetime of the client
+        (and in `topics_path` if set).
+
+        Returns
+        -------
+        dict
+            Topic names by index (as str).
+
+        """
+        with self._topics_lock:
+            if self._topics is None:
+                self._topics = self._load_topics()
+
+        return self._topics
+
+    def _mount_adapter(self, n_workers):
+        # Keep one connection per worker alive, so pages downloaded
+        # concurrently don't open a new connection each
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=n_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pool_maxsize = n_workers
+
+    def _load_topics(self):
+        # Read the topics from disk if they are fresh enough, else request
+        # and save them
+        topics = _read_topics_cache(self.topics_path, self.topics_ttl)
+
+        if topics is None:
+            topics = self.send_request('topics')
+            _write_topics_cache(self.topics_path, topics)
+
+        return topics
+
+    def _set_dataframe(self, counts, dates, ts):
+        return _to_dataframe(counts, dates, ts, self.get_topics())
+
+
+def _to_dataframe(counts, dates, ts, topics):
+    # Set topic names
+    columns = [topics.get(str(i), i) for i in range(counts.shape[1])]
+
+    # Set dataframe from columns
+    df = pd.DataFrame(counts, columns=columns,
+                      index=pd.Index(dates, name='date'))
+    df['TS'] = ts
+
+    return df
+
+
+def _merge_blocks(pages):
+    # Concatenate blocks of counts, dates and timestamps in order
+    pages = [page for page in pages if page[2].size > 0]
+
+    if not pages:
+        return _to_block([])
+
+    return tuple(np.concatenate([page[i] for page in pages]) for i in range(3))
+
+
+def _page_pointers(bin_size, start, end):
+    # Start pointers of the pages of 1000 observations between two dates
+    if bin_size == '24H':
+        nb_obs_per_day = 1
+    elif bin_size == '1H':
+        nb_obs_per_day = 24
+    else:
+        raise ValueError('Unknown bin size')
+
+    dt = (intel_date(end) - intel_date(start)).days * nb_obs_per_day
+
+    return range(0, dt, 1000)
+
+
+def _read_topics_cache(path, ttl):
+    # Topics cached on disk, or None if missing or older than ttl seconds
+    if path is None or not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        cached = json.load(f)
+
+    if time.time() - cached['t_cached'] >= ttl:
+        return None
+
+    return cached['topics']
+
+
+def _write_topics_cache(path, topics):
+    # Write the topics to a temporary file then rename it
+    if path is None:
+        return
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    with open(tmp_path, 'w') as f:
+        json.dump({'t_cached': time.time(), 'topics': topics}, f)
+
+    os.replace(tmp_path, path)
+
+
+def _to_block(data):
+    # Convert records to counts (rows x topics), dates and timestamps arrays
+    n_topics = len(data[0]['counts']) if data else 0
+    counts = np.empty((len(data), n_topics), dtype=np.int64)
+    dates = np.empty(len(data), dtype=object)
+    ts = np.empty(len(data), dtype=np.int64)
+
+    for i, x in enumerate(data):
+        counts[i] = x['counts']
+        dates[i] = x['datetime']
+        ts[i] = x['t_epoch']
+
+    return counts, dates, ts
+
+
+class _RateLimiter:
+    """ Thread safe token bucket, allowing `rate` requests per second. """
 
-        data = []
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.tokens = 1.
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
 
-        # Iterative download
-        for i in range(0, dt, 1000):
-            # Request data
-            data += self.get_data(
-                source, coin, bin_size, start=start, end=end, start_ptr=i,
-            )
-            pct = i / ((dt - 1) // 1000 * 1000)
-            print('Downloaded {:7.2%} [{}{}] '.format(
-                pct, '=' * int(49 * pct),
-                '>' * (1 - int(pct)) + ' ' * int(49 * (1 - pct))
-            ), end='\r')
+    def acquire(self):
+        """ Wait until a request is allowed. """
+        if self.rate is None:
+            return
 
-            # Sleep
-            time.sleep(.1)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens += (now - self.last) * self.rate
+                self.tokens = min(1., self.tokens)
+                self.last = now
 
-        return self._set_dataframe(data)
+                if self.tokens >= 1.:
+                    self.tokens -= 1.
 
-    def _set_dataframe(self, data):
-        # Request topic names
-        topics = self.send_request('topics')
+                    return
 
-        # Set dataframe
-        df = pd.DataFrame(data)
-        df = df.rename(columns={
-            **{93: 'date', 94: 'TS'},
-            **{int(k): a for k, a in topics.items()}
-        })
+                wait = (1. - self.tokens) / self.rate
 
-        return df.set_index('date')
+            time.sleep(wait)
 
 
 def intel_date(date, form='%Y-%m-%dT%H:%M:%SZ'):
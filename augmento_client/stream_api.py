@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" Streaming client connector to Augmento websocket API.
+
+The client keeps a websocket connection open and yields the aggregated
+event bars as they are pushed, as an async iterator. Lost connections are
+reopened, resuming after the last bar received, and bars are buffered
+with backpressure: when the buffer is full, the socket isn't read until
+the consumer catches up.
+
+Examples
+--------
+>>> async def main():
+...     async with StreamAugmento(source='twitter', coin='bitcoin',
+...                               url='ws://127.0.0.1:8765/v0.1') as stream:
+...         async for bar in stream:
+...             print(bar['datetime'], bar['latency'])
+>>> asyncio.run(main())  # doctest: +SKIP
+
+"""
+
+# Built-in packages
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import logging
+import os
+import ssl
+import struct
+import time
+import urllib.parse
+
+# External packages
+
+# Local packages
+from augmento_client.async_rest_api import _read_head
+
+__all__ = ['StreamAugmento']
+
+_BIN_SECONDS = {'1H': 3600, '24H': 86400}
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class StreamAugmento:
+    """ Class to stream live Augmento bars from the websocket API.
+
+    Iterate over the object (with `async for`) to get the bars, as dict
+    with the keys of the REST API ('t_epoch', 'datetime' and 'counts'),
+    plus 'latency', the seconds between the bar being sent (or closed, if
+    the server doesn't stamp its messages) and it being handed over.
+
+    Augmento doesn't document a websocket API, so the protocol is the one
+    the stand-in server of the tests speaks: the client sends one JSON
+    subscription message ({'type': 'subscribe', 'source', 'coin',
+    'bin_size' and optionally 'since'}), then the server pushes the bars
+    as JSON text messages, one bar or a list of bars each. Any other
+    message is skipped.
+
+    Methods
+    -------
+    connect()
+        Open the connection, and start buffering bars.
+    close()
+        Close the connection.
+
+    Parameters
+    ----------
+    source : str, {'bitcointalk', 'reddit', 'twitter'}
+        Source of data.
+    coin : str
+        Name of a crypto-currency, cf augemento documentation [1]_.
+    url : str
+        Url of the websocket API, e.g. 'ws://127.0.0.1:8765/v0.1'.
+    bin_size : str, {'1H', '24H'}, optional
+        Time between two observations, default is '1H'.
+    since : int, optional
+        Timestamp of the last bar already known, only the bars after it are
+        streamed. Default is None, only the new bars are streamed.
+    buffer_size : int, optional
+        Maximum number of bars received but not yet consumed, default is
+        1000.
+    max_retries : int, optional
+        Number of consecutive failed connections before raising, default is
+        None, never give up.
+    backoff : float, optional
+        Seconds to wait before reconnecting the first time, doubled for each
+        next failure up to `max_backoff`. Default is 1.
+    max_backoff : float, optional
+        Default is 60.
+    timeout : float, optional
+        Seconds to wait for the connection to open, default is 10.
+    n_latencies : int, optional
+        Number of the last latencies kept in `latencies`, default is 1000.
+    logging_level : str, optional
+        Default is 'WARNING'.
+
+    Attributes
+    ----------
+    last_t_epoch : int
+        Timestamp of the last bar received, reconnections resume after it.
+    latencies : collections.deque
+        Latencies of the last bars handed over.
+    n_reconnections : int
+        Number of times the connection was reopened.
+
+    References
+    ----------
+    .. [1] http://api-dev.augmento.ai/v0.1/documentation#introduction
+
+    """
+
+    def __init__(self, source, coin, url, bin_size='1H', since=None,
+                 buffer_size=1000, max_retries=None, backoff=1.,
+                 max_backoff=60., timeout=10., n_latencies=1000,
+                 logging_level='WARNING'):
+        """ Initialize object. """
+        if bin_size not in _BIN_SECONDS:
+            raise ValueError('Unknown bin size {}.'.format(bin_size))
+
+        self.source = source
+        self.coin = coin
+        self.bin_size = bin_size
+        self.url = url
+        self.last_t_epoch = since
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.latencies = collections.deque(maxlen=n_latencies)
+        self.n_reconnections = 0
+        self.logger = logging.getLogger('get_augmento_data.' + __name__)
+        self.logger.setLevel(logging_level)
+        self._queue = None
+        self._task = None
+
+    async def __aenter__(self):
+        await self.connect()
+
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._task is None:
+            await self.connect()
+
+        # Wait for a bar, or for the connection to fail for good
+        get = asyncio.ensure_future(self._queue.get())
+        await asyncio.wait([get, self._task],
+                           return_when=asyncio.FIRST_COMPLETED)
+
+        if not get.done():
+            get.cancel()
+            if self._task.cancelled():
+                raise StopAsyncIteration
+
+            self._task.result()
+
+        bar = get.result()
+        t_sent = bar.pop('t_sent', None)
+        if t_sent is None:
+            t_sent = bar['t_epoch'] + _BIN_SECONDS[self.bin_size]
+
+        bar['latency'] = time.time() - t_sent
+        self.latencies.append(bar['latency'])
+
+        return bar
+
+    async def connect(self):
+        """ Open the connection, and start buffering bars in background. """
+        if self._task is not None:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        """ Close the connection. """
+        if self._task is None:
+            return
+
+        self._task.cancel()
+
+        try:
+            await self._task
+
+        except (asyncio.CancelledError, ConnectionClosed):
+            pass
+
+        finally:
+            self._task = None
+            self._queue = None
+
+    async def _run(self):
+        # Read bars into the queue, reconnecting (with an exponential backoff
+        # reset by each successful connection) when the connection is lost
+        n_failures = 0
+
+        while True:
+            try:
+                ws = await asyncio.wait_for(_WebSocket.connect(self.url),
+                                            self.timeout)
+
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    ValueError) as e:
+                self.logger.error('Connection error {}.'.format(type(e)))
+                ws = None
+
+            if ws is not None:
+                try:
+                    await self._subscribe(ws)
+                    n_failures = 0
+
+                    while True:
+                        await self._put(await ws.recv())
+
+                except (OSError, asyncio.IncompleteReadError, ValueError,
+                        ConnectionClosed) as e:
+                    self.logger.error('Connection lost {}.'.format(type(e)))
+
+                finally:
+                    ws.close()
+
+            n_failures += 1
+            if self.max_retries is not None and n_failures > self.max_retries:
+                raise ConnectionClosed(
+                    'Connection failed {} times.'.format(n_failures)
+                )
+
+            await asyncio.sleep(min(
+                self.backoff * 2 ** (n_failures - 1), self.max_backoff
+            ))
+            self.n_reconnections += 1
+
+    async def _subscribe(self, ws):
+        # Resume after the last bar received
+        msg = {'type': 'subscribe', 'source': self.source, 'coin': self.coin,
+               'bin_size': self.bin_size}
+        if self.last_t_epoch is not None:
+            msg['since'] = self.last_t_epoch
+
+        self.logger.debug(f'Subscribing with {msg}.')
+        await ws.send(json.dumps(msg))
+
+    async def _put(self, message):
+        # Buffer the new bars of a message (one bar or a list of bars),
+        # blocking while the buffer is full, and skip anything else the
+        # server sends (acknowledgements, heartbeats, errors, plain text)
+        try:
+            bars = json.loads(message)
+
+        except ValueError:
+            self.logger.debug(f'Skipping {message!r}, not JSON.')
+            return
+
+        if not isinstance(bars, list):
+            bars = [bars]
+
+        for bar in bars:
+            if not isinstance(bar, dict) or 't_epoch' not in bar:
+                self.logger.debug(f'Skipping {bar}, not a bar.')
+                continue
+
+            if self.last_t_epoch is not None and \
+                    bar['t_epoch'] <= self.last_t_epoch:
+                continue
+
+            await self._queue.put(bar)
+            self.last_t_epoch = bar['t_epoch']
+
+
+class ConnectionClosed(Exception):
+    """ Websocket connection closed. """
+
+
+class _WebSocket:
+    # Minimal websocket client (RFC 6455) over asyncio streams, text
+    # messages only
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, url):
+        url = urllib.parse.urlsplit(url)
+        secure = url.scheme == 'wss'
+        port = url.port or (443 if secure else 80)
+        context = ssl.create_default_context() if secure else None
+        reader, writer = await asyncio.open_connection(url.hostname, port,
+                                                       ssl=context)
+
+        try:
+            key = base64.b64encode(os.urandom(16)).decode('ascii')
+            writer.write((
+                'GET {} HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\n'
+                'Connection: Upgrade\r\nSec-WebSocket-Key: {}\r\n'
+                'Sec-WebSocket-Version: 13\r\n\r\n'
+            ).format(
+                (url.path or '/') + ('?' + url.query if url.query else ''),
+                url.netloc, key
+            ).encode('latin-1'))
+            await writer.drain()
+
+            status, headers = await _read_head(reader)
+            accept = base64.b64encode(hashlib.sha1(
+                (key + _WS_GUID).encode('ascii')
+            ).digest()).decode('ascii')
+
+            if status != 101 or headers.get('sec-websocket-accept') != accept:
+                raise ValueError('Websocket handshake failed ({}).'.format(
+                    status
+                ))
+
+        except BaseException:
+            writer.close()
+            raise
+
+        return cls(reader, writer)
+
+    async def send(self, text, opcode=0x1):
+        # Client frames must be masked
+        payload = text.encode('utf-8') if isinstance(text, str) else text
+        mask = os.urandom(4)
+        n = len(payload)
+
+        if n < 126:
+            head = struct.pack('!BB', 0x80 | opcode, 0x80 | n)
+
+        elif n < 65536:
+            head = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, n)
+
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, n)
+
+        self.writer.write(head + mask + _apply_mask(payload, mask))
+        await self.writer.drain()
+
+    async def recv(self):
+        # Next text message, answering pings on the way
+        fragments = []
+
+        while True:
+            opcode, fin, payload = await self._read_frame()
+
+            if opcode == 0x8:
+                raise ConnectionClosed('Closed by the server.')
+
+            elif opcode == 0x9:
+                await self.send(payload, opcode=0xA)
+
+            elif opcode in (0x0, 0x1, 0x2):
+                fragments.append(payload)
+                if fin:
+                    return b''.join(fragments).decode('utf-8')
+
+    async def _read_frame(self):
+        b0, b1 = await self.reader.readexactly(2)
+        n = b1 & 0x7F
+
+        if n == 126:
+            n, = struct.unpack('!H', await self.reader.readexactly(2))
+
+        elif n == 127:
+            n, = struct.unpack('!Q', await self.reader.readexactly(8))
+
+        mask = await self.reader.readexactly(4) if b1 & 0x80 else None
+        payload = await self.reader.readexactly(n)
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+
+        return b0 & 0x0F, bool(b0 & 0x80), payload
+
+    def close(self):
+        self.writer.close()
+
+
+def _apply_mask(payload, mask):
+    # XOR the payload with the repeated 4 bytes mask
+    n = len(payload)
+    mask = int.from_bytes((mask * (n // 4 + 1))[:n], 'big')
+
+    return (int.from_bytes(payload, 'big') ^ mask).to_bytes(n, 'big')
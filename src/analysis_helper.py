@@ -12,19 +12,37 @@ def nb_safe_divide(a, b):
 			c[i] = a[i] / b[i]
 	return c
 
+@nb.jit("UniTuple(f8, 2)(f8, f8, f8)", nopython=True, nogil=True, cache=True)
+def nb_compensated_add(total, comp, value):
+	# add value to a running total, carrying the rounding error in comp
+	# (Neumaier summation), so long running sums don't drift away from
+	# a fresh sum over the same elements
+	new_total = total + value
+	if abs(total) >= abs(value):
+		comp += (total - new_total) + value
+	else:
+		comp += (value - new_total) + total
+	return new_total, comp
+
 @nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, parallel=False)
 def nb_causal_rolling_average(arr, window_size):
 	
 	# create an output array
 	out_arr = np.zeros(arr.shape[0])
 	
-	# create an array from the input array, with added space for the rolling window
-	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	# the window starts out filled with copies of the first input element,
+	# so seed the running sum with them
+	win_sum = 0.0
+	win_comp = 0.0
+	for i in range(window_size):
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, arr[0])
 	
-	# for each output element, find the mean of the last few input elements
-	#for i in nb.prange(out_arr.shape[0]):
+	# for each output element, slide the window along by one element by adding
+	# the newest input element and removing the oldest one (or a padding element)
 	for i in range(out_arr.shape[0]):
-		out_arr[i] = np.mean(new_arr[i : i + window_size])
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, arr[i])
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, -arr[max(i - window_size, 0)])
+		out_arr[i] = (win_sum + win_comp) / window_size
 	
 	return out_arr
 
@@ -34,17 +52,47 @@ def nb_causal_rolling_sd(arr, window_size):
 	# create an output array
 	out_arr = np.zeros(arr.shape[0])
 	
-	# create an array from the input array, with added space for the rolling window
-	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	# the window holds the previous window_size-1 input elements, so there
+	# is nothing to standardise against with a window size of 1 (the mean and
+	# std of an empty window are nan)
+	n_win = window_size - 1
+	if n_win < 1:
+		out_arr[:] = np.nan
+		return out_arr
 	
-	# for each output element, find the mean and std of the last few
-	# input elements, and standardise the input element by the mean and std of the window
-	#for i in nb.prange(out_arr.shape[0]):
+	# the window starts out filled with copies of the first input element,
+	# so it starts with that mean and no spread
+	win_mean = arr[0]
+	win_m2 = 0.0
+	
+	# track how many equal input elements (including the padding) end the window,
+	# so that constant windows give exactly zero spread, as a fresh std would
+	n_run = n_win
+	
+	# for each output element, standardise the input element by the mean and std
+	# of the window, then slide the window along with a Welford update
 	for i in range(out_arr.shape[0]):
-		num = new_arr[i+window_size-1] - np.mean(new_arr[i : i + window_size-1])
-		denom = np.std(new_arr[i : i + window_size-1])
+		if n_run >= n_win:
+			win_mean = arr[max(i - 1, 0)]
+			win_m2 = 0.0
+		elif win_m2 < 0.0:
+			win_m2 = 0.0
+		
+		num = arr[i] - win_mean
+		denom = np.sqrt(win_m2 / n_win)
 		if denom != 0.0:
 			out_arr[i] = num / denom
+		
+		x_in = arr[i]
+		x_out = arr[max(i - n_win, 0)]
+		old_mean = win_mean
+		win_mean = old_mean + (x_in - x_out) / n_win
+		win_m2 += (x_in - x_out) * (x_in - win_mean + x_out - old_mean)
+		
+		if x_in == arr[max(i - 1, 0)]:
+			n_run += 1
+		else:
+			n_run = 1
 	
 	return out_arr
 
@@ -78,17 +126,52 @@ def nb_causal_rolling_norm(arr, window_size):
 	# create an output array
 	out_arr = np.zeros(arr.shape[0])
 	
-	# create an array from the input array, with added space for the rolling window
-	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	# the window starts out filled with copies of the first input element,
+	# so seed the running sum with them
+	win_sum = 0.0
+	win_comp = 0.0
+	for i in range(window_size):
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, arr[0])
 	
-	# for each output element, find the mean and std of the last few
-	# input elements, and standardise the input element by the mean and std of the window
-	#for i in nb.prange(out_arr.shape[0]):
+	# keep monotonic queues of the indices of the window max and min (the padding
+	# equals the first input element, so it never needs a slot of its own)
+	max_queue = np.zeros(window_size, dtype=np.int64)
+	min_queue = np.zeros(window_size, dtype=np.int64)
+	max_head, max_tail = 0, 0
+	min_head, min_tail = 0, 0
+	
+	# for each output element, find the mean and the largest absolute deviation
+	# from the mean of the window, and normalise the input element by them
 	for i in range(out_arr.shape[0]):
-			num = new_arr[i+window_size-1] - np.mean(new_arr[i : i + window_size])
-			denom = np.max(np.abs(new_arr[i : i + window_size] - np.mean(new_arr[i : i + window_size])))
-			if denom != 0.0:
-					out_arr[i] = num / denom
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, arr[i])
+		win_sum, win_comp = nb_compensated_add(win_sum, win_comp, -arr[max(i - window_size, 0)])
+		win_mean = (win_sum + win_comp) / window_size
+		
+		if max_tail > max_head and max_queue[max_head % window_size] <= i - window_size:
+			max_head += 1
+		while max_tail > max_head and arr[max_queue[(max_tail - 1) % window_size]] <= arr[i]:
+			max_tail -= 1
+		max_queue[max_tail % window_size] = i
+		max_tail += 1
+		
+		if min_tail > min_head and min_queue[min_head % window_size] <= i - window_size:
+			min_head += 1
+		while min_tail > min_head and arr[min_queue[(min_tail - 1) % window_size]] >= arr[i]:
+			min_tail -= 1
+		min_queue[min_tail % window_size] = i
+		min_tail += 1
+		
+		win_max = arr[max_queue[max_head % window_size]]
+		win_min = arr[min_queue[min_head % window_size]]
+		
+		# a constant window has no spread, however the mean rounds
+		if win_max == win_min:
+			continue
+		
+		num = arr[i] - win_mean
+		denom = max(abs(win_max - win_mean), abs(win_min - win_mean))
+		if denom != 0.0:
+			out_arr[i] = num / denom
 	
 	return out_arr
 
@@ -127,23 +210,175 @@ def nb_causal_rolling_norm_rand(arr, window_size_rand, peturb):
 	
 	return out_arr
 
-@nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, parallel=False)
-def nb_causal_rolling_average(arr, window_size):
+@nb.jit("(f8[:])(f8[:])", nopython=True, nogil=True, cache=True)
+def nb_cumsum(arr):
+	# (compensated) cumulative sum with a leading zero,
+	# so the sum of the elements [a, b) of arr is cum_arr[b] - cum_arr[a]
+	cum_arr = np.zeros(arr.shape[0] + 1)
+	total = 0.0
+	comp = 0.0
+	for i in range(arr.shape[0]):
+		total, comp = nb_compensated_add(total, comp, arr[i])
+		cum_arr[i+1] = total + comp
+	return cum_arr
+
+@nb.jit("(i8[:])(f8[:])", nopython=True, nogil=True, cache=True)
+def nb_run_lengths(arr):
+	# the number of equal elements in a row ending at each element of arr
+	run_arr = np.ones(arr.shape[0], dtype=np.int64)
+	for i in range(1, arr.shape[0]):
+		if arr[i] == arr[i-1]:
+			run_arr[i] = run_arr[i-1] + 1
+	return run_arr
+
+@nb.jit("f8(f8, f8[:], i8, i8)", nopython=True, nogil=True, cache=True)
+def nb_padded_window_sum(pad_value, cum_arr, i_start, i_end):
+	# sum of the elements [i_start, i_end) of an array with cumulative sum cum_arr (see nb_cumsum),
+	# where negative indices are padding elements equal to pad_value (as in the causal kernels)
+	win_sum = cum_arr[max(i_end, 0)] - cum_arr[max(i_start, 0)]
+	if i_start < 0:
+		win_sum += (min(i_end, 0) - i_start) * pad_value
+	return win_sum
+
+@nb.jit("(f8[:])(f8[:], f8[:], i8, f8)", nopython=True, nogil=True, cache=True)
+def nb_causal_rolling_norm_rand_cumsum(arr, cum_arr, window_size_rand, peturb):
+	# one perturbed path of nb_causal_rolling_norm_rand, reading the window sums from the
+	# cumulative sum of arr (see nb_cumsum), so each output element is O(1)
+	# (draws from the random state of the calling thread, so seed it first for a reproducible path)
 	
 	# create an output array
 	out_arr = np.zeros(arr.shape[0])
 	
-	# create an array from the input array, with added space for the rolling window
-	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	window_size_std = peturb * np.float64(window_size_rand)
+	for i in range(out_arr.shape[0]):
+		
+		# the window ends at the current element, and can't reach back past the padding
+		# (a window drawn empty has no mean, as in nb_causal_rolling_norm_rand)
+		window_size = round(np.random.normal(window_size_rand, window_size_std))
+		if window_size < 1:
+			out_arr[i] = np.nan
+			continue
+		i_end = i + 1
+		i_start = max(i_end - window_size, 1 - window_size_rand)
+		
+		out_arr[i] = nb_padded_window_sum(arr[0], cum_arr, i_start, i_end) / (i_end - i_start)
+	
+	return out_arr
+
+@nb.jit("(f8[:])(f8[:], f8[:], f8[:], i8[:], i8)", nopython=True, nogil=True, cache=True)
+def nb_causal_rolling_sd_rand_cumsum(arr, cum_arr, cum_sq_arr, run_arr, window_size_rand):
+	# one perturbed path of nb_causal_rolling_sd_rand, reading the window sums from the cumulative
+	# sums of arr and arr ** 2 (see nb_cumsum) and the runs of equal elements (see nb_run_lengths)
+	# (arr should be centred on its mean first, to keep the variances accurate)
+	# (draws from the random state of the calling thread, so seed it first for a reproducible path)
+	
+	# create an output array
+	out_arr = np.zeros(arr.shape[0])
 	
-	# for each output element, find the mean of the last few input elements
-	#for i in nb.prange(out_arr.shape[0]):
 	for i in range(out_arr.shape[0]):
-		out_arr[i] = np.mean(new_arr[i : i + window_size])
+		
+		# standardise the current element by the mean and std of the previous window_size-1
+		# elements, where the window can't reach back past the padding
+		window_size = max(round(np.random.normal(window_size_rand, 1.0)), 2)
+		i_end = i
+		i_start = max(i_end - (window_size - 1), 1 - window_size_rand)
+		n_win = i_end - i_start
+		
+		# a constant window (including one that's all padding) has no spread
+		if i_end == 0 or run_arr[i_end-1] == i_end or n_win <= run_arr[i_end-1]:
+			continue
+		
+		win_mean = nb_padded_window_sum(arr[0], cum_arr, i_start, i_end) / n_win
+		win_var = nb_padded_window_sum(arr[0] ** 2, cum_sq_arr, i_start, i_end) / n_win - win_mean * win_mean
+		if win_var > 0.0:
+			out_arr[i] = (arr[i] - win_mean) / np.sqrt(win_var)
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:], i8, f8, i8[:])", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_causal_rolling_norm_rand_paths(arr, window_size_rand, peturb, seeds):
+	
+	# create an output array, with one row per perturbed path
+	out_arr = np.zeros((seeds.shape[0], arr.shape[0]))
+	
+	# the cumulative sum is shared by all of the paths
+	cum_arr = nb_cumsum(arr)
+	
+	# seed each path before drawing its window sizes, so each path only depends on its own seed
+	for i_s in nb.prange(seeds.shape[0]):
+		np.random.seed(seeds[i_s])
+		out_arr[i_s, :] = nb_causal_rolling_norm_rand_cumsum(arr, cum_arr, window_size_rand, peturb)
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:], i8, i8[:])", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_causal_rolling_sd_rand_paths(arr, window_size_rand, seeds):
+	
+	# create an output array, with one row per perturbed path
+	out_arr = np.zeros((seeds.shape[0], arr.shape[0]))
+	
+	# the cumulative sums are shared by all of the paths
+	arr_centred = arr - np.mean(arr)
+	cum_arr = nb_cumsum(arr_centred)
+	cum_sq_arr = nb_cumsum(arr_centred ** 2)
+	run_arr = nb_run_lengths(arr)
+	
+	# seed each path before drawing its window sizes, so each path only depends on its own seed
+	for i_s in nb.prange(seeds.shape[0]):
+		np.random.seed(seeds[i_s])
+		out_arr[i_s, :] = nb_causal_rolling_sd_rand_cumsum(arr_centred, cum_arr, cum_sq_arr, run_arr, window_size_rand)
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:, :], f8[:, :])", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_safe_divide_2d(a, b):
+	# divide each row in a by the same row in b (e.g. topics x time)
+	# if element b == 0.0, return element = 0.0
+	c = np.zeros(a.shape, dtype=np.float64)
+	for i_r in nb.prange(a.shape[0]):
+		c[i_r, :] = nb_safe_divide(a[i_r], b[i_r])
+	return c
+
+@nb.jit("(f8[:, :])(f8[:, :], i8)", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_causal_rolling_average_2d(arr, window_size):
+	
+	# create an output array
+	out_arr = np.zeros(arr.shape, dtype=np.float64)
+	
+	# each row (e.g. each topic of the augmento data) is independent,
+	# so smooth the rows in parallel
+	for i_r in nb.prange(arr.shape[0]):
+		out_arr[i_r, :] = nb_causal_rolling_average(arr[i_r], window_size)
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:, :], i8)", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_causal_rolling_sd_2d(arr, window_size):
+	
+	# create an output array
+	out_arr = np.zeros(arr.shape, dtype=np.float64)
+	
+	# standardise each row in parallel
+	for i_r in nb.prange(arr.shape[0]):
+		out_arr[i_r, :] = nb_causal_rolling_sd(arr[i_r], window_size)
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:, :], i8)", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_causal_rolling_norm_2d(arr, window_size):
+	
+	# create an output array
+	out_arr = np.zeros(arr.shape, dtype=np.float64)
+	
+	# normalise each row in parallel
+	for i_r in nb.prange(arr.shape[0]):
+		out_arr[i_r, :] = nb_causal_rolling_norm(arr[i_r], window_size)
 	
 	return out_arr
 
 
+# the example sentiment scores, by the score_type used in the sweep kernels
+sentiment_score_types = {"a" : 0, "b" : 1, "c" : 2}
 
 #@nb.jit("(f8[:])(f8[:], f8[:], i8, i8, f8)", nopython=True, nogil=True)
 def nb_calc_sentiment_score_rand_b(sent_a, sent_b, ra_win_size_short, ra_win_size_long,peturb):
@@ -238,10 +473,11 @@ def nb_backtest_a(price, sent_score, start_pnl, buy_sell_fee):
 		# else if sentiment score is negative, simulate short position
 		# else if the sentiment score is 0.0, hold
 		# (note that this is a very approximate market simulation!)
+		# (until we have a sentiment score from n_sample_delay samples ago, hold)
 		n_sample_delay = 2
 		if i_p < n_sample_delay:
 			pnl[i_p] = pnl[i_p-1]
-		if sent_score[i_p-n_sample_delay] > 0.0:
+		elif sent_score[i_p-n_sample_delay] > 0.0:
 			pnl[i_p] = (price[i_p] / price[i_p-1]) * pnl[i_p-1]
 		elif sent_score[i_p-n_sample_delay] <= 0.0:
 			pnl[i_p] = (price[i_p-1] / price[i_p]) * pnl[i_p-1]
@@ -254,27 +490,431 @@ def nb_backtest_a(price, sent_score, start_pnl, buy_sell_fee):
 	
 	return pnl
 
+@nb.jit("UniTuple(f8[:], 2)(f8[:])", nopython=True, nogil=True, cache=True)
+def nb_price_ratios(price):
+	# the price ratios nb_backtest_a multiplies the pnl by when long (up) and short (down),
+	# worked out once so they can be shared between many backtests on the same prices
+	price_up = np.ones(price.shape[0], dtype=np.float64)
+	price_down = np.ones(price.shape[0], dtype=np.float64)
+	for i_p in range(1, price.shape[0]):
+		price_up[i_p] = price[i_p] / price[i_p-1]
+		price_down[i_p] = price[i_p-1] / price[i_p]
+	return price_up, price_down
+
+@nb.jit("Tuple((f8[:], f8[:], f8, i8))(f8[:], f8[:], f8[:], f8, f8[:])", nopython=True, nogil=True, cache=True)
+def nb_backtest_a_stats(price_up, price_down, sent_score, start_pnl, buy_sell_fees):
+	# the same market model as nb_backtest_a (takes the output of nb_price_ratios), run for several
+	# trade fees in one pass, keeping only the latest pnl instead of the whole pnl array, and
+	# returning (for each fee) the final pnl and the largest fall of the pnl from its running peak
+	# (as a fraction of the peak), and the turnover (the sum of the absolute changes of the
+	# position, +1 long or -1 short) and number of trades (the number of fees charged)
+	
+	n_fees = buy_sell_fees.shape[0]
+	pnl = np.full(n_fees, start_pnl)
+	pnl_peak = np.full(n_fees, start_pnl)
+	max_drawdown = np.zeros(n_fees)
+	turnover = 0.0
+	n_trades = 0
+	
+	n_sample_delay = 2
+	position = 0.0
+	for i_p in range(1, price_up.shape[0]):
+		
+		# hold, long, short, or (if the sentiment score is nan) drop to zero, as in nb_backtest_a
+		if i_p < n_sample_delay:
+			pnl_ratio = 1.0
+			new_position = position
+		elif sent_score[i_p-n_sample_delay] > 0.0:
+			pnl_ratio = price_up[i_p]
+			new_position = 1.0
+		elif sent_score[i_p-n_sample_delay] <= 0.0:
+			pnl_ratio = price_down[i_p]
+			new_position = -1.0
+		else:
+			pnl_ratio = 0.0
+			new_position = 0.0
+		
+		# the position is first set from the first sentiment score, after the delay
+		if i_p > n_sample_delay:
+			turnover += abs(new_position - position)
+		position = new_position
+		
+		# simulate a trade fee if we cross from long to short, or visa versa
+		charge_fee = i_p > 1 and np.sign(sent_score[i_p-1]) != np.sign(sent_score[i_p-2])
+		if charge_fee:
+			n_trades += 1
+		
+		for i_f in range(n_fees):
+			pnl[i_f] = pnl_ratio * pnl[i_f]
+			if charge_fee:
+				pnl[i_f] = pnl[i_f] - (buy_sell_fees[i_f] * pnl[i_f])
+			
+			if pnl[i_f] > pnl_peak[i_f]:
+				pnl_peak[i_f] = pnl[i_f]
+			elif pnl_peak[i_f] > 0.0 and (pnl_peak[i_f] - pnl[i_f]) / pnl_peak[i_f] > max_drawdown[i_f]:
+				max_drawdown[i_f] = (pnl_peak[i_f] - pnl[i_f]) / pnl_peak[i_f]
+	
+	return pnl, max_drawdown, turnover, n_trades
 
+@nb.jit("f8(f8[:], f8[:], f8[:], f8, f8)", nopython=True, nogil=True, cache=True)
+def nb_backtest_a_final(price_up, price_down, sent_score, start_pnl, buy_sell_fee):
+	# the final pnl of nb_backtest_a (takes the output of nb_price_ratios), see nb_backtest_a_stats
+	final_pnl, max_drawdown, turnover, n_trades = nb_backtest_a_stats(price_up, price_down, sent_score, start_pnl,
+	                                                                  np.full(1, buy_sell_fee))
+	return final_pnl[0]
 
+@nb.jit("UniTuple(f8, 2)(f8[:], f8[:], f8[:], f8, f8)", nopython=True, nogil=True, cache=True)
+def nb_backtest_a_drawdown(price_up, price_down, sent_score, start_pnl, buy_sell_fee):
+	# the final pnl of nb_backtest_a, and the largest fall of the pnl from its running peak (as a
+	# fraction of the peak), see nb_backtest_a_stats
+	final_pnl, max_drawdown, turnover, n_trades = nb_backtest_a_stats(price_up, price_down, sent_score, start_pnl,
+	                                                                  np.full(1, buy_sell_fee))
+	return final_pnl[0], max_drawdown[0]
 
-@nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, cache=True)
-def moving_average(arr, window):
+@nb.jit("Tuple((f8[:, :], f8[:, :], f8[:], i8[:]))(f8[:], f8[:, :], f8, f8[:])",
+        nopython=True, nogil=True, parallel=True, cache=True)
+def nb_backtest_a_batch(price, sent_scores, start_pnl, buy_sell_fees):
+	
+	# backtest each row of sent_scores (signals x time) against the same prices for every trade fee,
+	# returning the final pnl and max drawdown (signals x fees), and the turnover and number of
+	# trades of each signal (see nb_backtest_a_stats), without keeping any of the pnl arrays
+	n_signals = sent_scores.shape[0]
+	final_pnl = np.zeros((n_signals, buy_sell_fees.shape[0]), dtype=np.float64)
+	max_drawdown = np.zeros((n_signals, buy_sell_fees.shape[0]), dtype=np.float64)
+	turnover = np.zeros(n_signals, dtype=np.float64)
+	n_trades = np.zeros(n_signals, dtype=np.int64)
+	
+	# the prices are shared by all of the signals
+	price_up, price_down = nb_price_ratios(price)
+	
+	for i_s in nb.prange(n_signals):
+		final_pnl[i_s, :], max_drawdown[i_s, :], turnover[i_s], n_trades[i_s] = nb_backtest_a_stats(
+			price_up, price_down, sent_scores[i_s], start_pnl, buy_sell_fees)
+	
+	return final_pnl, max_drawdown, turnover, n_trades
+
+@nb.jit("(f8[:])(f8[:], f8[:], i8, i8, i8)", nopython=True, nogil=True, cache=True)
+def nb_calc_sentiment_score(sent_a, sent_b, win_size_1, win_size_2, score_type):
+	# pick one of the example sentiment scores by type (0: a, 1: b, 2: c, see sentiment_score_types)
+	if score_type == 0:
+		return nb_calc_sentiment_score_a(sent_a, sent_b, win_size_1, win_size_2)
+	elif score_type == 1:
+		return nb_calc_sentiment_score_b(sent_a, sent_b, win_size_1, win_size_2)
+	elif score_type == 2:
+		return nb_calc_sentiment_score_c(sent_a, sent_b, win_size_1, win_size_2)
+	else:
+		raise ValueError("unknown sentiment score type")
+
+@nb.jit("void(f8[:], i8[:], f8, i8)", nopython=True, nogil=True, cache=True)
+def nb_top_k_insert(top_values, top_index, value, index):
+	# insert value into top_values (kept sorted from largest to smallest, and padded
+	# with -inf), dropping the smallest value, and move the indices along with the values
+	k = top_values.shape[0]
+	if k == 0 or not value > top_values[k-1]:
+		return
+	i_k = k - 1
+	while i_k > 0 and top_values[i_k-1] < value:
+		top_values[i_k] = top_values[i_k-1]
+		top_index[i_k] = top_index[i_k-1]
+		i_k -= 1
+	top_values[i_k] = value
+	top_index[i_k] = index
+
+@nb.jit("Tuple((f8[:, :], i8[:], f8[:]))(f8[:], f8[:, :], i8, i8, i8, f8, f8, i8)",
+        nopython=True, nogil=True, parallel=True, cache=True)
+def nb_sweep_sentiment_pairs(price, topics, win_size_1, win_size_2, score_type, start_pnl, buy_sell_fee, top_k):
+	
+	# backtest every ordered pair of rows in topics (topics x time), using row i as sent_a
+	# and row j as sent_b, and keep only the final pnl of each pair
+	n_topics = topics.shape[0]
+	final_pnl = np.zeros((n_topics, n_topics), dtype=np.float64)
+	
+	# the prices and topic rows are shared by all of the pairs
+	price_up, price_down = nb_price_ratios(price)
+	rows = np.ascontiguousarray(topics)
+	
+	# keep the best pairs of each row as we go, and merge them at the end
+	row_top_pnl = np.full((n_topics, top_k), -np.inf)
+	row_top_index = np.full((n_topics, top_k), -1, dtype=np.int64)
+	
+	for i in nb.prange(n_topics):
+		for j in range(n_topics):
+			sent_score = nb_calc_sentiment_score(rows[i], rows[j], win_size_1, win_size_2, score_type)
+			final_pnl[i, j] = nb_backtest_a_final(price_up, price_down, sent_score, start_pnl, buy_sell_fee)
+			nb_top_k_insert(row_top_pnl[i], row_top_index[i], final_pnl[i, j], i * n_topics + j)
+	
+	top_pnl = np.full(top_k, -np.inf)
+	top_index = np.full(top_k, -1, dtype=np.int64)
+	for i in range(n_topics):
+		for i_k in range(top_k):
+			if row_top_index[i, i_k] >= 0:
+				nb_top_k_insert(top_pnl, top_index, row_top_pnl[i, i_k], row_top_index[i, i_k])
+	
+	return final_pnl, top_index, top_pnl
+
+def sweep_sentiment_pairs(price, topics, win_size_1, win_size_2, score="a",
+                          start_pnl=1.0, buy_sell_fee=0.0075, top_k=30):
+	# backtest one of the example sentiment scores for every ordered pair of topics
+	# (rows of topics, e.g. aug_data.T.astype(float)) in a single parallel call
+	# returns the final pnl of each pair (sent_a x sent_b), the (sent_a, sent_b) row indices
+	# of the top_k pairs with the highest final pnl, and their final pnl
+	if score not in sentiment_score_types:
+		raise ValueError("unknown sentiment score: {:s}".format(str(score)))
+	
+	topics = np.asarray(topics, dtype=np.float64)
+	final_pnl, top_index, top_pnl = nb_sweep_sentiment_pairs(np.asarray(price, dtype=np.float64),
+	                                                         topics,
+	                                                         win_size_1,
+	                                                         win_size_2,
+	                                                         sentiment_score_types[score],
+	                                                         start_pnl,
+	                                                         buy_sell_fee,
+	                                                         top_k)
+	
+	# drop any unused slots (when there are fewer pairs than top_k)
+	n_top = np.sum(top_index >= 0)
+	top_pairs = np.stack((top_index[:n_top] // topics.shape[0], top_index[:n_top] % topics.shape[0]), axis=1)
+	
+	return final_pnl, top_pairs, top_pnl[:n_top]
+
+@nb.jit("(f8[:, :])(f8[:], f8[:], f8[:], i8[:], i8[:], i8, f8, f8, b1)",
+        nopython=True, nogil=True, parallel=True, cache=True)
+def nb_sweep_sentiment_windows(price, sent_a, sent_b, win_sizes_1, win_sizes_2, score_type, start_pnl, buy_sell_fee,
+                               shorter_first):
+	
+	# backtest one sentiment pair for every combination of the two window sizes of a sentiment
+	# score (win_sizes_1 x win_sizes_2), and keep only the final pnl of each combination
+	# with shorter_first, only the combinations where the first window is shorter than the second are
+	# backtested (the others are left at zero)
+	if score_type < 0 or score_type > 2:
+		raise ValueError("unknown sentiment score type")
+	
+	n_1 = win_sizes_1.shape[0]
+	n_2 = win_sizes_2.shape[0]
+	final_pnl = np.zeros((n_1, n_2), dtype=np.float64)
+	
+	# the sentiment ratio and prices are shared by all of the combinations
+	sent_ratio = nb_safe_divide(sent_a, sent_b)
+	price_up, price_down = nb_price_ratios(price)
+	
+	# smooth the sentiment ratio once per window size, rather than once per combination
+	smooth_1 = np.zeros((n_1, sent_ratio.shape[0]), dtype=np.float64)
+	for i in nb.prange(n_1):
+		smooth_1[i, :] = nb_causal_rolling_average(sent_ratio, win_sizes_1[i])
+	
+	smooth_2 = np.zeros((n_2 if score_type == 1 else 0, sent_ratio.shape[0]), dtype=np.float64)
+	for j in nb.prange(smooth_2.shape[0]):
+		smooth_2[j, :] = nb_causal_rolling_average(sent_ratio, win_sizes_2[j])
+	
+	# finish off the sentiment score for each combination and backtest it
+	for i_c in nb.prange(n_1 * n_2):
+		i = i_c // n_2
+		j = i_c % n_2
+		if shorter_first and win_sizes_1[i] >= win_sizes_2[j]:
+			continue
+		if score_type == 0:
+			sent_score = nb_causal_rolling_sd(smooth_1[i], win_sizes_2[j])
+		elif score_type == 1:
+			sent_score = smooth_1[i] - smooth_2[j]
+		else:
+			sent_score = nb_causal_rolling_norm(smooth_1[i], win_sizes_2[j])
+		final_pnl[i, j] = nb_backtest_a_final(price_up, price_down, sent_score, start_pnl, buy_sell_fee)
+	
+	return final_pnl
+
+def sweep_sentiment_windows(price, sent_a, sent_b, win_sizes_1, win_sizes_2, score="a",
+                            start_pnl=1.0, buy_sell_fee=0.0075, shorter_first=False):
+	# backtest one of the example sentiment scores for a pair of topics over a grid
+	# of window sizes (in samples) in a single parallel call
+	# returns the final pnl for each combination of window sizes (win_sizes_1 x win_sizes_2), or with
+	# shorter_first, only for those where the first window is shorter than the second (else zero)
+	if score not in sentiment_score_types:
+		raise ValueError("unknown sentiment score: {:s}".format(str(score)))
+	
+	return nb_sweep_sentiment_windows(np.asarray(price, dtype=np.float64),
+	                                  np.asarray(sent_a, dtype=np.float64),
+	                                  np.asarray(sent_b, dtype=np.float64),
+	                                  np.asarray(win_sizes_1, dtype=np.int64),
+	                                  np.asarray(win_sizes_2, dtype=np.int64),
+	                                  sentiment_score_types[score],
+	                                  start_pnl,
+	                                  buy_sell_fee,
+	                                  bool(shorter_first))
+
+@nb.jit("Tuple((f8[:, :], f8[:], f8[:]))(f8[:], f8[:], f8[:], i8[:], i8[:], f8, f8, f8, i8[:], b1)",
+        nopython=True, nogil=True, parallel=True, cache=True)
+def nb_monte_carlo_sentiment_rand_a(price, sent_a, sent_b, ra_win_sizes, std_win_sizes, peturb,
+                                    start_pnl, buy_sell_fee, seeds, keep_paths):
+	
+	# backtest one perturbed path of nb_calc_sentiment_score_rand_a per seed (with the window sizes
+	# of that path), returning the pnl of every path (paths x time, or no rows if not keep_paths),
+	# and the final pnl and max drawdown of every path
+	n_paths = seeds.shape[0]
+	pnl_paths = np.zeros((n_paths if keep_paths else 0, price.shape[0]), dtype=np.float64)
+	final_pnl = np.zeros(n_paths, dtype=np.float64)
+	max_drawdown = np.zeros(n_paths, dtype=np.float64)
+	
+	# the sentiment ratio, its cumulative sum and the prices are shared by all of the paths
+	sent_ratio = nb_safe_divide(sent_a, sent_b)
+	cum_ratio = nb_cumsum(sent_ratio)
+	price_up, price_down = nb_price_ratios(price)
+	
+	for i_s in nb.prange(n_paths):
+		
+		# seed each path before drawing its window sizes, so each path only depends on its own seed
+		np.random.seed(seeds[i_s])
+		sent_ratio_smooth = nb_causal_rolling_norm_rand_cumsum(sent_ratio, cum_ratio, ra_win_sizes[i_s], peturb)
+		sent_score = nb_causal_rolling_sd(sent_ratio_smooth, std_win_sizes[i_s])
+		
+		if keep_paths:
+			pnl_paths[i_s, :] = nb_backtest_a(price, sent_score, start_pnl, buy_sell_fee)
+		final_pnl[i_s], max_drawdown[i_s] = nb_backtest_a_drawdown(price_up, price_down, sent_score,
+		                                                           start_pnl, buy_sell_fee)
+	
+	return pnl_paths, final_pnl, max_drawdown
+
+def monte_carlo_sentiment_rand_a(price, sent_a, sent_b, ra_win_size, std_win_size, peturb, n_paths,
+                                 seed=0, window_peturb=0.0, start_pnl=1.0, buy_sell_fee=0.0075,
+                                 keep_paths=True, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+	# robustness test a pair of window sizes by backtesting n_paths perturbed paths of
+	# nb_calc_sentiment_score_rand_a in a single parallel call, where seed sets the seeds of the paths
+	# and window_peturb (if non-zero) also perturbs the window sizes of each path
+	# returns the pnl of every path (paths x time, or None if not keep_paths), the final pnl
+	# and max drawdown of every path, and the given quantiles of the final pnl
+	rng = np.random.RandomState(seed)
+	seeds = rng.randint(0, 2**31 - 1, size=n_paths).astype(np.int64)
+	
+	# draw the window sizes of each path
+	ra_win_sizes = np.full(n_paths, ra_win_size, dtype=np.int64)
+	std_win_sizes = np.full(n_paths, std_win_size, dtype=np.int64)
+	if window_peturb != 0.0:
+		ra_win_sizes = np.round(rng.normal(ra_win_size, ra_win_size * window_peturb, n_paths)).astype(np.int64)
+		std_win_sizes = np.round(rng.normal(std_win_size, std_win_size * window_peturb, n_paths)).astype(np.int64)
+		ra_win_sizes = np.maximum(ra_win_sizes, 1)
+		std_win_sizes = np.maximum(std_win_sizes, 2)
+	
+	pnl_paths, final_pnl, max_drawdown = nb_monte_carlo_sentiment_rand_a(np.asarray(price, dtype=np.float64),
+	                                                                     np.asarray(sent_a, dtype=np.float64),
+	                                                                     np.asarray(sent_b, dtype=np.float64),
+	                                                                     ra_win_sizes,
+	                                                                     std_win_sizes,
+	                                                                     peturb,
+	                                                                     start_pnl,
+	                                                                     buy_sell_fee,
+	                                                                     seeds,
+	                                                                     keep_paths)
+	
+	return (pnl_paths if keep_paths else None), final_pnl, max_drawdown, np.quantile(final_pnl, quantiles)
+
+# the columns of the output of nb_pnl_metrics
+pnl_metric_names = ("total_return", "sharpe", "sortino", "max_drawdown", "max_drawdown_duration", "hit_rate", "n_flips")
+
+@nb.jit("(f8[:])(f8[:], f8[:], f8)", nopython=True, nogil=True, cache=True)
+def nb_pnl_metrics(pnl, position, bin_size):
+	# performance metrics of a pnl array in a single pass (see pnl_metric_names):
+	# - the total return
+	# - the annualised sharpe and sortino ratios of the returns of each sample, with bin_size in seconds
+	# - the largest fall of the pnl from its running peak (as a fraction of the peak), and the number
+	#   of samples from that peak until the pnl got back to it (or until the end, if it never did)
+	# - the hit rate (the fraction of the non-zero returns that are positive)
+	# - the number of times the sign of position (e.g. the sentiment score) flips
+	out_arr = np.zeros(len(pnl_metric_names))
+	if pnl.shape[0] == 0:
+		return out_arr
+	
+	# running mean and M2 of the returns (Welford), and the sum of the squared negative returns
+	ret_mean = 0.0
+	ret_m2 = 0.0
+	ret_sq_down = 0.0
+	n_ret = 0
+	n_up = 0
+	n_down = 0
+	
+	pnl_peak = pnl[0]
+	i_peak = 0
+	max_drawdown = 0.0
+	i_max_drawdown_peak = -1
+	max_drawdown_duration = 0
+	
+	n_flips = 0
+	
+	for i in range(1, pnl.shape[0]):
 		
-		# output array
-	ma_arr = np.zeros(arr.shape[0])
+		ret = 0.0
+		if pnl[i-1] != 0.0:
+			ret = pnl[i] / pnl[i-1] - 1.0
+		n_ret += 1
+		ret_delta = ret - ret_mean
+		ret_mean += ret_delta / n_ret
+		ret_m2 += ret_delta * (ret - ret_mean)
+		if ret > 0.0:
+			n_up += 1
+		elif ret < 0.0:
+			n_down += 1
+			ret_sq_down += ret * ret
 		
-		# add space for rolling window
-	new_arr = np.hstack((np.ones(window-1) * arr[0], arr))
+		# a new peak ends the current drawdown
+		if pnl[i] >= pnl_peak:
+			if i_peak == i_max_drawdown_peak:
+				max_drawdown_duration = i - i_peak
+			pnl_peak = pnl[i]
+			i_peak = i
+		elif pnl_peak > 0.0 and (pnl_peak - pnl[i]) / pnl_peak > max_drawdown:
+			max_drawdown = (pnl_peak - pnl[i]) / pnl_peak
+			i_max_drawdown_peak = i_peak
 		
-		# calculate moving average
-	#for i in nb.prange(arr.shape[0]):
-	for i in range(arr.shape[0]):
-		num = new_arr[i+window-1] - np.mean(new_arr[i : i+window-1])
-		denom = np.std(new_arr[i : i + window-1])
-		if denom != 0.0:
-						ma_arr[i] = num / denom
+		if i < position.shape[0] and np.sign(position[i]) != np.sign(position[i-1]):
+			n_flips += 1
+	
+	# the largest drawdown may not have been recovered from
+	if i_peak == i_max_drawdown_peak:
+		max_drawdown_duration = pnl.shape[0] - 1 - i_peak
+	
+	bins_per_year = 365.0 * 24.0 * 60.0 * 60.0 / bin_size
+	ret_sd = np.sqrt(ret_m2 / n_ret) if n_ret > 0 else 0.0
+	ret_sd_down = np.sqrt(ret_sq_down / n_ret) if n_ret > 0 else 0.0
+	
+	if pnl[0] != 0.0:
+		out_arr[0] = pnl[-1] / pnl[0] - 1.0
+	if ret_sd != 0.0:
+		out_arr[1] = ret_mean / ret_sd * np.sqrt(bins_per_year)
+	if ret_sd_down != 0.0:
+		out_arr[2] = ret_mean / ret_sd_down * np.sqrt(bins_per_year)
+	out_arr[3] = max_drawdown
+	out_arr[4] = max_drawdown_duration
+	if n_up + n_down > 0:
+		out_arr[5] = n_up / (n_up + n_down)
+	out_arr[6] = n_flips
+	
+	return out_arr
+
+@nb.jit("(f8[:, :])(f8[:, :], f8[:, :], f8)", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_pnl_metrics_2d(pnl_paths, positions, bin_size):
+	
+	# performance metrics (see nb_pnl_metrics) of each row of pnl_paths (paths x time), with the
+	# position of the same row of positions (or no flips are counted, if positions has no rows)
+	if positions.shape[0] != 0 and positions.shape[0] != pnl_paths.shape[0]:
+		raise ValueError("positions must have no rows, or one row per pnl path")
+	
+	out_arr = np.zeros((pnl_paths.shape[0], len(pnl_metric_names)), dtype=np.float64)
+	no_position = np.zeros(0, dtype=np.float64)
+	
+	for i_s in nb.prange(pnl_paths.shape[0]):
+		if positions.shape[0] > 0:
+			out_arr[i_s, :] = nb_pnl_metrics(pnl_paths[i_s], positions[i_s], bin_size)
+		else:
+			out_arr[i_s, :] = nb_pnl_metrics(pnl_paths[i_s], no_position, bin_size)
+	
+	return out_arr
+
 
-	return ma_arr 
+
+@nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, cache=True)
+def moving_average(arr, window):
+	
+	# standardise each element by the mean and std of the previous window-1 elements
+	# (this is the same calculation as the causal rolling sd)
+	return nb_causal_rolling_sd(arr, window)
 
 #@nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, cache=True)
 #def signal_ma(positive, negative, short, long):
@@ -296,16 +936,16 @@ def sma_crossover_backtest(price, leading_arr, lagging_arr, start_pnl, buy_sell_
 	
 	# for each step, run the market model
 	for i_p in range(1, price.shape[0]):
-			if sent_signal[i_p-1] > threshold:
-					pnl[i_p] = (price[i_p] / price[i_p-1]) * pnl[i_p-1]
-			elif sent_signal[i_p-1] < threshold:
-					pnl[i_p] = (price[i_p-1] / price[i_p]) * pnl[i_p-1]
-			elif sent_signal[i_p-1] == threshold:
-				pnl[i_p] = pnl[i_p-1]
-	
-	# simulate a trade fee if we cross from long to short, or visa versa
-	if i_p > 1 and np.sign(sent_signal[i_p-1]) != np.sign(sent_signal[i_p-2]):
-		pnl[i_p] = pnl[i_p] - (buy_sell_fee * pnl[i_p])
+		if sent_signal[i_p-1] > threshold:
+			pnl[i_p] = (price[i_p] / price[i_p-1]) * pnl[i_p-1]
+		elif sent_signal[i_p-1] < threshold:
+			pnl[i_p] = (price[i_p-1] / price[i_p]) * pnl[i_p-1]
+		elif sent_signal[i_p-1] == threshold:
+			pnl[i_p] = pnl[i_p-1]
+		
+		# simulate a trade fee if we cross from long to short, or visa versa
+		if i_p > 1 and np.sign(sent_signal[i_p-1]) != np.sign(sent_signal[i_p-2]):
+			pnl[i_p] = pnl[i_p] - (buy_sell_fee * pnl[i_p])
 	
 	return pnl
 
@@ -325,57 +965,70 @@ def sma_crossover_backtest(price, leading_arr, lagging_arr, start_pnl, buy_sell_
 #                price_rate_change[i] = (price_data[j] - price_data[i])/price_data[i]
 #                break
 
-@nb.jit("(f8[:])(f8[:], f8[:], i8)", nopython=True, nogil=True, cache=True)
-def forward_volume(volume_data, price_data, threshold=2000000):
-
-    price_rate_change = np.zeros(len(price_data))
-
-    for i in range((len(volume_data))):
-        j = i+1
-        sum_volume = 0.0
-
-        while (sum_volume < threshold) & (j < len(price_rate_change)):
-            sum_volume += volume_data[j]
-
-            if sum_volume >= threshold:
-                price_rate_change[i] = (price_data[j]-price_data[i])/price_data[i]
-
-            j += 1
+@nb.jit("(f8[:, :])(f8[:], f8[:], f8[:])", nopython=True, nogil=True, parallel=True, cache=True)
+def nb_forward_volume_2d(volume_data, price_data, thresholds):
+	
+	# for each threshold and each sample i, the price change from sample i to the first sample j > i
+	# where the volume traded over samples i+1 to j reaches the threshold (thresholds x time)
+	# (or 0.0, if the volume never reaches the threshold)
+	price_rate_change = np.zeros((thresholds.shape[0], len(price_data)))
+	
+	# the volume traded over samples i+1 to j is cum_volume[j+1] - cum_volume[i+1], and the
+	# cumulative volume never goes down, so find the first crossing with a binary search
+	cum_volume = nb_cumsum(volume_data)
+	
+	for i in nb.prange(min(len(volume_data), len(price_data))):
+		for i_t in range(thresholds.shape[0]):
+			if thresholds[i_t] <= 0.0:
+				continue
+			j = np.searchsorted(cum_volume, cum_volume[i+1] + thresholds[i_t]) - 1
+			if j < len(price_data) and j < len(volume_data):
+				price_rate_change[i_t, i] = (price_data[j]-price_data[i])/price_data[i]
+	
+	return price_rate_change
 
-    return price_rate_change
-            
 @nb.jit("(f8[:])(f8[:], f8[:], f8)", nopython=True, nogil=True, cache=True)
 def forward_volume(volume_data, price_data, threshold):
-
-    price_rate_change = np.zeros(len(price_data))
-
-    for i in range((len(volume_data))):
-        j = i+1
-        sum_volume = 0.0
-
-        while (sum_volume < threshold) & (j < len(price_rate_change)):
-            sum_volume += volume_data[j]
-
-            if sum_volume >= threshold:
-                price_rate_change[i] = (price_data[j]-price_data[i])/price_data[i]
-
-            j += 1
-
-    return price_rate_change
+	
+	# the price change from each sample to the first sample where the volume
+	# traded since reaches the threshold (see nb_forward_volume_2d)
+	return nb_forward_volume_2d(volume_data, price_data, np.array([threshold]))[0]
  
             
 @nb.jit("(f8[:])(f8[:], i8)", nopython=True, nogil=True, cache=True)
 def volume_normalized(volume_data, n_hours):
-    norm_volume = np.zeros(len(volume_data))
-    start = 0
-    for i in range(n_hours,len(volume_data), n_hours):
-        for j in range(start,i):
-            norm_volume[j] = volume_data[j]/np.sum(volume_data[start:i])
-        start = i 
-    return norm_volume
-
-
-
-
-
+	
+	# divide each volume by the total volume of its block of n_hours samples
+	# (including the last block, even if it's shorter), or 0.0 if the block has no volume
+	norm_volume = np.zeros(len(volume_data))
+	for start in range(0, len(volume_data), n_hours):
+		end = min(start + n_hours, len(volume_data))
+		block_volume = np.sum(volume_data[start:end])
+		if block_volume != 0.0:
+			norm_volume[start:end] = volume_data[start:end] / block_volume
+	return norm_volume
 
+def volume_normalized_2d(volume_data, n_hours, rolling=False):
+	# normalise the volume of each series (series x time, or a single series) by the total volume
+	# of its blocks of n_hours samples, as volume_normalized, or if rolling, by the total volume of
+	# the last n_hours samples (including the current one, and fewer at the start)
+	# where there's no volume to normalise by, the output is 0.0
+	volume_data = np.asarray(volume_data, dtype=np.float64)
+	if n_hours < 1:
+		raise ValueError("n_hours must be at least 1, not {:s}".format(str(n_hours)))
+	n_hours = int(n_hours)
+	if volume_data.shape[-1] == 0:
+		return np.zeros(volume_data.shape)
+	
+	if rolling:
+		cum_volume = np.cumsum(volume_data, axis=-1)
+		total_volume = cum_volume.copy()
+		total_volume[..., n_hours:] -= cum_volume[..., :-n_hours]
+	else:
+		starts = np.arange(0, volume_data.shape[-1], n_hours)
+		block_volume = np.add.reduceat(volume_data, starts, axis=-1)
+		total_volume = np.repeat(block_volume, np.diff(np.append(starts, volume_data.shape[-1])), axis=-1)
+	
+	norm_volume = np.zeros(volume_data.shape)
+	np.divide(volume_data, total_volume, out=norm_volume, where=total_volume != 0.0)
+	return norm_volume
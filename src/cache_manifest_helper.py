@@ -0,0 +1,180 @@
+import os
+import re
+import time
+import zlib
+import json
+import bisect
+import threading
+import numpy as np
+
+import datetime_helper as dh
+import msgpack_stream_helper as msh
+
+# a manifest for each dataset of per-day .msgpack.zlib files, recording for each day the number of
+# records, the min/max t_epoch and the size and crc32 of the file, plus the ranges of days covered,
+# so finding gaps is an interval query and bad files can be found without decompressing them
+
+manifest_filename = "manifest.json"
+
+# one lock per dataset path, so concurrent writers in this process don't lose each others' updates
+manifest_locks = {}
+manifest_locks_lock = threading.Lock()
+
+def get_manifest_lock(path):
+	with manifest_locks_lock:
+		return manifest_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+def day_to_index(day_str):
+	# days since the epoch, from a %Y%m%d string
+	return int(dh.timestamp_to_epoch(day_str, "%Y%m%d")) // 86400
+
+def index_to_datetime(i_day):
+	return dh.epoch_to_datetime(86400 * i_day)
+
+def covered_ranges(day_strs):
+	# group days into sorted, inclusive [first, last] ranges of consecutive days (as day indices)
+	ranges = []
+	for i_day in sorted([day_to_index(el) for el in day_strs]):
+		if len(ranges) > 0 and i_day == ranges[-1][1] + 1:
+			ranges[-1][1] = i_day
+		else:
+			ranges.append([i_day, i_day])
+	return ranges
+
+def save_manifest(path, manifest):
+	# write to a temporary file then rename it
+	manifest["ranges"] = covered_ranges(manifest["days"].keys())
+	filename = "{:s}/{:s}".format(*(path, manifest_filename))
+	filename_tmp = "{:s}.{:d}.{:d}.tmp".format(*(filename, os.getpid(), threading.get_ident()))
+	with open(filename_tmp, "w") as f:
+		json.dump(manifest, f, sort_keys=True)
+	os.replace(filename_tmp, filename)
+
+def build_manifest(path, stale_days=3):
+
+	# build a manifest from the day files (decompressing them all), for caches written without one
+	manifest = {"days" : {}}
+	for filename in sorted(os.listdir(path)):
+		if re.fullmatch(r"[0-9]{8}\.msgpack\.zlib", filename) is None:
+			continue
+		filename = "{:s}/{:s}".format(*(path, filename))
+		try:
+			t_epoch = msh.load_msgpack_zlib_arrays(filename, ["t_epoch"])["t_epoch"]
+		except (ValueError, KeyError, zlib.error):
+			continue
+		with open(filename, "rb") as f:
+			compressed = f.read()
+		manifest["days"][os.path.basename(filename)[:8]] = day_entry(t_epoch, compressed)
+	
+	# the days that ended stale_days ago (and at least a day ago, the largest bin size) are closed, as
+	# in cache_data_by_day
+	for day_str in manifest["days"].keys():
+		manifest["days"][day_str]["closed"] = 86400 * (day_to_index(day_str) + 1 + max(stale_days, 1)) <= time.time()
+	return manifest
+
+def load_manifest(path):
+
+	# load the manifest of a dataset, building (and saving) it if it doesn't exist yet
+	filename = "{:s}/{:s}".format(*(path, manifest_filename))
+	with get_manifest_lock(path):
+		if os.path.exists(filename):
+			with open(filename, "r") as f:
+				return json.load(f)
+		manifest = build_manifest(path)
+		save_manifest(path, manifest)
+		return manifest
+
+def day_entry(t_epoch, compressed, closed=False):
+	# the manifest entry for a day, from its t_epochs and the compressed file contents, closed days are
+	# complete and immutable
+	return {"closed" : bool(closed),
+	        "n_records" : int(len(t_epoch)),
+	        "t_min" : float(np.min(t_epoch)) if len(t_epoch) > 0 else None,
+	        "t_max" : float(np.max(t_epoch)) if len(t_epoch) > 0 else None,
+	        "n_bytes" : len(compressed),
+	        "crc32" : zlib.crc32(compressed)}
+
+def update_manifest(path, entries):
+	# add/replace the entries of days ({"%Y%m%d" : entry}) that have just been written
+	with get_manifest_lock(path):
+		filename = "{:s}/{:s}".format(*(path, manifest_filename))
+		manifest = {"days" : {}}
+		if os.path.exists(filename):
+			with open(filename, "r") as f:
+				manifest = json.load(f)
+		manifest["days"].update(entries)
+		save_manifest(path, manifest)
+	return manifest
+
+def remove_days(path, day_strs):
+	# drop days from the manifest (e.g. bad files), so they are treated as missing
+	with get_manifest_lock(path):
+		filename = "{:s}/{:s}".format(*(path, manifest_filename))
+		with open(filename, "r") as f:
+			manifest = json.load(f)
+		for day_str in day_strs:
+			manifest["days"].pop(day_str, None)
+		save_manifest(path, manifest)
+	return manifest
+
+def last_t_epoch(manifest):
+	# the last bin cached, or None
+	t_maxs = [el["t_max"] for el in manifest["days"].values() if el["t_max"] is not None]
+	return int(max(t_maxs)) if len(t_maxs) > 0 else None
+
+def find_open_days(manifest, datetime_before=None):
+	# the days that aren't closed (before datetime_before, if given)
+	day_str_before = None if datetime_before is None else dh.datetime_to_str(datetime_before, timestamp_format_str="%Y%m%d")
+	return sorted([k for k, v in manifest["days"].items()
+	               if not v["closed"] and (day_str_before is None or k < day_str_before)])
+
+def find_missing_ranges(manifest, datetime_start, datetime_end, datetime_stale=None):
+
+	# the inclusive (first day, last day) ranges between the start and end days that the manifest
+	# doesn't cover, found by bisecting the covered ranges (days from datetime_stale on count as missing)
+	i_start = int(dh.datetime_to_epoch(dh.round_datetime_to_day_start(datetime_start))) // 86400
+	i_end = int(dh.datetime_to_epoch(dh.round_datetime_to_day_start(datetime_end))) // 86400
+	i_stale = i_end + 1
+	if datetime_stale is not None:
+		i_stale = max(i_start, min(i_stale, int(dh.datetime_to_epoch(datetime_stale)) // 86400))
+	ranges = manifest["ranges"]
+	
+	missing = []
+	i_day = i_start
+	i_range = bisect.bisect_left([el[1] for el in ranges], i_start)
+	while i_day < i_stale:
+		if i_range < len(ranges) and ranges[i_range][0] <= i_day:
+			i_day = ranges[i_range][1] + 1
+			i_range += 1
+			continue
+		i_next = min(ranges[i_range][0] if i_range < len(ranges) else i_stale, i_stale)
+		missing.append([i_day, i_next - 1])
+		i_day = i_next
+	
+	# add the stale days, joining them to the last gap if they touch it
+	if i_stale <= i_end:
+		if len(missing) > 0 and missing[-1][1] == i_stale - 1:
+			missing[-1][1] = i_end
+		else:
+			missing.append([i_stale, i_end])
+	
+	return [(index_to_datetime(el[0]), index_to_datetime(el[1])) for el in missing]
+
+def find_bad_days(path, manifest, datetime_start, datetime_end, checksums=False):
+
+	# the days between the start and end days that the manifest covers but whose files are missing, the
+	# wrong size, or (if checksums) fail their crc32, all without decompressing
+	bad_days = []
+	for rd in dh.get_datetimes_between_datetimes(datetime_start, datetime_end):
+		day_str = dh.datetime_to_str(rd, timestamp_format_str="%Y%m%d")
+		if day_str not in manifest["days"]:
+			continue
+		entry = manifest["days"][day_str]
+		filename = "{:s}/{:s}.msgpack.zlib".format(*(path, day_str))
+		if not os.path.exists(filename) or os.path.getsize(filename) != entry["n_bytes"]:
+			bad_days.append(day_str)
+		elif checksums:
+			with open(filename, "rb") as f:
+				if zlib.crc32(f.read()) != entry["crc32"]:
+					bad_days.append(day_str)
+	return bad_days
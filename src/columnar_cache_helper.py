@@ -0,0 +1,199 @@
+import os
+import shutil
+import datetime
+import tempfile
+import zlib
+import msgpack
+import numpy as np
+
+import io_helper as ioh
+import datetime_helper as dh
+import cache_manifest_helper as cmh
+
+# an alternative to the per-day .msgpack.zlib cache files, storing each field of the data as one
+# contiguous .npy array per partition (by default a year), so the cached data can be memory mapped:
+#
+#   {path}/columnar/{partition}/t_epoch.npy   (time,)
+#   {path}/columnar/{partition}/counts.npy    (time x 93) for augmento data
+#   {path}/columnar/{partition}/close.npy     (time,) etc. for price data
+#
+# every field is stored as float64, so the arrays can go straight into the analysis kernels
+#
+# a partition is written in full to a hidden temporary folder then swapped in, so a partition is
+# always the old or the new one, never a mix of the two
+
+# the name of the columnar cache folder in a dataset folder, and the default partition
+columnar_folder = "columnar"
+default_partition_format = "%Y"
+
+
+def records_to_columns(records, fields=None):
+	# convert a list of records (dicts, as returned by the apis) into a dict of arrays, one per field
+	# if fields isn't given, all the numeric fields (and lists of numbers, like counts) are kept
+	if fields is None:
+		fields = [k for k, v in records[0].items()
+		          if isinstance(v, (int, float, list)) and not isinstance(v, bool)] if len(records) > 0 else ["t_epoch"]
+	return {k : np.array([el[k] for el in records], dtype=np.float64) for k in fields}
+
+def sort_and_deduplicate_columns(columns):
+	# sort the columns by t_epoch, keeping the last record of each t_epoch
+	t_epoch = columns["t_epoch"]
+	order = np.argsort(t_epoch, kind="stable")
+	t_sorted = t_epoch[order]
+	keep = np.ones(t_sorted.shape[0], dtype=bool)
+	keep[:-1] = t_sorted[1:] != t_sorted[:-1]
+	return {k : v[order][keep] for k, v in columns.items()}
+
+def partition_names(t_epoch, partition_format=default_partition_format):
+	# the name of the partition each t_epoch belongs to, formatting each day only once (partitions are
+	# made of whole days)
+	days, i_days = np.unique(np.floor_divide(t_epoch, 86400).astype(np.int64), return_inverse=True)
+	names = [dh.epoch_to_datetime_str(86400 * int(el), timestamp_format_str=partition_format) for el in days]
+	return np.array(names)[i_days.reshape(-1)]
+
+def save_array_atomic(filename, arr):
+	# write to a temporary file first, so a crash can't leave a truncated file behind
+	fd, filename_temp = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+	try:
+		with os.fdopen(fd, "wb") as f:
+			np.save(f, arr)
+		os.replace(filename_temp, filename)
+	except BaseException:
+		os.remove(filename_temp)
+		raise
+
+def load_partition(path_partition, fields=None, mmap_mode="r"):
+	# load the fields of a partition (all of them if fields isn't given), memory mapped by default
+	if fields is None:
+		fields = sorted([el[:-len(".npy")] for el in os.listdir(path_partition) if el.endswith(".npy")])
+	return {k : np.load("{:s}/{:s}.npy".format(path_partition, k), mmap_mode=mmap_mode) for k in fields}
+
+def recover_partition(path_partition):
+	# put back the old version of a partition, if a write stopped between moving it out and moving the
+	# new one in
+	path_old = old_partition_path(path_partition)
+	if os.path.exists(path_old) and not os.path.exists(path_partition):
+		os.rename(path_old, path_partition)
+
+def old_partition_path(path_partition):
+	path_columnar, name = os.path.split(path_partition)
+	return "{:s}/.{:s}.old".format(path_columnar, name)
+
+def write_partition(path_partition, columns):
+	
+	# write the columns of a partition to a temporary folder next to it
+	path_columnar, name = os.path.split(path_partition)
+	ioh.check_path(path_columnar, create_if_not_exist=True)
+	path_temp = tempfile.mkdtemp(dir=path_columnar, prefix=".{:s}.".format(name))
+	try:
+		for k in columns.keys():
+			np.save("{:s}/{:s}.npy".format(path_temp, k), np.ascontiguousarray(columns[k]))
+	except BaseException:
+		shutil.rmtree(path_temp)
+		raise
+	
+	# then swap it in (a folder can't be replaced in one rename, so the old one is moved out first, and
+	# put back by recover_partition if we stop in between)
+	path_old = old_partition_path(path_partition)
+	if os.path.exists(path_old):
+		shutil.rmtree(path_old)
+	if os.path.exists(path_partition):
+		os.rename(path_partition, path_old)
+	os.rename(path_temp, path_partition)
+	if os.path.exists(path_old):
+		shutil.rmtree(path_old)
+
+def write_columnar_data(path_output, columns, partition_format=default_partition_format):
+	# add columns (a dict of arrays with a t_epoch field, see records_to_columns) to the columnar
+	# cache of the dataset folder path_output, merging with (and replacing) any cached records
+	columns = sort_and_deduplicate_columns(columns)
+	names = partition_names(columns["t_epoch"], partition_format=partition_format)
+	
+	for name in np.unique(names):
+		path_partition = "{:s}/{:s}/{:s}".format(path_output, columnar_folder, name)
+		part = {k : v[names == name] for k, v in columns.items()}
+		
+		# merge with the existing partition, with the new records taking priority
+		recover_partition(path_partition)
+		if os.path.exists("{:s}/t_epoch.npy".format(path_partition)):
+			old_part = load_partition(path_partition, fields=list(part.keys()), mmap_mode=None)
+			part = sort_and_deduplicate_columns({k : np.concatenate((old_part[k], part[k])) for k in part})
+		
+		write_partition(path_partition, part)
+
+def has_columnar_data(path_input):
+	# whether a dataset folder has a columnar cache, which must then be kept up to date with the day files
+	return os.path.exists("{:s}/{:s}".format(path_input, columnar_folder))
+
+def list_partitions(path_input):
+	# the names of the partitions in the columnar cache of a dataset folder, in order (skipping the
+	# hidden temporary folders)
+	path_columnar = "{:s}/{:s}".format(path_input, columnar_folder)
+	if not os.path.exists(path_columnar):
+		return []
+	for el in os.listdir(path_columnar):
+		if el.startswith(".") and el.endswith(".old"):
+			recover_partition("{:s}/{:s}".format(path_columnar, el[1:-len(".old")]))
+	return sorted([el for el in os.listdir(path_columnar)
+	               if not el.startswith(".") and os.path.exists("{:s}/{:s}/t_epoch.npy".format(path_columnar, el))])
+
+def load_columnar_partitions(path_input, datetime_start, datetime_end, fields=("t_epoch", "counts"), mmap_mode="r"):
+	# load the fields of each partition that overlaps [datetime_start, datetime_end), as memory mapped
+	# views trimmed to the time range (no data is copied)
+	t_start = dh.datetime_to_epoch(datetime_start)
+	t_end = dh.datetime_to_epoch(datetime_end)
+	
+	parts = []
+	for name in list_partitions(path_input):
+		part = load_partition("{:s}/{:s}/{:s}".format(path_input, columnar_folder, name),
+		                      fields=list(set(fields) | {"t_epoch"}),
+		                      mmap_mode=mmap_mode)
+		i_start, i_end = np.searchsorted(part["t_epoch"], [t_start, t_end])
+		if i_end > i_start:
+			parts.append({k : part[k][i_start:i_end] for k in fields})
+	
+	return parts
+
+def load_columnar_data(path_input, datetime_start, datetime_end, field="counts", mmap_mode="r"):
+	# the columnar equivalent of load_cached_data, returning t_data and the feature data of field
+	# (views of the memory mapped cache if the range is in a single partition, else a copy)
+	parts = load_columnar_partitions(path_input, datetime_start, datetime_end,
+	                                 fields=("t_epoch", field), mmap_mode=mmap_mode)
+	if len(parts) == 0:
+		return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+	if len(parts) == 1:
+		return parts[0]["t_epoch"], parts[0][field]
+	return np.concatenate([el["t_epoch"] for el in parts]), np.concatenate([el[field] for el in parts])
+
+def migrate_msgpack_cache(path_input, partition_format=default_partition_format, remove_msgpack=False):
+	# convert every dataset folder of per-day .msgpack.zlib files under path_input into the columnar
+	# format, in a columnar folder next to the day files (which are kept unless remove_msgpack, in which
+	# case they are dropped from the dataset's manifest too) returns the dataset folders that were
+	# converted
+	filenames = ioh.list_files_in_path_os(path_input, filename_suffix=".msgpack.zlib")
+	
+	# group the day files by folder (skipping any other files, like topics.msgpack.zlib)
+	day_files = {}
+	for filename in filenames:
+		path_dataset, name = os.path.split(filename)
+		try:
+			datetime.datetime.strptime(name.replace(".msgpack.zlib", ""), "%Y%m%d")
+		except ValueError:
+			continue
+		if os.path.basename(path_dataset) != columnar_folder:
+			day_files.setdefault(path_dataset, []).append(filename)
+	
+	for path_dataset in sorted(day_files):
+		records = []
+		for filename in sorted(day_files[path_dataset]):
+			with open(filename, "rb") as f:
+				records.extend(msgpack.unpackb(zlib.decompress(f.read()), raw=False))
+		if len(records) > 0:
+			write_columnar_data(path_dataset, records_to_columns(records), partition_format=partition_format)
+		if remove_msgpack:
+			if os.path.exists("{:s}/{:s}".format(path_dataset, cmh.manifest_filename)):
+				cmh.remove_days(path_dataset, [os.path.basename(el)[:8] for el in day_files[path_dataset]])
+			for filename in day_files[path_dataset]:
+				os.remove(filename)
+	
+	return sorted(day_files.keys())
@@ -1,5 +1,6 @@
 import datetime
 import pprint
+import concurrent.futures
 import msgpack
 import zlib
 import numpy as np
@@ -7,6 +8,7 @@ import numpy as np
 import io_helper as ioh
 import datetime_helper as dh
 import load_augmento_data_helper as ladh
+import time_index_helper as tih
 #import load_binance_data_helper as lbdh
 import load_kraken_data_helper as lbdh
 
@@ -20,10 +22,33 @@ def find_missing_date_batches(missing_days, required_days):
 			missing_day_batches.append([missing_days[i_amd]])
 	return missing_day_batches
 
-def strip_data_by_time(t_data, data, t_min, t_max):
-	data = np.array([s for s, t in zip(data, t_data) if t >= t_min and t <= t_max])
-	t_data = np.array([t for t in t_data if t >= t_min and t <= t_max])
-	return t_data, data
+def update_binance_cache(path_binance_data, binance_symbol, dt_bin_size, datetime_start, datetime_end):
+	
+	# check which days of data exist for the binance data
+	binance_dates = dh.list_file_dates_for_path(path_binance_data, ".msgpack.zlib", "%Y%m%d")
+	
+	# remove any dates from the last 3 days, so we reload recent data
+	datetime_now = datetime.datetime.now()
+	binance_dates = [el for el in binance_dates if el < dh.add_days_to_datetime(datetime_now, -3)]
+	
+	# get a list of the days we need
+	required_dates = dh.get_datetimes_between_datetimes(datetime_start, datetime_end)
+	
+	# get a list of the days we're missing for binance data
+	binance_missing_dates = sorted(list(set(required_dates) - set(binance_dates)))
+	
+	# group the missing days by batch
+	binance_missing_batches = find_missing_date_batches(binance_missing_dates, required_dates)
+	
+	# for each of the missing batches of binance data, get the data and cache it
+	for bbds in binance_missing_batches:
+		
+		# get the data for the batch and cache it
+		lbdh.load_and_cache_data(path_binance_data,
+		                                          binance_symbol,
+		                                          dt_bin_size,
+		                                          bbds[0],
+		                                          dh.add_days_to_datetime(bbds[-1], 1))
 
 def load_data(path_data="data/cache",
               augmento_coin=None,
@@ -32,7 +57,9 @@ def load_data(path_data="data/cache",
               dt_bin_size=None,
               datetime_start=None,
               datetime_end=None,
-              augmento_api_key=None):
+              augmento_api_key=None,
+              delta_refresh=True,
+              gap_policy=None):
 	
 	datetime_end = min(datetime.datetime.now(), datetime_end)
 	
@@ -41,7 +68,7 @@ def load_data(path_data="data/cache",
 		raise Exception("missing required param(s) in load_data()")
 	
 	# specify the path for the binance data cache
-	path_augmento_data = "{:s}/augmento/{:s}/{:s}/{:d}".format(*(path_data, augmento_source, augmento_coin, dt_bin_size))
+	path_augmento_data = ladh.augmento_dataset_path("{:s}/augmento".format(path_data), augmento_source, augmento_coin, dt_bin_size)
 	path_augmento_topics = "{:s}/augmento/".format(path_data)
 	
 	# specify the path for the augmento data cache
@@ -52,52 +79,25 @@ def load_data(path_data="data/cache",
 	ioh.check_path(path_augmento_data, create_if_not_exist=True)
 	ioh.check_path(path_binance_data, create_if_not_exist=True)
 	
-	# check which days of data exist for the augmento data and binance data
-	augmento_dates = dh.list_file_dates_for_path(path_augmento_data, ".msgpack.zlib", "%Y%m%d")
-	binance_dates = dh.list_file_dates_for_path(path_binance_data, ".msgpack.zlib", "%Y%m%d")
-	
-	# remove any dates from the last 3 days, so we reload recent data
-	datetime_now = datetime.datetime.now()
-	augmento_dates = [el for el in augmento_dates if el < dh.add_days_to_datetime(datetime_now, -3)]
-	binance_dates = [el for el in binance_dates if el < dh.add_days_to_datetime(datetime_now, -3)]
-	
-	# get a list of the days we need
-	required_dates = dh.get_datetimes_between_datetimes(datetime_start, datetime_end)
-	
-	# get a list of the days we're missing for augmento and binance data
-	augmento_missing_dates = sorted(list(set(required_dates) - set(augmento_dates)))
-	binance_missing_dates = sorted(list(set(required_dates) - set(binance_dates)))
-	
-	# group the missing days by batch
-	augmento_missing_batches = find_missing_date_batches(augmento_missing_dates, required_dates)
-	binance_missing_batches = find_missing_date_batches(binance_missing_dates, required_dates)
-	
 	# load the augmento keys
 	aug_keys = ladh.load_keys(path_augmento_topics)
 	
 	# load the binance keys
 	bin_keys = lbdh.load_keys()
 	
-	# for each of the missing batches of augmento data, get the data and cache it
-	for abds in augmento_missing_batches:
-		
-		# get the data for the batch and cache it
-		ladh.load_and_cache_data(path_augmento_data,
-		                                          augmento_source,
-		                                          augmento_coin,
-		                                          dt_bin_size,
-		                                          abds[0],
-		                                          dh.add_days_to_datetime(abds[-1], 1))
+	# get any missing augmento data and cache it, only fetching the bins after the last cached one for
+	# recent data (or the whole of the last 3 days, without delta_refresh)
+	ladh.update_cached_data(path_augmento_data,
+	                        augmento_source,
+	                        augmento_coin,
+	                        dt_bin_size,
+	                        datetime_start,
+	                        datetime_end,
+	                        delta_refresh=delta_refresh,
+	                        path_metadata=path_augmento_topics)
 	
-	# for each of the missing batches of binance data, get the data and cache it
-	for bbds in binance_missing_batches:
-		
-		# get the data for the batch and cache it
-		lbdh.load_and_cache_data(path_binance_data,
-		                                          binance_symbol,
-		                                          dt_bin_size,
-		                                          bbds[0],
-		                                          dh.add_days_to_datetime(bbds[-1], 1))
+	# get any missing binance data and cache it
+	update_binance_cache(path_binance_data, binance_symbol, dt_bin_size, datetime_start, datetime_end)
 	
 	# load the data
 	t_aug_data, aug_data = ladh.load_cached_data(path_augmento_data, datetime_start, datetime_end)
@@ -106,11 +106,75 @@ def load_data(path_data="data/cache",
 	# strip the data
 	t_min = max([t_aug_data[0], t_bin_data[0], dh.datetime_to_epoch(datetime_start)])
 	t_max = min([t_aug_data[-1], t_bin_data[-1], dh.datetime_to_epoch(datetime_end)])
-	t_aug_data, aug_data = strip_data_by_time(t_aug_data, aug_data, t_min, t_max)
-	t_bin_data, bin_data = strip_data_by_time(t_bin_data, bin_data, t_min, t_max)
+	t_aug_data, aug_data = tih.strip_data_by_time(t_aug_data, aug_data, t_min, t_max)
+	t_bin_data, bin_data = tih.strip_data_by_time(t_bin_data, bin_data, t_min, t_max)
+	
+	# optionally join the data onto the same grid of bins (from the first sentiment), so they line up bar
+	# for bar (see tih.gap_policies)
+	if gap_policy is not None:
+		t_grid = tih.make_time_grid(t_aug_data[0], t_max + dt_bin_size / 2.0, dt_bin_size)
+		t_grid, (aug_data, bin_data), _, gap_reports = tih.join_on_grid(t_grid,
+		                                                                [(t_aug_data, aug_data), (t_bin_data, bin_data)],
+		                                                                gap_policy=gap_policy)
+		tih.print_gap_reports(["augmento", "binance"], gap_reports)
+		t_aug_data, t_bin_data = t_grid, t_grid.copy()
 	
 	return t_aug_data, t_bin_data, aug_data, bin_data, aug_keys, bin_keys
 
-
-
-
+def load_universe(path_data="data/cache",
+                  augmento_coins=None,
+                  augmento_sources=None,
+                  binance_symbols=None,
+                  dt_bin_size=None,
+                  datetime_start=None,
+                  datetime_end=None,
+                  delta_refresh=True,
+                  n_datasets=4,
+                  requests_per_second=0.5):
+	
+	datetime_end = min(datetime.datetime.now(), datetime_end)
+	
+	# check the input arguments, there's one price symbol per coin
+	if None in [binance_symbols, augmento_coins, augmento_sources, dt_bin_size, datetime_start, datetime_end]:
+		raise Exception("missing required param(s) in load_universe()")
+	if len(binance_symbols) != len(augmento_coins):
+		raise Exception("need one binance symbol per augmento coin in load_universe()")
+	
+	# specify the paths for the binance data caches
+	path_binance_datas = ["{:s}/kraken/{:s}/{:d}".format(*(path_data, el, dt_bin_size)) for el in binance_symbols]
+	for path_binance_data in path_binance_datas:
+		ioh.check_path(path_binance_data, create_if_not_exist=True)
+	
+	# get any missing binance data and cache it, alongside the augmento downloads
+	with concurrent.futures.ThreadPoolExecutor(max_workers=n_datasets) as executor:
+		futures = [executor.submit(update_binance_cache, path_binance_data, binance_symbol, dt_bin_size,
+		                           datetime_start, datetime_end)
+		           for path_binance_data, binance_symbol in zip(path_binance_datas, binance_symbols)]
+		
+		# update and load the augmento data, (coins x sources x time x topics) on a regular grid of bins
+		t_data, aug_data, aug_keys = ladh.load_augmento_universe("{:s}/augmento".format(path_data),
+		                                                         augmento_coins,
+		                                                         augmento_sources,
+		                                                         dt_bin_size,
+		                                                         datetime_start,
+		                                                         datetime_end,
+		                                                         n_datasets=n_datasets,
+		                                                         requests_per_second=requests_per_second,
+		                                                         delta_refresh=delta_refresh)
+		for future in futures:
+			future.result()
+	
+	# load the binance keys
+	bin_keys = lbdh.load_keys()
+	
+	# load the prices onto the same grid, (coins x time), with nans where there's no price
+	bin_data = None
+	for i_symbol, path_binance_data in enumerate(path_binance_datas):
+		t_bin_data, temp_data = lbdh.load_cached_data(path_binance_data, datetime_start, datetime_end)
+		temp_data = np.asarray(temp_data, dtype=np.float64)
+		if bin_data is None:
+			bin_data = np.full((len(binance_symbols), t_data.shape[0]) + temp_data.shape[1:], np.nan, dtype=np.float64)
+		i_grid = tih.grid_positions(t_data, t_bin_data)
+		bin_data[i_symbol, i_grid[i_grid >= 0]] = temp_data[i_grid >= 0]
+	
+	return t_data, aug_data, bin_data, aug_keys, bin_keys
@@ -1,4 +1,5 @@
 import example_helper as eh
+import time_index_helper as tih
 import numpy as np
 import math 
 
@@ -15,17 +16,23 @@ class Data():
     def load_raw(self, 
             augmento_topic = "data/example_data/augmento_topics.msgpack.zlib",
             augmento_data = "data/example_data/augmento_data.msgpack.zlib",
-            bitmex_data = "data/example_data/bitmex_data.msgpack.zlib"):
+            bitmex_data = "data/example_data/bitmex_data.msgpack.zlib",
+            gap_policy = None):
         
         # load all raw data
         self.aug_topics, self.aug_topics_inv, self.t_aug_data,\
                 self.aug_data, self.t_price_data, self.price_data =\
-                eh.load_example_data(augmento_topic, augmento_data, bitmex_data)
+                eh.load_example_data(augmento_topic, augmento_data, bitmex_data,
+                        gap_policy=gap_policy)
         print("loaded")
 
         
     def get_data(self, n_timesteps, forward):
 
+        # the sentiments and prices are paired by position, so they must
+        # line up bar for bar (load_raw with a gap_policy joins them)
+        tih.check_aligned(self.t_aug_data, self.t_price_data)
+
         # number of sentiments
         n_sentiments = self.aug_data.shape[1]
         
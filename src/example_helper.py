@@ -3,36 +3,31 @@ import zlib
 import numpy as np
 import helper_functions as hf
 import datetime_helper as dh
-
-def strip_data_by_time(t_data, data, t_min, t_max):
-	data = np.array([s for s, t in zip(data, t_data) if t >= t_min and t <= t_max])
-	t_data = np.array([t for t in t_data if t >= t_min and t <= t_max])
-	return t_data, data
+import msgpack_stream_helper as msh
+import time_index_helper as tih
 
 def load_example_data(filename_augmento_topics,
                       filename_augmento_data,
                       filename_bitmex_data,
                       datetime_start=None,
-                      datetime_end=None):
+                      datetime_end=None,
+                      gap_policy=None,
+                      dt_bin_size=None):
 
 	# load the topics
-	with open(filename_augmento_topics, "rb") as f:
-		temp = msgpack.unpackb(zlib.decompress(f.read()), encoding='utf-8')
-		augmento_topics = {int(k) : v for k, v in temp.items()}
-		augmento_topics_inv = {v : int(k) for k, v in temp.items()}
+	temp = msh.load_msgpack_zlib(filename_augmento_topics)
+	augmento_topics = {int(k) : v for k, v in temp.items()}
+	augmento_topics_inv = {v : int(k) for k, v in temp.items()}
 	
 	# load the augmento data
-	with open(filename_augmento_data, "rb") as f:
-		temp = msgpack.unpackb(zlib.decompress(f.read()), encoding='utf-8')
-		t_aug_data = np.array([el["t_epoch"] for el in temp], dtype=np.float64)
-		aug_data = np.array([el["counts"] for el in temp], dtype=np.int32)
+	temp = msh.load_msgpack_zlib_arrays(filename_augmento_data, ["t_epoch", "counts"],
+	                                    dtypes={"t_epoch" : np.float64, "counts" : np.int32})
+	t_aug_data, aug_data = temp["t_epoch"], temp["counts"]
 	
 	# load the price data
-	with open(filename_bitmex_data, "rb") as f:
-		temp = msgpack.unpackb(zlib.decompress(f.read()), encoding='utf-8')
-		t_price_data = np.array([el["t_epoch"] for el in temp], dtype=np.float64)
-		#price_data = np.array([el["open"] for el in temp], dtype=np.float64)
-		price_data = np.array([el["close"] for el in temp], dtype=np.float64)
+	#temp = msh.load_msgpack_zlib_arrays(filename_bitmex_data, ["t_epoch", "open"])
+	temp = msh.load_msgpack_zlib_arrays(filename_bitmex_data, ["t_epoch", "close"])
+	t_price_data, price_data = temp["t_epoch"], temp["close"]
 	
 	# set the start and end times if they are specified
 	if datetime_start != None:
@@ -46,7 +41,18 @@ def load_example_data(filename_augmento_topics,
 		t_end = min(np.max(t_aug_data), np.max(t_price_data))
 	
 	# strip the sentiments and prices outside the shared time range
-	t_aug_data, aug_data = strip_data_by_time(t_aug_data, aug_data, t_start, t_end)
-	t_price_data, price_data = strip_data_by_time(t_price_data, price_data, t_start, t_end)
+	t_aug_data, aug_data = tih.strip_data_by_time(t_aug_data, aug_data, t_start, t_end)
+	t_price_data, price_data = tih.strip_data_by_time(t_price_data, price_data, t_start, t_end)
+	
+	# optionally join the sentiments and prices onto the same grid of bins (from the first sentiment), so
+	# they line up bar for bar (see tih.gap_policies)
+	if gap_policy is not None:
+		dt_bin_size = tih.infer_bin_size(t_aug_data) if dt_bin_size is None else dt_bin_size
+		t_grid = tih.make_time_grid(t_aug_data[0], t_end + dt_bin_size / 2.0, dt_bin_size)
+		t_grid, (aug_data, price_data), _, gap_reports = tih.join_on_grid(t_grid,
+		                                                                  [(t_aug_data, aug_data), (t_price_data, price_data)],
+		                                                                  gap_policy=gap_policy)
+		tih.print_gap_reports(["augmento", "bitmex"], gap_reports)
+		t_aug_data, t_price_data = t_grid, t_grid.copy()
 	
 	return augmento_topics, augmento_topics_inv, t_aug_data, aug_data, t_price_data, price_data
@@ -1,59 +1,158 @@
 import requests
 import time
+import datetime
 import pprint
+import os
 import zlib
 import msgpack
+import threading
+import concurrent.futures
 import numpy as np
 
 import datetime_helper as dh
+import msgpack_stream_helper as msh
+import cache_manifest_helper as cmh
+import time_index_helper as tih
+import columnar_cache_helper as cch
 
 # define the base url of the endpoint
 base_url = "http://api-dev.augmento.ai/v0.1"
 
-def load_keys(path_input):
+# a session shared by all requests (and threads), so connections are kept alive and pooled
+session = None
+session_lock = threading.Lock()
+
+def get_session(pool_size=16):
+	global session
+	with session_lock:
+		if session is None:
+			session = requests.Session()
+			adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+			session.mount("http://", adapter)
+			session.mount("https://", adapter)
+	return session
+
+def save_msgpack_zlib_atomic(filename, data):
+	# write to a temporary file then rename it, so a crash can't leave a truncated file
+	filename_tmp = "{:s}.{:d}.{:d}.tmp".format(*(filename, os.getpid(), threading.get_ident()))
+	compressed = zlib.compress(msgpack.packb(data))
+	with open(filename_tmp, "wb") as f:
+		f.write(compressed)
+	os.replace(filename_tmp, filename)
+	return compressed
+
+def load_metadata(path_metadata, name, ttl=86400.0, n_retries=5, backoff=1.0, base_url=base_url):
+	
+	# load a metadata endpoint (sources, coins, bin_sizes) from the cache, if it's younger than ttl seconds,
+	# else download and cache it
+	filename = "{:s}/{:s}.msgpack.zlib".format(*(path_metadata, name))
+	cached = None
+	if os.path.exists(filename):
+		with open(filename, "rb") as f:
+			cached = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+		if time.time() - cached["t_cached"] < ttl:
+			return cached["data"]
+	
+	# if the api is unavailable, fall back to a stale cache
+	try:
+		data = request_json("{:s}/{:s}".format(*(base_url, name)), n_retries=n_retries, backoff=backoff)
+	except Exception:
+		if cached is None:
+			raise
+		return cached["data"]
+	
+	save_msgpack_zlib_atomic(filename, {"t_cached" : time.time(), "data" : data})
+	
+	return data
+
+def load_keys(path_input, base_url=base_url):
 	
 	# if a list of topics doesn't exist, cache it
 	path_augmento_topics = "{:s}/topics.msgpack.zlib".format(path_input)
-	try:
+	if os.path.exists(path_augmento_topics):
 		with open(path_augmento_topics, "rb") as f:
-			augmento_topics = msgpack.unpackb(zlib.decompress(f.read()), encoding='utf-8')
-	except:
-		augmento_topics = requests.request("GET", "{:s}/topics".format(base_url), timeout=10).json()
-		with open(path_augmento_topics, "wb") as f:
-			f.write(zlib.compress(msgpack.packb(augmento_topics)))
+			augmento_topics = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+	else:
+		augmento_topics = request_json("{:s}/topics".format(base_url))
+		save_msgpack_zlib_atomic(path_augmento_topics, augmento_topics)
 	
 	return {v : int(k) for k, v in augmento_topics.items()}
 	
 
-def load_and_cache_data(path_output, source, coin, dt_bin_size, datetime_start, datetime_end):
+class TokenBucket():
 	
-	# make sure the start date and end date are rounded to the nearest day
-	datetime_start = dh.round_datetime_to_day_start(datetime_start)
-	datetime_end = dh.round_datetime_to_day_start(datetime_end)
+	# a thread safe token bucket, allowing bursts of up to capacity requests and rate requests per second
+	# on average (a rate of None means no limit)
+	def __init__(self, rate, capacity=1.0):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.t_last = time.monotonic()
+		self.lock = threading.Lock()
 	
-	# make sure the source exists
-	available_sources = requests.request("GET", "{:s}/sources".format(base_url), timeout=10).json()
-	if source not in available_sources:
-		raise Exception("invalid augmento source: {:s} not in: {:s}".format(*(source, available_sources)))
+	def acquire(self):
+		if self.rate is None:
+			return
+		while True:
+			with self.lock:
+				t_now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (t_now - self.t_last) * self.rate)
+				self.t_last = t_now
+				if self.tokens >= 1.0:
+					self.tokens -= 1.0
+					return
+				t_wait = (1.0 - self.tokens) / self.rate
+			time.sleep(t_wait)
+
+def request_json(url, params=None, rate_limiter=None, n_retries=5, backoff=1.0, timeout=10):
 	
-	# make sure the coin exists
-	available_coins = requests.request("GET", "{:s}/coins".format(base_url), timeout=10).json()
-	if coin not in available_coins:
-		raise Exception("invalid augmento coin: {:s} not in: {:s}".format(*(coin, available_coins)))
+	# make a get request on the shared session, retrying connection errors, rate limits (429) and
+	# server errors (5xx) with exponential backoff, other errors are raised straight away
+	for i_try in range(n_retries + 1):
+		
+		# wait for our turn
+		if rate_limiter is not None:
+			rate_limiter.acquire()
+		
+		# make the request
+		try:
+			r = get_session().get(url, params=params, timeout=timeout)
+		except requests.exceptions.RequestException as e:
+			error = e
+		else:
+			if r.status_code == 200:
+				return r.json()
+			error = Exception("api call failed with status_code {:d}".format(r.status_code))
+			if r.status_code != 429 and r.status_code < 500:
+				raise error
+		
+		# back off before trying again
+		if i_try < n_retries:
+			time.sleep(backoff * 2 ** i_try)
 	
-	# make sure the bin_size exists
-	available_bin_sizes = requests.request("GET", "{:s}/bin_sizes".format(base_url), timeout=10).json()
-	available_bin_sizes = {v : k for k, v in available_bin_sizes.items()}
-	if dt_bin_size not in available_bin_sizes:
-		raise Exception("invalid augmento bin_size: {:s} not in: {:s}".format(*(dt_bin_size, available_bin_sizes)))
+	raise error
+
+def split_datetime_range(datetime_start, datetime_end, n_days):
+	
+	# split [datetime_start, datetime_end) into consecutive sub-ranges of at most n_days
+	sub_ranges = []
+	temp_start = datetime_start
+	while temp_start < datetime_end:
+		temp_end = min(dh.add_days_to_datetime(temp_start, n_days), datetime_end)
+		sub_ranges.append((temp_start, temp_end))
+		temp_start = temp_end
+	return sub_ranges
+
+def load_aggregated_range(source, coin, bin_size_str, datetime_start, datetime_end, rate_limiter=None,
+                          count_ptr=1000, n_retries=5, backoff=1.0, base_url=base_url, dt_bin_size=None):
 	
 	# initialise a store for the data we're downloading
 	sentiment_data = []
-
+	t_end = dh.datetime_to_epoch(datetime_end)
+	
 	# define a start pointer to track multiple requests
 	start_ptr = 0
-	count_ptr = 1000
-
+	
 	# get the data
 	while start_ptr >= 0:
 		
@@ -61,7 +160,7 @@ def load_and_cache_data(path_output, source, coin, dt_bin_size, datetime_start,
 		params = {
 			"source" : source,
 			"coin" : coin,
-			"bin_size" : available_bin_sizes[dt_bin_size],
+			"bin_size" : bin_size_str,
 			"count_ptr" : count_ptr,
 			"start_ptr" : start_ptr,
 			"start_datetime" : datetime_start.strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -69,79 +168,358 @@ def load_and_cache_data(path_output, source, coin, dt_bin_size, datetime_start,
 		}
 		
 		# make the request
-		r = requests.request("GET", "{:s}/events/aggregated".format(base_url), params=params, timeout=10)
-		
-		# if the request was ok, add the data and increment the start_ptr
-		# else return an error
-		if r.status_code == 200:
-			temp_data = r.json()
-			start_ptr += count_ptr
-		else:
-			raise Exception("api call failed with status_code {:d}".format(r.status_code))
+		temp_data = request_json("{:s}/events/aggregated".format(base_url), params=params,
+		                         rate_limiter=rate_limiter, n_retries=n_retries, backoff=backoff)
+		start_ptr += len(temp_data)
 		
-		# if we didn't get any data, assume we've got all the data
+		# the server may cap its pages below count_ptr, so only an empty page, or (given dt_bin_size) a
+		# short page that reaches the last bin of the range, means we've got all the data
 		if len(temp_data) == 0:
 			start_ptr = -1
+		elif len(temp_data) < count_ptr and dt_bin_size is not None and temp_data[-1]["t_epoch"] + dt_bin_size >= t_end:
+			start_ptr = -1
 		
 		# extend the data store
 		sentiment_data.extend(temp_data)
-		
-		if len(temp_data) > 0:
-			# print the progress
-			str_print = "got augmento data from {:s} to {:s}".format(*(sentiment_data[0]["datetime"],
-			                                                         sentiment_data[-1]["datetime"],))
-			print(str_print)
-		
-		# sleep
-		time.sleep(2.0)
 	
-	# get datetimes for all datapoints
-	datetimes = [dh.epoch_to_datetime(el["t_epoch"]) for el in sentiment_data]
+	return sentiment_data
+
+def load_aggregated_data(source, coin, bin_size_str, dt_bin_size, datetime_start, datetime_end,
+                         n_workers=4, requests_per_second=0.5, rate_limiter=None, count_ptr=1000,
+                         n_retries=5, backoff=1.0, base_url=base_url):
 	
-	# get the starts of all the days
-	days = sorted(list(set([dh.round_datetime_to_day_start(el) for el in datetimes])))
+	# split the range into sub-ranges of whole days that fit in a single page each
+	n_days = max(1, (count_ptr * dt_bin_size) // 86400)
+	sub_ranges = split_datetime_range(datetime_start, datetime_end, n_days)
 	
-	# for each of the start dates, cache the data for that day
-	for day in days:
-		
-		# generate the output filename
-		output_filename_short = dh.datetime_to_str(day, timestamp_format_str="%Y%m%d")
-		output_filename = "{:s}/{:s}.msgpack.zlib".format(*(path_output, output_filename_short))
-		
-		# generate/filter the output data
-		temp_start = dh.datetime_to_epoch(day)
-		temp_end = dh.datetime_to_epoch(dh.add_days_to_datetime(day, 1))
-		
-		# get the data for this day (note that t_epoch is the OPEN time of the bin)
-		output_data = [el for el in sentiment_data if el["t_epoch"] >= temp_start and el["t_epoch"] < temp_end]
+	# share one rate limit between all the workers (unless we were given one to share more widely)
+	if rate_limiter is None:
+		rate_limiter = TokenBucket(requests_per_second)
+	
+	# download the sub-ranges concurrently
+	sentiment_data = []
+	with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+		futures = [executor.submit(load_aggregated_range, source, coin, bin_size_str, sr[0], sr[1],
+		                           rate_limiter=rate_limiter, count_ptr=count_ptr, n_retries=n_retries,
+		                           backoff=backoff, base_url=base_url, dt_bin_size=dt_bin_size) for sr in sub_ranges]
+		for future in concurrent.futures.as_completed(futures):
+			temp_data = future.result()
+			sentiment_data.extend(temp_data)
+			
+			if len(temp_data) > 0:
+				# print the progress
+				str_print = "got augmento data from {:s} to {:s}".format(*(temp_data[0]["datetime"],
+				                                                         temp_data[-1]["datetime"],))
+				print(str_print)
+	
+	# merge the sub-ranges in t_epoch order, dropping any duplicated bins
+	return merge_records(sentiment_data)
+
+def merge_records(*sentiment_datas):
+	
+	# merge lists of records into one, in t_epoch order, keeping the last of any duplicated bins
+	sentiment_data = sorted([el for sd in sentiment_datas for el in sd], key=lambda el : el["t_epoch"])
+	return [el for i_el, el in enumerate(sentiment_data)
+	        if i_el == len(sentiment_data) - 1 or el["t_epoch"] != sentiment_data[i_el+1]["t_epoch"]]
+
+def partition_data_by_day(sentiment_data):
+	
+	# split records sorted by t_epoch into (day start epoch, records) pairs in a single pass
+	# (note that t_epoch is the OPEN time of the bin)
+	if len(sentiment_data) == 0:
+		return []
+	t_epoch = np.array([el["t_epoch"] for el in sentiment_data], dtype=np.int64)
+	day_starts = np.unique(t_epoch - t_epoch % 86400)
+	i_bounds = np.append(np.searchsorted(t_epoch, day_starts, side="left"), t_epoch.shape[0])
+	return [(int(day_starts[i]), sentiment_data[i_bounds[i]:i_bounds[i+1]]) for i in range(day_starts.shape[0])]
+
+def cache_data_by_day(path_output, sentiment_data, n_workers=4, dt_bin_size=None, datetime_now=None, stale_days=3):
+	
+	# compress and write each day on a thread pool (zlib releases the gil), through temporary files
+	t_now = time.time() if datetime_now is None else dh.datetime_to_epoch(datetime_now)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+		futures = {}
+		for t_day, output_data in partition_data_by_day(sentiment_data):
+			
+			# generate the output filename
+			output_filename_short = dh.epoch_to_datetime_str(t_day, timestamp_format_str="%Y%m%d")
+			output_filename = "{:s}/{:s}.msgpack.zlib".format(*(path_output, output_filename_short))
+			
+			# a day is closed (and won't be fetched again) once it ended stale_days ago, so bins the api
+			# publishes late still make it into the cache, and at least once its last bin has ended
+			closed = t_day + 86400 + max(86400 * stale_days, dt_bin_size or 0) <= t_now
+			
+			futures[output_filename_short] = (executor.submit(save_msgpack_zlib_atomic, output_filename, output_data),
+			                                  [el["t_epoch"] for el in output_data], closed)
 		
-		# save the data
-		with open(output_filename, "wb") as f:
-			f.write(zlib.compress(msgpack.packb(output_data)))
+		# raise any errors, and get the manifest entries of the days we wrote
+		entries = {k : cmh.day_entry(v[1], v[0].result(), closed=v[2]) for k, v in futures.items()}
+	
+	# record the days in the dataset's manifest
+	if len(entries) > 0:
+		cmh.update_manifest(path_output, entries)
+	
+	# and keep the columnar cache up to date, if the dataset has one
+	if len(sentiment_data) > 0 and cch.has_columnar_data(path_output):
+		cch.write_columnar_data(path_output, cch.records_to_columns(sentiment_data, fields=["t_epoch", "counts"]))
+
+def get_bin_size_str(source, coin, dt_bin_size, n_retries=5, backoff=1.0, base_url=base_url,
+                     path_metadata=None, metadata_ttl=86400.0):
 
-def load_cached_data(path_input, datetime_start, datetime_end):
+	# get the available sources, coins and bin_sizes (from the metadata cache, if we have one)
+	available = {}
+	for name in ["sources", "coins", "bin_sizes"]:
+		if path_metadata is not None:
+			available[name] = load_metadata(path_metadata, name, ttl=metadata_ttl, n_retries=n_retries,
+			                                backoff=backoff, base_url=base_url)
+		else:
+			available[name] = request_json("{:s}/{:s}".format(*(base_url, name)), n_retries=n_retries,
+			                               backoff=backoff)
 	
-	# initialise the output data
-	output_data = []
+	# make sure the source exists
+	available_sources = available["sources"]
+	if source not in available_sources:
+		raise Exception("invalid augmento source: {:s} not in: {:s}".format(*(source, str(available_sources))))
+	
+	# make sure the coin exists
+	available_coins = available["coins"]
+	if coin not in available_coins:
+		raise Exception("invalid augmento coin: {:s} not in: {:s}".format(*(coin, str(available_coins))))
+	
+	# make sure the bin_size exists
+	available_bin_sizes = {v : k for k, v in available["bin_sizes"].items()}
+	if dt_bin_size not in available_bin_sizes:
+		raise Exception("invalid augmento bin_size: {:d} not in: {:s}".format(*(dt_bin_size, str(available_bin_sizes))))
+	
+	return available_bin_sizes[dt_bin_size]
+
+def load_and_cache_data(path_output, source, coin, dt_bin_size, datetime_start, datetime_end,
+                        n_workers=4, requests_per_second=0.5, rate_limiter=None, n_retries=5, backoff=1.0,
+                        base_url=base_url, path_metadata=None, metadata_ttl=86400.0, datetime_now=None,
+                        stale_days=3):
+	
+	# make sure the start date and end date are rounded to the nearest day
+	datetime_start = dh.round_datetime_to_day_start(datetime_start)
+	datetime_end = dh.round_datetime_to_day_start(datetime_end)
+	
+	# make sure the source, coin and bin_size exist
+	bin_size_str = get_bin_size_str(source, coin, dt_bin_size, n_retries=n_retries, backoff=backoff,
+	                                base_url=base_url, path_metadata=path_metadata, metadata_ttl=metadata_ttl)
+	
+	# get the data, in sub-ranges downloaded concurrently under a shared rate limit
+	sentiment_data = load_aggregated_data(source, coin, bin_size_str, dt_bin_size,
+	                                      datetime_start, datetime_end, n_workers=n_workers,
+	                                      requests_per_second=requests_per_second, rate_limiter=rate_limiter,
+	                                      n_retries=n_retries,
+	                                      backoff=backoff, base_url=base_url)
+	
+	# cache the data, one file per day
+	cache_data_by_day(path_output, sentiment_data, n_workers=n_workers, dt_bin_size=dt_bin_size,
+	                  datetime_now=datetime_now, stale_days=stale_days)
+
+def refresh_cached_data(path_output, source, coin, dt_bin_size, datetime_end, datetime_start=None,
+                        n_workers=4, requests_per_second=0.5, rate_limiter=None, n_retries=5, backoff=1.0,
+                        base_url=base_url, path_metadata=None, metadata_ttl=86400.0, datetime_now=None,
+                        stale_days=3):
+	
+	# find the last bin we have cached
+	manifest = cmh.load_manifest(path_output)
+	t_last = cmh.last_t_epoch(manifest)
+	if t_last is None:
+		raise Exception("no cached augmento data to refresh in {:s}".format(path_output))
+	
+	# we only need the bins after it, from the start of the range (older open days are left to be
+	# reloaded as a backfill, by update_cached_data)
+	datetime_from = dh.epoch_to_datetime(t_last + dt_bin_size)
+	if datetime_start is not None:
+		datetime_from = max(datetime_from, dh.round_datetime_to_day_start(datetime_start))
+	if datetime_from >= datetime_end:
+		return 0
+	
+	# make sure the source, coin and bin_size exist
+	bin_size_str = get_bin_size_str(source, coin, dt_bin_size, n_retries=n_retries, backoff=backoff,
+	                                base_url=base_url, path_metadata=path_metadata, metadata_ttl=metadata_ttl)
+	
+	# get the new data
+	sentiment_data = load_aggregated_data(source, coin, bin_size_str, dt_bin_size,
+	                                      datetime_from, datetime_end, n_workers=n_workers,
+	                                      requests_per_second=requests_per_second, rate_limiter=rate_limiter,
+	                                      n_retries=n_retries,
+	                                      backoff=backoff, base_url=base_url)
+	sentiment_data = [el for el in sentiment_data if el["t_epoch"] > t_last]
+	if len(sentiment_data) == 0:
+		return 0
+	
+	# merge it into the last (open) day if it continues it, closed days are never rewritten
+	last_day = dh.epoch_to_datetime_str(t_last, timestamp_format_str="%Y%m%d")
+	from_day = dh.datetime_to_str(datetime_from, timestamp_format_str="%Y%m%d")
+	if not manifest["days"][last_day]["closed"] and from_day == last_day:
+		input_filename = "{:s}/{:s}.msgpack.zlib".format(*(path_output, last_day))
+		open_data = list(msh.iter_msgpack_zlib_records(input_filename))
+		sentiment_data = merge_records(open_data, sentiment_data)
+	
+	# cache the data, one file per day
+	n_new = len(sentiment_data)
+	cache_data_by_day(path_output, sentiment_data, n_workers=n_workers, dt_bin_size=dt_bin_size,
+	                  datetime_now=datetime_now, stale_days=stale_days)
+	
+	return n_new
+
+def update_cached_data(path_output, source, coin, dt_bin_size, datetime_start, datetime_end, delta_refresh=True,
+                       stale_days=3, datetime_now=None, checksums=False, **kwargs):
+	
+	# check which days of data exist, from the dataset's manifest, dropping any whose files have gone
+	# missing or changed size since they were written (or with checksums, changed at all, which reads
+	# every file)
+	manifest = cmh.load_manifest(path_output)
+	bad_days = cmh.find_bad_days(path_output, manifest, datetime_start, datetime_end, checksums=checksums)
+	if len(bad_days) > 0:
+		manifest = cmh.remove_days(path_output, bad_days)
+	
+	# with delta_refresh, the last cached day is topped up with just the bins after the last one, and
+	# any other day left open (any that ended less than stale_days ago) is reloaded
+	t_last = cmh.last_t_epoch(manifest)
+	if delta_refresh and t_last is not None:
+		day_last = dh.round_datetime_to_day_start(dh.epoch_to_datetime(t_last))
+		open_days = cmh.find_open_days(manifest, datetime_before=day_last)
+		if len(open_days) > 0:
+			manifest = cmh.remove_days(path_output, open_days)
+		missing_batches = cmh.find_missing_ranges(manifest, datetime_start, min(datetime_end, day_last))
+	
+	# else reload the whole of the last stale_days
+	else:
+		datetime_stale = dh.add_days_to_datetime(datetime.datetime.now() if datetime_now is None else datetime_now,
+		                                         -stale_days)
+		datetime_stale = dh.round_datetime_to_day_start(datetime_stale, forward_days=1)
+		missing_batches = cmh.find_missing_ranges(manifest, datetime_start, datetime_end, datetime_stale=datetime_stale)
+	
+	# for each of the missing batches, get the data and cache it
+	for mb in missing_batches:
+		load_and_cache_data(path_output, source, coin, dt_bin_size, mb[0], dh.add_days_to_datetime(mb[-1], 1),
+		                    datetime_now=datetime_now, stale_days=stale_days, **kwargs)
+	
+	# then get the new data
+	if delta_refresh and t_last is not None:
+		refresh_cached_data(path_output, source, coin, dt_bin_size, datetime_end, datetime_start=datetime_start,
+		                    datetime_now=datetime_now, stale_days=stale_days, **kwargs)
+
+# the errors a corrupt (or unreadable) day file can raise while being decoded
+unreadable_errors = (ValueError, KeyError, TypeError, zlib.error, msgpack.ExtraData, msgpack.UnpackValueError, OSError)
+
+def load_cached_day(input_filename, fields, dtypes):
+	# decode a day file into its own block of arrays, or None if it's missing
+	try:
+		return msh.load_msgpack_zlib_arrays(input_filename, fields, dtypes=dtypes)
+	except FileNotFoundError:
+		return None
+
+def load_cached_days(path_input, datetime_start, datetime_end, fields=("t_epoch", "counts"), dtypes=None, n_workers=8):
 	
 	# get a list of the files we need to open
 	required_dates = dh.get_datetimes_between_datetimes(datetime_start, datetime_end)
+	input_filenames_short = [dh.datetime_to_str(rd, timestamp_format_str="%Y%m%d") for rd in required_dates]
 	
-	# go through all the dates and load the corrisponding files
-	for rd in required_dates:
-		
-		# load the file
-		input_filename_short = dh.datetime_to_str(rd, timestamp_format_str="%Y%m%d")
-		input_filename = "{:s}/{:s}.msgpack.zlib".format(*(path_input, input_filename_short))
+	# read and decode the files on a thread pool (zlib releases the gil), each into its own block
+	with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+		futures = [executor.submit(load_cached_day, "{:s}/{:s}.msgpack.zlib".format(*(path_input, el)), fields, dtypes)
+		           for el in input_filenames_short]
+	
+	# report the days that are missing (the api may not have data for every day) or unreadable
+	blocks = []
+	report = {"missing" : [], "unreadable" : []}
+	for input_filename_short, future in zip(input_filenames_short, futures):
 		try:
-			with open(input_filename, "rb") as f:
-				output_data.extend(msgpack.unpackb(zlib.decompress(f.read()), encoding='utf-8'))
-		except:
-			pass
+			block = future.result()
+		except unreadable_errors:
+			report["unreadable"].append(input_filename_short)
+			continue
+		if block is None:
+			report["missing"].append(input_filename_short)
+		elif block[fields[0]].shape[0] > 0:
+			blocks.append(block)
+	
+	# and concatenate the blocks once, in day order
+	if len(blocks) == 0:
+		output_data = {field : np.empty(0, dtype=np.float64) for field in fields}
+	else:
+		output_data = {field : np.concatenate([el[field] for el in blocks]) for field in fields}
+	
+	return output_data, report
+
+def load_cached_data(path_input, datetime_start, datetime_end, n_workers=8):
+	
+	# load the days, which must all be readable
+	output_data, report = load_cached_days(path_input, datetime_start, datetime_end, n_workers=n_workers)
+	if len(report["unreadable"]) > 0:
+		raise Exception("unreadable augmento cache files in {:s}: {:s}".format(*(path_input, ", ".join(report["unreadable"]))))
 	
 	# format the data
-	t_data = np.array([el["t_epoch"] for el in output_data], dtype=np.float64)
-	feat_data = np.array([el["counts"] for el in output_data], dtype=np.float64)
+	t_data = output_data["t_epoch"]
+	feat_data = output_data["counts"]
 	
 	return t_data, feat_data
 
+def augmento_dataset_path(path_augmento, source, coin, dt_bin_size):
+	return "{:s}/{:s}/{:s}/{:d}".format(*(path_augmento, source, coin, dt_bin_size))
+
+def make_time_grid(datetime_start, datetime_end, dt_bin_size):
+	# the open times of the bins in [datetime_start, datetime_end), from the first multiple of dt_bin_size
+	t_start = dh.datetime_to_epoch(datetime_start)
+	return tih.make_time_grid(t_start + (-t_start) % dt_bin_size, dh.datetime_to_epoch(datetime_end), dt_bin_size)
+
+def load_cached_data_on_grid(path_input, t_grid, output_data):
+	
+	# load the cached data covering the grid, writing each bin into its row of output_data (bins that
+	# aren't on the grid are ignored), and return the number of grid bins filled
+	datetime_start = dh.epoch_to_datetime(t_grid[0])
+	datetime_end = dh.epoch_to_datetime(t_grid[-1])
+	t_data, feat_data = load_cached_data(path_input, datetime_start, datetime_end)
+	if t_data.size == 0:
+		return 0
+	i_grid = tih.grid_positions(t_grid, t_data)
+	output_data[i_grid[i_grid >= 0]] = feat_data[i_grid >= 0]
+	return int(np.sum(i_grid >= 0))
+
+def load_augmento_universe(path_augmento, coins, sources, dt_bin_size, datetime_start, datetime_end,
+                          n_datasets=4, requests_per_second=0.5, fill_value=np.nan, delta_refresh=True, **kwargs):
+	
+	# the metadata is cached with the datasets, unless given another path
+	path_metadata = kwargs.pop("path_metadata", path_augmento)
+	
+	# load the topics, which fix the size of the last axis
+	aug_keys = load_keys(path_augmento, base_url=kwargs.get("base_url", base_url))
+	n_topics = max(aug_keys.values()) + 1
+	
+	# allocate the output, (coins x sources x time x topics) on a regular grid of bins
+	t_grid = make_time_grid(datetime_start, datetime_end, dt_bin_size)
+	aug_data = np.full((len(coins), len(sources), t_grid.shape[0], n_topics), fill_value, dtype=np.float64)
+	
+	def load_dataset(i_coin, i_source):
+		
+		# bring the dataset's cache up to date
+		path_dataset = augmento_dataset_path(path_augmento, sources[i_source], coins[i_coin], dt_bin_size)
+		os.makedirs(path_dataset, exist_ok=True)
+		update_cached_data(path_dataset, sources[i_source], coins[i_coin], dt_bin_size, datetime_start,
+		                   datetime_end, delta_refresh=delta_refresh, rate_limiter=rate_limiter,
+		                   path_metadata=path_metadata, **kwargs)
+		
+		# and copy it straight into its slice of the output
+		if t_grid.shape[0] > 0:
+			load_cached_data_on_grid(path_dataset, t_grid, aug_data[i_coin, i_source])
+	
+	# make sure all the coins and sources exist before downloading anything (which also fills the
+	# metadata cache once, rather than once per dataset)
+	for coin in coins:
+		for source in sources:
+			get_bin_size_str(source, coin, dt_bin_size, base_url=kwargs.get("base_url", base_url),
+			                 path_metadata=path_metadata)
+	
+	# update and load all the datasets concurrently, under one rate limit
+	rate_limiter = TokenBucket(requests_per_second)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=n_datasets) as executor:
+		futures = [executor.submit(load_dataset, i_coin, i_source)
+		           for i_coin in range(len(coins)) for i_source in range(len(sources))]
+		for future in futures:
+			future.result()
+	
+	return t_grid, aug_data, aug_keys
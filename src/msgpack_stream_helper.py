@@ -0,0 +1,122 @@
+import zlib
+import msgpack
+import numpy as np
+
+# stream .msgpack.zlib files (a msgpack array of records) straight into numpy arrays, decompressing and
+# unpacking one chunk at a time instead of building the full list of dicts
+
+
+class GrowableArray():
+
+	# an array of rows that can be appended to, doubling its capacity when it runs out of room
+	def __init__(self, dtype=np.float64, row_shape=None, capacity=1024):
+		self.dtype = dtype
+		self.row_shape = row_shape
+		self.capacity = capacity
+		self.n = 0
+		self.data = None
+		if row_shape is not None:
+			self.data = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+	
+	def __len__(self):
+		return self.n
+	
+	def reserve(self, capacity):
+		# make sure there's room for capacity rows in total (growing at least geometrically, so repeated
+		# reserves stay amortised O(1) per row)
+		if self.data is None:
+			self.capacity = max(1, capacity)
+		elif capacity > self.data.shape[0]:
+			capacity = max(capacity, 2 * self.data.shape[0])
+			data = np.empty((capacity,) + self.data.shape[1:], dtype=self.dtype)
+			data[:self.n] = self.data[:self.n]
+			self.data = data
+	
+	def append(self, value):
+		# the shape of the rows is set by the first row, if it wasn't given
+		if self.data is None:
+			self.row_shape = np.shape(value)
+			self.data = np.empty((self.capacity,) + self.row_shape, dtype=self.dtype)
+		if self.n == self.data.shape[0]:
+			self.reserve(self.n + 1)
+		self.data[self.n] = value
+		self.n += 1
+	
+	def truncate(self, n):
+		self.n = min(self.n, n)
+	
+	def to_array(self):
+		# a copy of the filled rows, so it doesn't keep the spare capacity alive, or change with later appends
+		if self.data is None:
+			return np.empty((0,) + tuple(self.row_shape or ()), dtype=self.dtype)
+		return self.data[:self.n].copy()
+
+def iter_msgpack_zlib_records(filename, chunk_size=65536, on_header=None):
+
+	# yield the records of a file one at a time, on_header is called with the number of records first
+	decompressor = zlib.decompressobj()
+	unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+	n_remaining = None
+	with open(filename, "rb") as f:
+		eof = False
+		while not eof:
+			
+			# feed the next decompressed chunk to the unpacker
+			chunk = f.read(chunk_size)
+			eof = len(chunk) == 0
+			unpacker.feed(decompressor.flush() if eof else decompressor.decompress(chunk))
+			
+			# and unpack as many records as it holds
+			while n_remaining != 0:
+				try:
+					if n_remaining is None:
+						n_remaining = unpacker.read_array_header()
+						if on_header is not None:
+							on_header(n_remaining)
+						continue
+					record = unpacker.unpack()
+				except msgpack.OutOfData:
+					break
+				n_remaining -= 1
+				yield record
+			
+			if n_remaining == 0:
+				return
+	
+	raise ValueError("truncated msgpack data in {:s}".format(filename))
+
+def decode_records_into(filename, arrays, chunk_size=65536):
+
+	# append the selected fields of every record in the file to arrays ({field : GrowableArray}),
+	# if the file can't be read, the arrays are left as they were and the error is raised
+	n_start = {field : len(arr) for field, arr in arrays.items()}
+	n_records = 0
+	
+	def reserve(n_header):
+		for field, arr in arrays.items():
+			arr.reserve(n_start[field] + n_header)
+	
+	try:
+		for record in iter_msgpack_zlib_records(filename, chunk_size=chunk_size, on_header=reserve):
+			for field, arr in arrays.items():
+				arr.append(record[field])
+			n_records += 1
+	except BaseException:
+		for field, arr in arrays.items():
+			arr.truncate(n_start[field])
+		raise
+	
+	return n_records
+
+def load_msgpack_zlib_arrays(filename, fields, dtypes=None, chunk_size=65536):
+
+	# load the selected fields of a file as {field : array}, the dtypes default to float64
+	dtypes = {} if dtypes is None else dtypes
+	arrays = {field : GrowableArray(dtype=dtypes.get(field, np.float64)) for field in fields}
+	decode_records_into(filename, arrays, chunk_size=chunk_size)
+	return {field : arr.to_array() for field, arr in arrays.items()}
+
+def load_msgpack_zlib(filename):
+	# load a whole (small) file, e.g. the topics
+	with open(filename, "rb") as f:
+		return msgpack.unpackb(zlib.decompress(f.read()), raw=False, strict_map_key=False)
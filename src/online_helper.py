@@ -0,0 +1,315 @@
+import collections
+import math
+import numpy as np
+
+
+# online versions of the causal kernels in analysis_helper, for live data arriving one bar at a time
+# each update is O(1), and does the same arithmetic in the same order as the batch kernel, so
+# replaying a history through a state gives exactly the same values as the batch kernel
+
+
+def safe_divide(a, b):
+	# as nb_safe_divide, for a single element
+	if b != 0.0:
+		return a / b
+	return 0.0
+
+def compensated_add(total, comp, value):
+	# as nb_compensated_add
+	new_total = total + value
+	if abs(total) >= abs(value):
+		comp += (total - new_total) + value
+	else:
+		comp += (value - new_total) + total
+	return new_total, comp
+
+
+class RollingAverageState():
+	# online nb_causal_rolling_average
+	
+	def __init__(self, window_size):
+		self.window_size = int(window_size)
+		self.n_updates = 0
+	
+	def update(self, x):
+		x = float(x)
+		
+		# the window starts out filled with copies of the first element
+		if self.n_updates == 0:
+			self.win_sum = 0.0
+			self.win_comp = 0.0
+			for i in range(self.window_size):
+				self.win_sum, self.win_comp = compensated_add(self.win_sum, self.win_comp, x)
+			self.window = [x] * self.window_size
+		
+		# add the new element and remove the oldest one (or a padding element)
+		i_w = self.n_updates % self.window_size
+		x_out = self.window[i_w]
+		self.window[i_w] = x
+		self.win_sum, self.win_comp = compensated_add(self.win_sum, self.win_comp, x)
+		self.win_sum, self.win_comp = compensated_add(self.win_sum, self.win_comp, -x_out)
+		self.n_updates += 1
+		
+		return (self.win_sum + self.win_comp) / self.window_size
+
+
+class RollingSdState():
+	# online nb_causal_rolling_sd
+	
+	def __init__(self, window_size):
+		self.window_size = int(window_size)
+		self.n_win = self.window_size - 1
+		self.n_updates = 0
+	
+	def update(self, x):
+		x = float(x)
+		
+		# nothing to standardise against with a window size of 1
+		if self.n_win < 1:
+			self.n_updates += 1
+			return math.nan
+		
+		# the window starts out filled with copies of the first element
+		if self.n_updates == 0:
+			self.win_mean = x
+			self.win_m2 = 0.0
+			self.n_run = self.n_win
+			self.last_x = x
+			self.window = [x] * self.n_win
+		
+		# standardise the new element by the mean and std of the window
+		if self.n_run >= self.n_win:
+			self.win_mean = self.last_x
+			self.win_m2 = 0.0
+		elif self.win_m2 < 0.0:
+			self.win_m2 = 0.0
+		
+		out = 0.0
+		num = x - self.win_mean
+		denom = math.sqrt(self.win_m2 / self.n_win)
+		if denom != 0.0:
+			out = num / denom
+		
+		# slide the window along
+		i_w = self.n_updates % self.n_win
+		x_out = self.window[i_w]
+		self.window[i_w] = x
+		old_mean = self.win_mean
+		self.win_mean = old_mean + (x - x_out) / self.n_win
+		self.win_m2 += (x - x_out) * (x - self.win_mean + x_out - old_mean)
+		
+		if x == self.last_x:
+			self.n_run += 1
+		else:
+			self.n_run = 1
+		self.last_x = x
+		self.n_updates += 1
+		
+		return out
+
+
+class RollingNormState():
+	# online nb_causal_rolling_norm
+	
+	def __init__(self, window_size):
+		self.window_size = int(window_size)
+		self.average = RollingAverageState(window_size)
+		self.max_queue = collections.deque()
+		self.min_queue = collections.deque()
+	
+	def update(self, x):
+		x = float(x)
+		i = self.average.n_updates
+		win_mean = self.average.update(x)
+		
+		# keep monotonic queues of the (index, value) of the window max and min
+		if len(self.max_queue) > 0 and self.max_queue[0][0] <= i - self.window_size:
+			self.max_queue.popleft()
+		while len(self.max_queue) > 0 and self.max_queue[-1][1] <= x:
+			self.max_queue.pop()
+		self.max_queue.append((i, x))
+		
+		if len(self.min_queue) > 0 and self.min_queue[0][0] <= i - self.window_size:
+			self.min_queue.popleft()
+		while len(self.min_queue) > 0 and self.min_queue[-1][1] >= x:
+			self.min_queue.pop()
+		self.min_queue.append((i, x))
+		
+		win_max = self.max_queue[0][1]
+		win_min = self.min_queue[0][1]
+		
+		# a constant window has no spread
+		if win_max == win_min:
+			return 0.0
+		
+		num = x - win_mean
+		denom = max(abs(win_max - win_mean), abs(win_min - win_mean))
+		if denom != 0.0:
+			return num / denom
+		return 0.0
+
+
+def update_many(update, *batches):
+	# call an update with a batch of bars (one array per argument), returning the output of each bar
+	return np.array([update(*args) for args in zip(*batches)], dtype=np.float64)
+
+
+# the online sentiment scores take one bar of the two sentiment signals at a time
+
+
+class SentimentScoreStateA():
+	# online nb_calc_sentiment_score_a
+	
+	def __init__(self, ra_win_size, std_win_size):
+		self.ratio_smooth = RollingAverageState(ra_win_size)
+		self.score = RollingSdState(std_win_size)
+	
+	def update(self, sent_a, sent_b):
+		sent_ratio = safe_divide(float(sent_a), float(sent_b))
+		return self.score.update(self.ratio_smooth.update(sent_ratio))
+	
+	def update_many(self, sent_a, sent_b):
+		return update_many(self.update, sent_a, sent_b)
+
+
+class SentimentScoreStateB():
+	# online nb_calc_sentiment_score_b
+	
+	def __init__(self, ra_win_size_short, ra_win_size_long):
+		self.ratio_short = RollingAverageState(ra_win_size_short)
+		self.ratio_long = RollingAverageState(ra_win_size_long)
+	
+	def update(self, sent_a, sent_b):
+		sent_ratio = safe_divide(float(sent_a), float(sent_b))
+		return self.ratio_short.update(sent_ratio) - self.ratio_long.update(sent_ratio)
+	
+	def update_many(self, sent_a, sent_b):
+		return update_many(self.update, sent_a, sent_b)
+
+
+class SentimentScoreStateC():
+	# online nb_calc_sentiment_score_c
+	
+	def __init__(self, ra_win_size, std_win_size):
+		self.ratio_smooth = RollingAverageState(ra_win_size)
+		self.score = RollingNormState(std_win_size)
+	
+	def update(self, sent_a, sent_b):
+		sent_ratio = safe_divide(float(sent_a), float(sent_b))
+		return self.score.update(self.ratio_smooth.update(sent_ratio))
+	
+	def update_many(self, sent_a, sent_b):
+		return update_many(self.update, sent_a, sent_b)
+
+
+def sign(x):
+	# as np.sign, for a single element
+	if math.isnan(x):
+		return x
+	return float((x > 0.0) - (x < 0.0))
+
+
+class BacktestState():
+	# base for the online backtests, which can be saved with snapshot() and picked up again with restore()
+	
+	state_keys = []
+	
+	def snapshot(self):
+		return {k : getattr(self, k) for k in self.state_keys}
+	
+	def restore(self, snapshot):
+		for k in self.state_keys:
+			setattr(self, k, snapshot[k])
+		return self
+
+
+class BacktestStateA(BacktestState):
+	# online nb_backtest_a, taking one price and sentiment score at a time and returning the pnl
+	
+	state_keys = ["start_pnl", "buy_sell_fee", "n_updates", "pnl", "last_price", "last_scores"]
+	n_sample_delay = 2
+	
+	def __init__(self, start_pnl, buy_sell_fee):
+		self.start_pnl = float(start_pnl)
+		self.buy_sell_fee = float(buy_sell_fee)
+		self.n_updates = 0
+		self.pnl = self.start_pnl
+		self.last_price = None
+		
+		# the last n_sample_delay sentiment scores, oldest first
+		self.last_scores = []
+	
+	def update(self, price, sent_score):
+		price = float(price)
+		
+		if self.n_updates > 0:
+			
+			# hold until we have a sentiment score from n_sample_delay samples ago,
+			# then go long, short, or (if the sentiment score is nan) drop to zero
+			if self.n_updates >= self.n_sample_delay:
+				if self.last_scores[0] > 0.0:
+					self.pnl = (price / self.last_price) * self.pnl
+				elif self.last_scores[0] <= 0.0:
+					self.pnl = (self.last_price / price) * self.pnl
+				else:
+					self.pnl = 0.0
+			
+			# simulate a trade fee if we cross from long to short, or visa versa
+			if self.n_updates > 1 and sign(self.last_scores[-1]) != sign(self.last_scores[-2]):
+				self.pnl = self.pnl - (self.buy_sell_fee * self.pnl)
+		
+		self.last_price = price
+		self.last_scores = (self.last_scores + [float(sent_score)])[-self.n_sample_delay:]
+		self.n_updates += 1
+		
+		return self.pnl
+	
+	def update_many(self, price, sent_score):
+		# append a batch of bars, returning the pnl of each bar
+		return update_many(self.update, price, sent_score)
+
+
+class SmaCrossoverBacktestState(BacktestState):
+	# online sma_crossover_backtest, taking one price and leading and lagging value at a time
+	# and returning the pnl
+	
+	state_keys = ["start_pnl", "buy_sell_fee", "threshold", "n_updates", "pnl", "last_price", "last_signals"]
+	
+	def __init__(self, start_pnl, buy_sell_fee, threshold=0.0):
+		self.start_pnl = float(start_pnl)
+		self.buy_sell_fee = float(buy_sell_fee)
+		self.threshold = float(threshold)
+		self.n_updates = 0
+		self.pnl = self.start_pnl
+		self.last_price = None
+		
+		# the last two signals (leading - lagging), oldest first
+		self.last_signals = []
+	
+	def update(self, price, leading, lagging):
+		price = float(price)
+		
+		if self.n_updates > 0:
+			
+			# go long or short if the last signal is above or below the threshold, else hold
+			# (and if the signal is nan, drop to zero)
+			if self.last_signals[-1] > self.threshold:
+				self.pnl = (price / self.last_price) * self.pnl
+			elif self.last_signals[-1] < self.threshold:
+				self.pnl = (self.last_price / price) * self.pnl
+			elif self.last_signals[-1] != self.threshold:
+				self.pnl = 0.0
+			
+			# simulate a trade fee if we cross from long to short, or visa versa
+			if self.n_updates > 1 and sign(self.last_signals[-1]) != sign(self.last_signals[-2]):
+				self.pnl = self.pnl - (self.buy_sell_fee * self.pnl)
+		
+		self.last_price = price
+		self.last_signals = (self.last_signals + [float(leading) - float(lagging)])[-2:]
+		self.n_updates += 1
+		
+		return self.pnl
+	
+	def update_many(self, price, leading, lagging):
+		# append a batch of bars, returning the pnl of each bar
+		return update_many(self.update, price, leading, lagging)
@@ -0,0 +1,120 @@
+import numpy as np
+
+# slicing sorted time series by time, and joining several onto a regular grid of bins (e.g. sentiment
+# counts and prices, which the backtests index by the same position), without leaving numpy
+
+gap_policies = ("drop", "ffill", "mask")
+
+def time_slice(t_data, t_min, t_max):
+	# the slice of sorted times in [t_min, t_max]
+	return slice(np.searchsorted(t_data, t_min, side="left"), np.searchsorted(t_data, t_max, side="right"))
+
+def strip_data_by_time(t_data, data, t_min, t_max):
+	# views of the sorted times, and their data, in [t_min, t_max]
+	s = time_slice(t_data, t_min, t_max)
+	return t_data[s], data[s]
+
+def make_time_grid(t_start, t_end, dt_bin_size):
+	# the bins in [t_start, t_end)
+	return np.arange(t_start, t_end, dt_bin_size, dtype=np.float64)
+
+def infer_bin_size(t_data):
+	# the smallest step between (sorted) times
+	dt = np.diff(t_data)
+	dt = dt[dt > 0]
+	if dt.shape[0] == 0:
+		raise Exception("can't infer a bin size from fewer than two distinct times")
+	return float(np.min(dt))
+
+def find_runs(flags):
+	# the [start, end) index ranges of runs of True in a boolean array
+	edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+	return np.stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)), axis=1)
+
+def grid_positions(t_grid, t_data):
+	# the position of each time on the grid, or -1 if it isn't on it
+	i_grid = np.searchsorted(t_grid, t_data)
+	on_grid = i_grid < t_grid.shape[0]
+	on_grid[on_grid] = t_grid[i_grid[on_grid]] == t_data[on_grid]
+	return np.where(on_grid, i_grid, -1)
+
+def align_to_grid(t_grid, t_data, data, fill_value=np.nan):
+
+	# copy the data onto the grid, returning it with a mask of the bins that have data (times that aren't
+	# on the grid are dropped, and the last of any duplicated time wins)
+	data = np.asarray(data)
+	i_grid = grid_positions(t_grid, t_data)
+	on_grid = i_grid >= 0
+	output_data = np.full((t_grid.shape[0],) + data.shape[1:], fill_value,
+	                      dtype=np.result_type(data.dtype, np.asarray(fill_value).dtype))
+	output_data[i_grid[on_grid]] = data[on_grid]
+	mask = np.zeros(t_grid.shape[0], dtype=np.bool_)
+	mask[i_grid[on_grid]] = True
+	report = {"n_samples" : int(t_data.shape[0]),
+	          "n_off_grid" : int(np.sum(~on_grid)),
+	          "n_duplicates" : int(np.sum(on_grid) - np.sum(mask))}
+	return output_data, mask, report
+
+def forward_fill(data, mask):
+	# fill each bin without data from the last bin with data (bins before the first stay as they are)
+	i_last = np.maximum.accumulate(np.where(mask, np.arange(mask.shape[0]), 0))
+	filled = mask.copy()
+	filled[np.argmax(mask):] = np.any(mask)
+	return data[i_last], filled
+
+def join_on_grid(t_grid, series, gap_policy="mask", fill_value=np.nan):
+
+	# join [(t_data, data), ...] onto the grid, filling the gaps as per gap_policy:
+	#     "drop" : only keep the bins where every series has data
+	#     "ffill" : carry each series' last value forward (the bins before any data are dropped)
+	#     "mask" : keep every bin, with fill_value in the gaps
+	# returns the times, the joined data, the mask of bins each series has (possibly filled) data for
+	# (series x time) and a report of the gaps in each series
+	if gap_policy not in gap_policies:
+		raise Exception("invalid gap policy: {:s} not in: {:s}".format(*(str(gap_policy), str(gap_policies))))
+	
+	output_datas, masks, reports = [], [], []
+	for t_data, data in series:
+		
+		# gaps are only kept with the mask policy, else keep the data's dtype
+		data = np.asarray(data)
+		fill = fill_value if gap_policy == "mask" else np.zeros((), dtype=data.dtype)
+		output_data, mask, report = align_to_grid(t_grid, t_data, data, fill_value=fill)
+		
+		# report the runs of missing bins, as [first, last] times
+		runs = find_runs(~mask)
+		report["n_missing"] = int(np.sum(~mask))
+		report["gaps"] = [(float(t_grid[el[0]]), float(t_grid[el[1] - 1])) for el in runs]
+		
+		if gap_policy == "ffill":
+			output_data, mask = forward_fill(output_data, mask)
+		
+		output_datas.append(output_data)
+		masks.append(mask)
+		reports.append(report)
+	
+	# keep the bins we need
+	masks = np.array(masks, dtype=np.bool_).reshape((len(series), t_grid.shape[0]))
+	keep = np.ones(t_grid.shape[0], dtype=np.bool_)
+	if gap_policy in ["drop", "ffill"]:
+		keep = np.all(masks, axis=0)
+	if not np.all(keep):
+		t_grid = t_grid[keep]
+		output_datas = [el[keep] for el in output_datas]
+		masks = masks[:, keep]
+	
+	return t_grid, output_datas, masks, reports
+
+def print_gap_reports(names, gap_reports):
+	# print any gaps found when joining series onto a grid
+	for name, gap_report in zip(names, gap_reports):
+		if gap_report["n_missing"] > 0 or gap_report["n_off_grid"] > 0:
+			str_print = "{:s} data has {:d} missing bins in {:d} gaps, and {:d} bins off the grid".format(*(name,
+			            gap_report["n_missing"], len(gap_report["gaps"]), gap_report["n_off_grid"]))
+			print(str_print)
+
+def check_aligned(*t_datas):
+	# make sure series line up bar for bar, before indexing them by the same position
+	for t_data in t_datas[1:]:
+		if t_data.shape != t_datas[0].shape or not np.array_equal(t_data, t_datas[0]):
+			raise Exception("time series are not aligned")
@@ -0,0 +1,231 @@
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import datetime
+import threading
+import urllib.parse
+import http.server
+import numpy as np
+
+# local stand-ins for the augmento rest and websocket apis, serving generated hourly data, for testing
+# the loaders and clients without the network
+
+
+class AugmentoStandIn():
+	
+	def __init__(self, datetime_start, n_hours, n_topics=93, seed=0):
+		rng = np.random.RandomState(seed)
+		t_start = int((datetime_start - datetime.datetime(1970, 1, 1)).total_seconds())
+		self.t_epoch = t_start + 3600 * np.arange(n_hours)
+		self.counts = rng.poisson(3.0, (n_hours, n_topics))
+		self.topics = {str(i) : "Topic {:d}".format(i) for i in range(n_topics)}
+		self.sources = ["bitcointalk", "reddit", "twitter"]
+		self.coins = ["bitcoin", "ethereum", "ripple"]
+		self.bin_sizes = {"1H" : 3600, "24H" : 86400}
+		
+		# bins from t_now on haven't happened yet (if set)
+		self.t_now = None
+		
+		# the requests made so far, as (path, params), and failures to inject before the next replies
+		self.requests = []
+		self.failures = []
+		self.connections = set()
+		
+		# seconds to wait before each reply (e.g. to test timeouts), and the most records in a page (if set)
+		self.delay = 0.
+		self.max_page = None
+		self.lock = threading.Lock()
+	
+	def records(self, source, coin, bin_size, datetime_start, datetime_end):
+		# the records for a request, which differ (a little) by source and coin
+		t_start = (datetime_start - datetime.datetime(1970, 1, 1)).total_seconds()
+		t_end = (datetime_end - datetime.datetime(1970, 1, 1)).total_seconds()
+		offset = self.sources.index(source) + 10 * self.coins.index(coin)
+		dt = self.bin_sizes[bin_size]
+		records = []
+		for t in range(int(t_start) - int(t_start) % dt, int(t_end), dt):
+			if t < t_start:
+				continue
+			in_bin = (self.t_epoch >= t) & (self.t_epoch < t + dt)
+			if self.t_now is not None:
+				in_bin &= self.t_epoch < self.t_now
+			if not np.any(in_bin):
+				continue
+			records.append({"t_epoch" : t,
+			                "datetime" : datetime.datetime.utcfromtimestamp(t).strftime("%Y-%m-%dT%H:%M:%SZ"),
+			                "counts" : [int(el) + offset for el in np.sum(self.counts[in_bin], axis=0)]})
+		return records
+	
+	def reply(self, path, params):
+		with self.lock:
+			self.requests.append((path, params))
+			if len(self.failures) > 0:
+				return self.failures.pop(0), None
+		
+		path = path.split("/v0.1/")[-1].strip("/")
+		if path.startswith("moved/"):
+			return 301, {"location" : "/v0.1/" + path[len("moved/"):]}
+		if path == "sources":
+			return 200, self.sources
+		if path == "coins":
+			return 200, self.coins
+		if path == "bin_sizes":
+			return 200, self.bin_sizes
+		if path == "topics":
+			return 200, self.topics
+		if path == "events/aggregated":
+			form = "%Y-%m-%dT%H:%M:%SZ"
+			records = self.records(params["source"], params["coin"], params["bin_size"],
+			                       datetime.datetime.strptime(params["start_datetime"], form),
+			                       datetime.datetime.strptime(params["end_datetime"], form))
+			start_ptr = int(params.get("start_ptr", 0))
+			count_ptr = int(params.get("count_ptr", 1000))
+			if self.max_page is not None:
+				count_ptr = min(count_ptr, self.max_page)
+			return 200, records[start_ptr : start_ptr + count_ptr]
+		return 404, {"error" : "not found"}
+	
+	def start(self):
+		stand_in = self
+		
+		class Handler(http.server.BaseHTTPRequestHandler):
+			
+			protocol_version = "HTTP/1.1"
+			
+			def do_GET(self):
+				stand_in.connections.add(self.client_address)
+				time.sleep(stand_in.delay)
+				url = urllib.parse.urlparse(self.path)
+				params = {k : v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+				status, data = stand_in.reply(url.path, params)
+				body = json.dumps(data).encode("utf-8")
+				
+				# a "truncated" failure announces more body than it sends, and drops the connection
+				truncated = status == "truncated"
+				if truncated:
+					status, body = 200, body[:-1]
+					self.close_connection = True
+				self.send_response(status)
+				self.send_header("Content-Type", "application/json")
+				self.send_header("Content-Length", str(len(body) + int(truncated)))
+				if status in [301, 302, 303, 307, 308]:
+					self.send_header("Location", data["location"])
+				self.end_headers()
+				self.wfile.write(body)
+			
+			def log_message(self, *args):
+				pass
+		
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+		self.server.daemon_threads = True
+		self.url = "http://127.0.0.1:{:d}/v0.1".format(self.server.server_address[1])
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+	
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+	
+	def count_requests(self, path):
+		return len([el for el in self.requests if el[0].endswith(path)])
+
+
+class AugmentoStreamStandIn(AugmentoStandIn):
+	
+	# a local stand-in for the augmento websocket api, pushing the hourly bars of the rest stand-in as
+	# they are published, run on the test's event loop
+	
+	def __init__(self, datetime_start, n_hours, n_topics=93, seed=0):
+		super().__init__(datetime_start, n_hours, n_topics=n_topics, seed=seed)
+		
+		# bars before t_live are published, and the subscriptions received so far (as dicts)
+		self.t_live = int(self.t_epoch[0])
+		self.subscriptions = []
+		self.writers = set()
+		self.published = None
+	
+	async def start(self):
+		self.published = asyncio.Condition()
+		self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+		self.url = "ws://127.0.0.1:{:d}/v0.1".format(self.server.sockets[0].getsockname()[1])
+		return self
+	
+	async def stop(self):
+		self.drop()
+		self.server.close()
+		await self.server.wait_closed()
+	
+	async def publish(self, n_bars=1):
+		# publish the next bars to the subscribers
+		async with self.published:
+			self.t_live += 3600 * n_bars
+			self.published.notify_all()
+	
+	def notify(self, text):
+		# send a text message that is not a bar to every connection
+		for writer in list(self.writers):
+			self.write_frame(writer, text.encode("utf-8"))
+	
+	def drop(self):
+		# drop every connection, without closing them cleanly
+		for writer in list(self.writers):
+			writer.transport.abort()
+	
+	async def handle(self, reader, writer):
+		self.writers.add(writer)
+		try:
+			
+			# answer the handshake
+			head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+			headers = {el.split(":", 1)[0].strip().lower() : el.split(":", 1)[1].strip() for el in head[1:] if ":" in el}
+			accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] +
+			                          "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode("ascii")).digest()).decode("ascii")
+			writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+			              "Sec-WebSocket-Accept: {:s}\r\n\r\n").format(accept).encode("latin-1"))
+			
+			# then push the bars after the subscription's since, as they are published
+			subscription = json.loads(await self.read_frame(reader))
+			self.subscriptions.append(subscription)
+			t_last = subscription.get("since", self.t_live - 3600)
+			while True:
+				async with self.published:
+					await self.published.wait_for(lambda : self.t_live > t_last + 3600)
+				records = self.records(subscription["source"], subscription["coin"], subscription["bin_size"],
+				                       datetime.datetime.utcfromtimestamp(t_last + 3600),
+				                       datetime.datetime.utcfromtimestamp(self.t_live))
+				for record in records:
+					record["t_sent"] = time.time()
+					self.write_frame(writer, json.dumps(record).encode("utf-8"))
+					t_last = record["t_epoch"]
+					await writer.drain()
+		except (OSError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			self.writers.discard(writer)
+			writer.close()
+	
+	async def read_frame(self, reader):
+		# client frames are masked
+		b0, b1 = await reader.readexactly(2)
+		n = b1 & 0x7F
+		if n == 126:
+			n = struct.unpack("!H", await reader.readexactly(2))[0]
+		elif n == 127:
+			n = struct.unpack("!Q", await reader.readexactly(8))[0]
+		mask = await reader.readexactly(4)
+		payload = await reader.readexactly(n)
+		return bytes([el ^ mask[i % 4] for i, el in enumerate(payload)])
+	
+	def write_frame(self, writer, payload):
+		n = len(payload)
+		if n < 126:
+			head = struct.pack("!BB", 0x81, n)
+		elif n < 65536:
+			head = struct.pack("!BBH", 0x81, 126, n)
+		else:
+			head = struct.pack("!BBQ", 0x81, 127, n)
+		writer.write(head + payload)
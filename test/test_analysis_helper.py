@@ -0,0 +1,366 @@
+import os
+import sys
+import unittest
+import numpy as np
+import numba as nb
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import analysis_helper as ah
+
+
+# reference versions of the rolling kernels, recomputing every window from scratch
+# (constant windows are given no spread, where the old kernels returned rounding noise)
+def ref_causal_rolling_average(arr, window_size):
+	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	return np.array([np.mean(new_arr[i : i + window_size]) for i in range(arr.shape[0])])
+
+def ref_causal_rolling_sd(arr, window_size):
+	out_arr = np.zeros(arr.shape[0])
+	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	for i in range(out_arr.shape[0]):
+		if np.ptp(new_arr[i : i + window_size-1]) == 0.0:
+			continue
+		num = new_arr[i+window_size-1] - np.mean(new_arr[i : i + window_size-1])
+		denom = np.std(new_arr[i : i + window_size-1])
+		if denom != 0.0:
+			out_arr[i] = num / denom
+	return out_arr
+
+def ref_causal_rolling_norm(arr, window_size):
+	out_arr = np.zeros(arr.shape[0])
+	new_arr = np.hstack((np.ones(window_size-1) * arr[0], arr))
+	for i in range(out_arr.shape[0]):
+		if np.ptp(new_arr[i : i + window_size]) == 0.0:
+			continue
+		num = new_arr[i+window_size-1] - np.mean(new_arr[i : i + window_size])
+		denom = np.max(np.abs(new_arr[i : i + window_size] - np.mean(new_arr[i : i + window_size])))
+		if denom != 0.0:
+			out_arr[i] = num / denom
+	return out_arr
+
+
+class TestRollingKernels(unittest.TestCase):
+	
+	def setUp(self):
+		# sentiment-like counts, with runs of zeros so we hit constant windows
+		rng = np.random.RandomState(0)
+		self.counts = rng.poisson(3.0, 3000).astype(np.float64)
+		self.counts[500:700] = 0.0
+		self.ratio = ah.nb_safe_divide(rng.poisson(5.0, 3000).astype(np.float64),
+		                               rng.poisson(4.0, 3000).astype(np.float64))
+		self.window_sizes = [2, 3, 24, 168, 5000]
+	
+	def test_rolling_average(self):
+		for arr in [self.counts, self.ratio]:
+			for w in self.window_sizes:
+				np.testing.assert_allclose(ah.nb_causal_rolling_average(arr, w),
+				                           ref_causal_rolling_average(arr, w), rtol=1e-10, atol=1e-12)
+	
+	def test_rolling_sd(self):
+		for arr in [self.counts, self.ratio]:
+			for w in self.window_sizes:
+				np.testing.assert_allclose(ah.nb_causal_rolling_sd(arr, w),
+				                           ref_causal_rolling_sd(arr, w), rtol=1e-7, atol=1e-9)
+				np.testing.assert_allclose(ah.moving_average(arr, w),
+				                           ref_causal_rolling_sd(arr, w), rtol=1e-7, atol=1e-9)
+	
+	def test_rolling_norm(self):
+		for arr in [self.counts, self.ratio]:
+			for w in self.window_sizes:
+				np.testing.assert_allclose(ah.nb_causal_rolling_norm(arr, w),
+				                           ref_causal_rolling_norm(arr, w), rtol=1e-9, atol=1e-9)
+	
+	def test_baseline_outputs(self):
+		# outputs of the original (O(n * window_size)) kernels, pinned
+		arr = np.array([1.0, 3.0, 2.0, 2.0, 5.0, 4.0, 4.0, 4.0, 0.0, 1.5])
+		np.testing.assert_allclose(ah.nb_causal_rolling_average(arr, 3),
+		                           [1.0, 1.6666666666666667, 2.0, 2.3333333333333335, 3.0, 3.6666666666666665,
+		                            4.333333333333333, 4.0, 2.6666666666666665, 1.8333333333333333], rtol=1e-12)
+		np.testing.assert_allclose(ah.nb_causal_rolling_sd(arr, 4),
+		                           [0.0, 0.0, 0.3535533905932737, 0.0, 5.65685424949238, 0.7071067811865475,
+		                            0.2672612419124245, -0.7071067811865469, 0.0, -0.618718433538229], rtol=1e-12, atol=1e-12)
+		np.testing.assert_array_equal(ah.nb_causal_rolling_sd(arr, 2), np.zeros(10))
+		np.testing.assert_allclose(ah.nb_causal_rolling_norm(arr, 3),
+		                           [0.0, 1.0, 0.0, -0.5000000000000003, 1.0, 0.2000000000000001,
+		                            -0.49999999999999933, 0.0, -1.0, -0.1538461538461538], rtol=1e-12, atol=1e-12)
+		
+		# a window of one element has nothing to standardise against
+		self.assertTrue(np.all(np.isnan(ah.nb_causal_rolling_sd(arr, 1))))
+		self.assertTrue(np.all(np.isnan(ah.nb_causal_rolling_sd_2d(np.stack((arr, arr)), 1))))
+	
+	def test_constant_windows(self):
+		# constant windows have no spread, whatever the value
+		arr = np.full(50, 0.1)
+		self.assertTrue(np.all(ah.nb_causal_rolling_sd(arr, 5) == 0.0))
+		self.assertTrue(np.all(ah.nb_causal_rolling_norm(arr, 5) == 0.0))
+	
+	def test_sentiment_scores(self):
+		a, b = self.counts, self.counts[::-1].copy()
+		ratio = ah.nb_safe_divide(a, b)
+		np.testing.assert_allclose(ah.nb_calc_sentiment_score_a(a, b, 24, 48),
+		                           ref_causal_rolling_sd(ref_causal_rolling_average(ratio, 24), 48),
+		                           rtol=1e-7, atol=1e-9)
+
+
+class TestRollingKernels2D(unittest.TestCase):
+	
+	def setUp(self):
+		# a topics x time matrix, transposed from time x topics like the notebooks do
+		rng = np.random.RandomState(1)
+		self.topics = rng.poisson(2.0, (1000, 12)).T.astype(float)
+	
+	def test_rows_match_1d(self):
+		w = 24
+		ratio = ah.nb_safe_divide_2d(self.topics, self.topics[::-1])
+		average = ah.nb_causal_rolling_average_2d(self.topics, w)
+		sd = ah.nb_causal_rolling_sd_2d(self.topics, w)
+		norm = ah.nb_causal_rolling_norm_2d(self.topics, w)
+		for i_r in range(self.topics.shape[0]):
+			row = self.topics[i_r].copy()
+			np.testing.assert_array_equal(ratio[i_r], ah.nb_safe_divide(row, self.topics[-1-i_r].copy()))
+			np.testing.assert_array_equal(average[i_r], ah.nb_causal_rolling_average(row, w))
+			np.testing.assert_array_equal(sd[i_r], ah.nb_causal_rolling_sd(row, w))
+			np.testing.assert_array_equal(norm[i_r], ah.nb_causal_rolling_norm(row, w))
+
+
+class TestSentimentPairSweep(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(2)
+		self.topics = rng.poisson(3.0, (600, 7)).T.astype(float)
+		self.price = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 600)))
+	
+	def test_backtest_final_matches_path(self):
+		price_up, price_down = ah.nb_price_ratios(self.price)
+		sent_score = ah.nb_calc_sentiment_score_a(self.topics[0], self.topics[1], 24, 24)
+		sent_score[300] = np.nan
+		for fee in [0.0, 0.0075]:
+			self.assertEqual(ah.nb_backtest_a_final(price_up, price_down, sent_score, 1.0, fee),
+			                 ah.nb_backtest_a(self.price, sent_score, 1.0, fee)[-1])
+	
+	def test_pairs_match_loop(self):
+		n_topics = self.topics.shape[0]
+		for score, calc_sentiment_score in [("a", ah.nb_calc_sentiment_score_a),
+		                                    ("b", ah.nb_calc_sentiment_score_b),
+		                                    ("c", ah.nb_calc_sentiment_score_c)]:
+			total = np.zeros((n_topics, n_topics))
+			for i in range(n_topics):
+				for j in range(n_topics):
+					sent_score = calc_sentiment_score(self.topics[i], self.topics[j], 12, 48)
+					total[i][j] = ah.nb_backtest_a(self.price, sent_score, 1.0, 0.0075)[-1]
+			
+			final_pnl, top_pairs, top_pnl = ah.sweep_sentiment_pairs(self.price, self.topics, 12, 48,
+			                                                         score=score, top_k=5)
+			np.testing.assert_array_equal(final_pnl, total)
+			
+			order = np.argsort(-total, axis=None, kind="stable")[:5]
+			np.testing.assert_array_equal(top_pairs, np.stack(np.unravel_index(order, total.shape), axis=1))
+			np.testing.assert_array_equal(top_pnl, total.ravel()[order])
+	
+	def test_top_k_larger_than_pairs(self):
+		final_pnl, top_pairs, top_pnl = ah.sweep_sentiment_pairs(self.price, self.topics[:2], 12, 48, top_k=10)
+		self.assertEqual(top_pairs.shape, (4, 2))
+		self.assertTrue(np.all(np.diff(top_pnl) <= 0.0))
+	
+	def test_windows_match_loop(self):
+		win_sizes_1 = np.array([2, 12, 24, 30])
+		win_sizes_2 = np.array([3, 24, 100])
+		for score, calc_sentiment_score in [("a", ah.nb_calc_sentiment_score_a),
+		                                    ("b", ah.nb_calc_sentiment_score_b),
+		                                    ("c", ah.nb_calc_sentiment_score_c)]:
+			total = np.zeros((win_sizes_1.shape[0], win_sizes_2.shape[0]))
+			for i in range(win_sizes_1.shape[0]):
+				for j in range(win_sizes_2.shape[0]):
+					sent_score = calc_sentiment_score(self.topics[0], self.topics[1], win_sizes_1[i], win_sizes_2[j])
+					total[i][j] = ah.nb_backtest_a(self.price, sent_score, 1.0, 0.0075)[-1]
+			
+			np.testing.assert_array_equal(ah.sweep_sentiment_windows(self.price, self.topics[0], self.topics[1],
+			                                                         win_sizes_1, win_sizes_2, score=score),
+			                              total)
+			
+			# or only where the first window is the shorter
+			np.testing.assert_array_equal(ah.sweep_sentiment_windows(self.price, self.topics[0], self.topics[1],
+			                                                         win_sizes_1, win_sizes_2, score=score,
+			                                                         shorter_first=True),
+			                              total * (win_sizes_1[:, None] < win_sizes_2[None, :]))
+
+
+class TestBacktestMetrics(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(2)
+		self.topics = rng.poisson(3.0, (600, 7)).T.astype(float)
+		self.price = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 600)))
+	
+	def test_backtest_batch_matches_paths(self):
+		sent_scores = np.array([ah.nb_calc_sentiment_score_b(self.topics[i], self.topics[-1-i], 6, 24)
+		                        for i in range(self.topics.shape[0])])
+		sent_scores[0, 100] = np.nan
+		buy_sell_fees = np.array([0.0, 0.001, 0.0075])
+		final_pnl, max_drawdown, turnover, n_trades = ah.nb_backtest_a_batch(self.price, sent_scores, 1.0, buy_sell_fees)
+		for i_s in range(sent_scores.shape[0]):
+			position = np.where(sent_scores[i_s, :-2] > 0.0, 1.0, -1.0)
+			self.assertEqual(n_trades[i_s], np.sum(np.sign(sent_scores[i_s, 1:-1]) != np.sign(sent_scores[i_s, :-2])))
+			if i_s > 0:
+				self.assertEqual(turnover[i_s], np.sum(np.abs(np.diff(position))))
+			for i_f in range(buy_sell_fees.shape[0]):
+				pnl = ah.nb_backtest_a(self.price, sent_scores[i_s], 1.0, buy_sell_fees[i_f])
+				peak = np.maximum.accumulate(pnl)
+				self.assertEqual(final_pnl[i_s, i_f], pnl[-1])
+				self.assertAlmostEqual(max_drawdown[i_s, i_f], np.max((peak - pnl) / peak))
+	
+	def test_pnl_metrics(self):
+		sent_scores = np.array([ah.nb_calc_sentiment_score_a(self.topics[i], self.topics[-1-i], 12, 24)
+		                        for i in range(self.topics.shape[0])])
+		pnl_paths = np.array([ah.nb_backtest_a(self.price, sent_score, 1.0, 0.0075) for sent_score in sent_scores])
+		metrics = ah.nb_pnl_metrics_2d(pnl_paths, sent_scores, 3600.0)
+		self.assertEqual(metrics.shape, (sent_scores.shape[0], len(ah.pnl_metric_names)))
+		np.testing.assert_array_equal(ah.nb_pnl_metrics_2d(pnl_paths, np.zeros((0, 0)), 3600.0)[:, :6], metrics[:, :6])
+		with self.assertRaises(ValueError):
+			ah.nb_pnl_metrics_2d(pnl_paths, sent_scores[:-1], 3600.0)
+		
+		for i_s in range(pnl_paths.shape[0]):
+			pnl = pnl_paths[i_s]
+			ret = pnl[1:] / pnl[:-1] - 1.0
+			peak = np.maximum.accumulate(pnl)
+			drawdown = (peak - pnl) / peak
+			i_max = np.argmax(drawdown)
+			i_peak = np.argmax(pnl[:i_max+1])
+			i_recover = np.nonzero(pnl[i_max:] >= peak[i_max])[0]
+			duration = i_max + i_recover[0] - i_peak if i_recover.shape[0] > 0 else pnl.shape[0] - 1 - i_peak
+			
+			expected = [pnl[-1] / pnl[0] - 1.0,
+			            np.mean(ret) / np.std(ret) * np.sqrt(365 * 24),
+			            np.mean(ret) / np.sqrt(np.mean(np.minimum(ret, 0.0) ** 2)) * np.sqrt(365 * 24),
+			            drawdown[i_max],
+			            duration,
+			            np.sum(ret > 0.0) / np.sum(ret != 0.0),
+			            np.sum(np.sign(sent_scores[i_s, 1:]) != np.sign(sent_scores[i_s, :-1]))]
+			np.testing.assert_allclose(metrics[i_s], expected, rtol=1e-9)
+
+
+
+# the original perturbed kernel, and a causal version of the perturbed sd, drawing from a seeded random state
+@nb.njit
+def ref_causal_rolling_norm_rand(arr, window_size_rand, peturb, seed):
+	np.random.seed(seed)
+	return ah.nb_causal_rolling_norm_rand(arr, window_size_rand, peturb)
+
+@nb.njit
+def ref_causal_rolling_sd_rand(arr, window_size_rand, seed):
+	np.random.seed(seed)
+	out_arr = np.zeros(arr.shape[0])
+	new_arr = np.hstack((np.ones(window_size_rand-1) * arr[0], arr))
+	for i in range(out_arr.shape[0]):
+		window_size = max(round(np.random.normal(window_size_rand, 1.0)), 2)
+		i_end = i + window_size_rand - 1
+		window = new_arr[max(i_end - window_size + 1, 0) : i_end]
+		if np.min(window) == np.max(window):
+			continue
+		out_arr[i] = (new_arr[i_end] - np.mean(window)) / np.std(window)
+	return out_arr
+
+
+class TestMonteCarlo(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(3)
+		self.sent_a = rng.poisson(3.0, 2000).astype(np.float64)
+		self.sent_b = rng.poisson(4.0, 2000).astype(np.float64)
+		self.sent_a[200:300] = 0.0
+		self.price = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 2000)))
+		self.seeds = np.array([11, 12, 13, 14], dtype=np.int64)
+	
+	def test_rand_paths_match_1d(self):
+		ratio = ah.nb_safe_divide(self.sent_a, self.sent_b)
+		norm_paths = ah.nb_causal_rolling_norm_rand_paths(ratio, 48, 0.1, self.seeds)
+		sd_paths = ah.nb_causal_rolling_sd_rand_paths(self.sent_a, 24, self.seeds)
+		for i_s in range(self.seeds.shape[0]):
+			np.testing.assert_allclose(norm_paths[i_s], ref_causal_rolling_norm_rand(ratio, 48, 0.1, self.seeds[i_s]),
+			                           rtol=1e-10, atol=1e-12)
+			np.testing.assert_allclose(sd_paths[i_s], ref_causal_rolling_sd_rand(self.sent_a, 24, self.seeds[i_s]),
+			                           rtol=1e-7, atol=1e-9)
+		
+		# windows drawn empty give nan, as in the original kernel
+		norm_paths = ah.nb_causal_rolling_norm_rand_paths(ratio, 4, 1.0, self.seeds)
+		self.assertTrue(np.all(np.any(np.isnan(norm_paths), axis=1)))
+		for i_s in range(self.seeds.shape[0]):
+			np.testing.assert_allclose(norm_paths[i_s], ref_causal_rolling_norm_rand(ratio, 4, 1.0, self.seeds[i_s]),
+			                           rtol=1e-10, atol=1e-12)
+	
+	def test_summary_matches_paths(self):
+		pnl_paths, final_pnl, max_drawdown, quantiles = ah.monte_carlo_sentiment_rand_a(
+			self.price, self.sent_a, self.sent_b, 48, 24, 0.1, 8, seed=1, window_peturb=0.05)
+		no_paths, final_pnl_b, max_drawdown_b, quantiles_b = ah.monte_carlo_sentiment_rand_a(
+			self.price, self.sent_a, self.sent_b, 48, 24, 0.1, 8, seed=1, window_peturb=0.05, keep_paths=False)
+		
+		self.assertEqual(pnl_paths.shape, (8, self.price.shape[0]))
+		self.assertIsNone(no_paths)
+		np.testing.assert_array_equal(pnl_paths[:, -1], final_pnl)
+		np.testing.assert_array_equal(final_pnl, final_pnl_b)
+		np.testing.assert_array_equal(max_drawdown, max_drawdown_b)
+		np.testing.assert_array_equal(quantiles, quantiles_b)
+		
+		peak = np.maximum.accumulate(pnl_paths, axis=1)
+		np.testing.assert_allclose(max_drawdown, np.max((peak - pnl_paths) / peak, axis=1))
+
+
+
+def ref_forward_volume(volume_data, price_data, threshold):
+	price_rate_change = np.zeros(len(price_data))
+	for i in range(len(volume_data)):
+		j = i+1
+		sum_volume = 0.0
+		while (sum_volume < threshold) & (j < len(price_rate_change)):
+			sum_volume += volume_data[j]
+			if sum_volume >= threshold:
+				price_rate_change[i] = (price_data[j]-price_data[i])/price_data[i]
+			j += 1
+	return price_rate_change
+
+
+class TestVolumeKernels(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(6)
+		self.volume = rng.poisson(1000.0, 2000).astype(np.float64)
+		self.volume[100:150] = 0.0
+		self.price = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 2000)))
+	
+	def test_forward_volume(self):
+		thresholds = np.array([0.0, 1.0, 1000.0, 25000.0, 1e9])
+		price_rate_change = ah.nb_forward_volume_2d(self.volume, self.price, thresholds)
+		self.assertEqual(price_rate_change.shape, (thresholds.shape[0], self.price.shape[0]))
+		for i_t in range(thresholds.shape[0]):
+			expected = ref_forward_volume(self.volume, self.price, thresholds[i_t])
+			np.testing.assert_array_equal(price_rate_change[i_t], expected)
+			np.testing.assert_array_equal(ah.forward_volume(self.volume, self.price, thresholds[i_t]), expected)
+
+	
+	def test_volume_normalized(self):
+		volume = self.volume[:1990]
+		norm_volume = ah.volume_normalized(volume, 24)
+		for start in range(0, volume.shape[0], 24):
+			block_volume = np.sum(volume[start:start+24])
+			np.testing.assert_allclose(norm_volume[start:start+24],
+			                           volume[start:start+24] / block_volume if block_volume != 0.0 else 0.0)
+		
+		volumes = np.array([volume, 2.0 * volume, np.zeros(volume.shape[0])])
+		np.testing.assert_allclose(ah.volume_normalized_2d(volumes, 24),
+		                           [norm_volume, norm_volume, np.zeros(volume.shape[0])])
+		
+		rolling_volume = ah.volume_normalized_2d(volume, 24, rolling=True)
+		for i in [0, 10, 23, 24, 1000, 1989]:
+			self.assertAlmostEqual(rolling_volume[i], volume[i] / np.sum(volume[max(i - 23, 0) : i + 1]))
+		
+		# an empty time axis gives an empty output, and blocks must have at least one sample
+		for rolling in [False, True]:
+			self.assertEqual(ah.volume_normalized_2d(np.zeros((3, 0)), 24, rolling=rolling).shape, (3, 0))
+			for n_hours in [0, -24]:
+				with self.assertRaises(ValueError):
+					ah.volume_normalized_2d(volumes, n_hours, rolling=rolling)
+
+
+if __name__ == '__main__':
+	unittest.main()
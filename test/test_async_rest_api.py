@@ -0,0 +1,122 @@
+import os
+import sys
+import asyncio
+import datetime
+import unittest
+import numpy as np
+
+# import the client from the root of the repo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from augmento_client import RequestAugmento, AsyncRequestAugmento
+from augmento_stand_in_server import AugmentoStandIn
+
+
+class TestAsyncRequestAugmento(unittest.TestCase):
+	
+	def setUp(self):
+		self.datetime_start = datetime.datetime(2019, 1, 1)
+		self.stand_in = AugmentoStandIn(self.datetime_start, 24 * 100).start()
+		self.url = self.stand_in.url + "/"
+	
+	def tearDown(self):
+		self.stand_in.stop()
+	
+	def run_client(self, coroutine, **kwargs):
+		# run a coroutine with a fresh client, closing it after
+		async def main():
+			async with AsyncRequestAugmento(url=self.url, logging_level="CRITICAL", backoff=0.01, **kwargs) as client:
+				return await coroutine(client)
+		return asyncio.run(main())
+	
+	def test_same_as_sync(self):
+		start, end = "2019-01-01T00:00:00Z", "2019-03-01T00:00:00Z"
+		sync_client = RequestAugmento(url=self.url, logging_level="CRITICAL")
+		
+		# the same data, frames and database as the synchronous client
+		async def requests(client):
+			return await asyncio.gather(client.get_data("reddit", "ripple", "1H", start, "2019-01-03T00:00:00Z"),
+			                            client.get_dataframe("reddit", "ripple", "1H", start, "2019-01-03T00:00:00Z"),
+			                            client.get_database("twitter", "bitcoin", "1H", start, end))
+		data, df, df_database = self.run_client(requests)
+		self.assertEqual(data, sync_client.get_data("reddit", "ripple", "1H", start, "2019-01-03T00:00:00Z"))
+		self.assertTrue(df.equals(sync_client.get_dataframe("reddit", "ripple", "1H", start, "2019-01-03T00:00:00Z")))
+		self.assertTrue(df_database.equals(sync_client.get_database("twitter", "bitcoin", "1H", start, end)))
+		self.assertEqual(df_database.shape[0], 24 * 59)
+		
+		# and the topics were only requested once per client, despite the concurrent requests
+		self.assertEqual(self.stand_in.count_requests("/topics"), 2)
+	
+	def test_limit_per_host(self):
+		# 10 concurrent requests over at most 3 (reused) connections
+		self.stand_in.delay = 0.05
+		async def requests(client):
+			await asyncio.gather(*[client.send_request("sources") for i in range(10)])
+			await client.send_request("coins")
+		self.run_client(requests, limit_per_host=3)
+		self.assertEqual(len(self.stand_in.requests), 11)
+		self.assertEqual(len(self.stand_in.connections), 3)
+	
+	def test_retries(self):
+		# transient failures are retried
+		self.stand_in.failures = [500, 429]
+		self.assertEqual(self.run_client(lambda client : client.send_request("sources")), self.stand_in.sources)
+		
+		# but only so many times
+		self.stand_in.failures = [503] * 3
+		n_requests = len(self.stand_in.requests)
+		with self.assertRaises(Exception):
+			self.run_client(lambda client : client.send_request("sources"), max_retries=2)
+		self.assertEqual(len(self.stand_in.requests), n_requests + 3)
+		
+		# and client errors are not retried
+		n_requests = len(self.stand_in.requests)
+		with self.assertRaises(Exception):
+			self.run_client(lambda client : client.send_request("missing"))
+		self.assertEqual(len(self.stand_in.requests), n_requests + 1)
+	
+	def test_queued_requests_not_timed_out(self):
+		# more pages than slots per host, each well within the timeout, but not all together
+		self.stand_in.delay = 0.4
+		start, end = "2019-01-01T00:00:00Z", "2019-04-10T00:00:00Z"
+		df = self.run_client(lambda client : client.get_database("twitter", "bitcoin", "1H", start, end),
+		                     limit_per_host=1, timeout=1., max_retries=0)
+		self.assertEqual(df.shape[0], 24 * 99)
+		self.assertEqual(self.stand_in.count_requests("/events/aggregated"), 3)
+	
+	def test_redirects(self):
+		# redirects are followed
+		self.assertEqual(self.run_client(lambda client : client.send_request("moved/coins")), self.stand_in.coins)
+		self.assertEqual(self.stand_in.count_requests("/coins"), 2)
+	
+	def test_event_loop(self):
+		# a client can't be used from another event loop until it is closed
+		client = AsyncRequestAugmento(url=self.url, logging_level="CRITICAL")
+		self.assertEqual(asyncio.run(client.send_request("coins")), self.stand_in.coins)
+		with self.assertRaises(RuntimeError):
+			asyncio.run(client.send_request("coins"))
+		client.close()
+		self.assertEqual(asyncio.run(client.send_request("coins")), self.stand_in.coins)
+		client.close()
+	
+	def test_timeout_and_cancellation(self):
+		# slow replies time out
+		self.stand_in.delay = 0.3
+		with self.assertRaises(asyncio.TimeoutError):
+			self.run_client(lambda client : client.send_request("sources"), timeout=0.05, max_retries=1)
+		
+		# and requests can be cancelled, leaving the client usable
+		async def requests(client):
+			task = asyncio.ensure_future(client.get_database("twitter", "bitcoin", "1H", "2019-01-01T00:00:00Z",
+			                                                 "2019-03-01T00:00:00Z"))
+			await asyncio.sleep(0.05)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			self.stand_in.delay = 0.
+			return await client.send_request("coins")
+		self.assertEqual(self.run_client(requests), self.stand_in.coins)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import datetime
+import unittest
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import cache_manifest_helper as cmh
+import load_augmento_data_helper as ladh
+import datetime_helper as dh
+
+
+def make_records(datetime_start, n_hours, n_topics=93, seed=0):
+	# hourly augmento-like records
+	rng = np.random.RandomState(seed)
+	t_start = dh.datetime_to_epoch(datetime_start)
+	return [{"t_epoch" : int(t_start + 3600 * i),
+	         "datetime" : dh.epoch_to_datetime_str(t_start + 3600 * i),
+	         "counts" : [int(el) for el in rng.poisson(3.0, n_topics)]} for i in range(n_hours)]
+
+
+class TestCacheManifest(unittest.TestCase):
+	
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		
+		# days 1-3 and 6-7 of january, with the last day partial
+		records = make_records(datetime.datetime(2019, 1, 1), 24 * 7 - 4)
+		self.records = [el for el in records if el["datetime"][8:10] not in ["04", "05"]]
+		ladh.cache_data_by_day(self.path, self.records)
+	
+	def tearDown(self):
+		shutil.rmtree(self.path)
+	
+	def test_manifest_entries(self):
+		manifest = cmh.load_manifest(self.path)
+		self.assertEqual(sorted(manifest["days"].keys()), ["20190101", "20190102", "20190103", "20190106", "20190107"])
+		self.assertEqual(manifest["days"]["20190107"]["n_records"], 20)
+		self.assertEqual(manifest["days"]["20190101"]["t_min"], dh.datetime_to_epoch(datetime.datetime(2019, 1, 1)))
+		self.assertEqual(manifest["days"]["20190101"]["t_max"], dh.datetime_to_epoch(datetime.datetime(2019, 1, 1, 23)))
+		
+		# a manifest built from the files alone (for older caches) matches the one the writer kept
+		os.remove(os.path.join(self.path, cmh.manifest_filename))
+		self.assertEqual(cmh.load_manifest(self.path), manifest)
+		self.assertTrue(os.path.exists(os.path.join(self.path, cmh.manifest_filename)))
+	
+	def test_find_missing_ranges(self):
+		manifest = cmh.load_manifest(self.path)
+		D = datetime.datetime
+		self.assertEqual(cmh.find_missing_ranges(manifest, D(2018, 12, 30), D(2019, 1, 9)),
+		                 [(D(2018, 12, 30), D(2018, 12, 31)), (D(2019, 1, 4), D(2019, 1, 5)), (D(2019, 1, 8), D(2019, 1, 9))])
+		self.assertEqual(cmh.find_missing_ranges(manifest, D(2019, 1, 2, 12), D(2019, 1, 3)), [])
+		
+		# stale days count as missing, joining the gap before them
+		self.assertEqual(cmh.find_missing_ranges(manifest, D(2019, 1, 1), D(2019, 1, 7), datetime_stale=D(2019, 1, 6)),
+		                 [(D(2019, 1, 4), D(2019, 1, 7))])
+		self.assertEqual(cmh.find_missing_ranges(manifest, D(2019, 1, 1), D(2019, 1, 7), datetime_stale=D(2019, 1, 7)),
+		                 [(D(2019, 1, 4), D(2019, 1, 5)), (D(2019, 1, 7), D(2019, 1, 7))])
+	
+	def test_find_bad_days(self):
+		manifest = cmh.load_manifest(self.path)
+		D = datetime.datetime
+		self.assertEqual(cmh.find_bad_days(self.path, manifest, D(2019, 1, 1), D(2019, 1, 7), checksums=True), [])
+		
+		# a truncated file, a deleted file, and a same-size corruption (which needs the checksums)
+		with open(os.path.join(self.path, "20190101.msgpack.zlib"), "rb+") as f:
+			f.truncate(10)
+		os.remove(os.path.join(self.path, "20190102.msgpack.zlib"))
+		with open(os.path.join(self.path, "20190103.msgpack.zlib"), "rb+") as f:
+			f.seek(20)
+			byte = f.read(1)
+			f.seek(20)
+			f.write(bytes([byte[0] ^ 0xff]))
+		self.assertEqual(cmh.find_bad_days(self.path, manifest, D(2019, 1, 1), D(2019, 1, 7)), ["20190101", "20190102"])
+		self.assertEqual(cmh.find_bad_days(self.path, manifest, D(2019, 1, 1), D(2019, 1, 7), checksums=True),
+		                 ["20190101", "20190102", "20190103"])
+		
+		# removed days become missing
+		manifest = cmh.remove_days(self.path, ["20190101", "20190102"])
+		self.assertEqual(cmh.find_missing_ranges(manifest, D(2019, 1, 1), D(2019, 1, 3)), [(D(2019, 1, 1), D(2019, 1, 2))])
+
+
+if __name__ == "__main__":
+	unittest.main()
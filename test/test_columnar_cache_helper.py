@@ -0,0 +1,131 @@
+import os
+import sys
+import shutil
+import tempfile
+import datetime
+import unittest
+import zlib
+import msgpack
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import columnar_cache_helper as cch
+import cache_manifest_helper as cmh
+import datetime_helper as dh
+import load_augmento_data_helper as ladh
+
+
+def make_records(datetime_start, n_hours, n_topics=93, seed=0):
+	# hourly augmento-like records
+	rng = np.random.RandomState(seed)
+	t_start = dh.datetime_to_epoch(datetime_start)
+	return [{"t_epoch" : int(t_start + 3600 * i),
+	         "datetime" : dh.epoch_to_datetime_str(t_start + 3600 * i),
+	         "counts" : [int(el) for el in rng.poisson(3.0, n_topics)]} for i in range(n_hours)]
+
+def write_day_files(path_output, records):
+	# write records as per-day .msgpack.zlib files, as load_and_cache_data does
+	os.makedirs(path_output, exist_ok=True)
+	days = {}
+	for el in records:
+		days.setdefault(dh.epoch_to_datetime_str(el["t_epoch"], "%Y%m%d"), []).append(el)
+	for day, day_records in days.items():
+		with open("{:s}/{:s}.msgpack.zlib".format(path_output, day), "wb") as f:
+			f.write(zlib.compress(msgpack.packb(day_records)))
+
+
+class TestColumnarCache(unittest.TestCase):
+	
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.path_dataset = "{:s}/augmento/twitter/bitcoin/3600".format(self.path)
+		self.records = make_records(datetime.datetime(2018, 12, 25), 24 * 14)
+		write_day_files(self.path_dataset, self.records)
+		with open("{:s}/augmento/topics.msgpack.zlib".format(self.path), "wb") as f:
+			f.write(zlib.compress(msgpack.packb({"0" : "Hacks"})))
+	
+	def tearDown(self):
+		shutil.rmtree(self.path)
+	
+	def test_migrate_and_load(self):
+		self.assertEqual(cch.migrate_msgpack_cache(self.path), [self.path_dataset])
+		self.assertEqual(cch.list_partitions(self.path_dataset), ["2018", "2019"])
+		
+		t_expected = np.array([el["t_epoch"] for el in self.records], dtype=np.float64)
+		counts_expected = np.array([el["counts"] for el in self.records], dtype=np.float64)
+		
+		# a range spanning both partitions
+		t_data, counts = cch.load_columnar_data(self.path_dataset, datetime.datetime(2018, 12, 25), datetime.datetime(2019, 1, 8))
+		np.testing.assert_array_equal(t_data, t_expected)
+		np.testing.assert_array_equal(counts, counts_expected)
+		
+		# a range in a single partition comes straight from the memory mapped file
+		t_data, counts = cch.load_columnar_data(self.path_dataset, datetime.datetime(2019, 1, 2), datetime.datetime(2019, 1, 3))
+		self.assertIsInstance(counts, np.memmap)
+		self.assertEqual(counts.shape, (24, 93))
+		np.testing.assert_array_equal(t_data, t_expected[8 * 24 : 9 * 24])
+	
+	def test_write_merges_partitions(self):
+		columns = cch.records_to_columns(self.records)
+		self.assertEqual(sorted(columns.keys()), ["counts", "t_epoch"])
+		cch.write_columnar_data(self.path_dataset, {k : v[:200] for k, v in columns.items()})
+		
+		# overlapping records replace the cached ones
+		update = {k : v[150:].copy() for k, v in columns.items()}
+		update["counts"][:50] = -1.0
+		cch.write_columnar_data(self.path_dataset, update)
+		
+		parts = cch.load_columnar_partitions(self.path_dataset, datetime.datetime(2018, 1, 1), datetime.datetime(2020, 1, 1))
+		t_data = np.concatenate([el["t_epoch"] for el in parts])
+		counts = np.concatenate([el["counts"] for el in parts])
+		np.testing.assert_array_equal(t_data, columns["t_epoch"])
+		self.assertTrue(np.all(counts[150:200] == -1.0))
+		np.testing.assert_array_equal(counts[:150], columns["counts"][:150])
+	
+	def test_partition_names(self):
+		t_epoch = np.array([el["t_epoch"] for el in self.records], dtype=np.float64)
+		names = cch.partition_names(t_epoch, partition_format="%Y%m")
+		self.assertEqual(list(names), [dh.epoch_to_datetime_str(el, "%Y%m") for el in t_epoch])
+	
+	def test_partition_swap(self):
+		cch.migrate_msgpack_cache(self.path)
+		path_columnar = "{:s}/{:s}".format(self.path_dataset, cch.columnar_folder)
+		
+		# a write that stopped between moving the old partition out and the new one in is rolled back,
+		# and the temporary folders of unfinished writes are ignored
+		os.rename("{:s}/2019".format(path_columnar), "{:s}/.2019.old".format(path_columnar))
+		os.makedirs("{:s}/.2018.abc".format(path_columnar))
+		np.save("{:s}/.2018.abc/t_epoch.npy".format(path_columnar), np.zeros(3))
+		self.assertEqual(cch.list_partitions(self.path_dataset), ["2018", "2019"])
+		t_data, counts = cch.load_columnar_data(self.path_dataset, datetime.datetime(2018, 12, 25), datetime.datetime(2019, 1, 8))
+		self.assertEqual(t_data.shape[0], len(self.records))
+		
+		# and merges replace the whole partition, with no temporary folder left behind
+		cch.write_columnar_data(self.path_dataset, cch.records_to_columns(self.records[-5:]))
+		self.assertEqual(sorted(os.listdir(path_columnar)), [".2018.abc", "2018", "2019"])
+	
+	def test_remove_msgpack(self):
+		# the removed day files are dropped from the manifest
+		self.assertEqual(len(cmh.load_manifest(self.path_dataset)["days"]), 14)
+		cch.migrate_msgpack_cache(self.path, remove_msgpack=True)
+		self.assertEqual(cmh.load_manifest(self.path_dataset)["days"], {})
+		self.assertEqual(cmh.load_manifest(self.path_dataset)["ranges"], [])
+	
+	def test_download_path_updates_columnar(self):
+		# once a dataset has a columnar cache, new data cached by day goes into it too
+		cch.migrate_msgpack_cache(self.path)
+		records = make_records(datetime.datetime(2019, 1, 8), 24 * 2, seed=1)
+		ladh.cache_data_by_day(self.path_dataset, records, dt_bin_size=3600)
+		t_data, counts = cch.load_columnar_data(self.path_dataset, datetime.datetime(2018, 12, 25), datetime.datetime(2019, 1, 10))
+		np.testing.assert_array_equal(t_data, [el["t_epoch"] for el in self.records + records])
+		np.testing.assert_array_equal(counts[-48:], [el["counts"] for el in records])
+		
+		# but datasets without one aren't given one
+		path_other = "{:s}/augmento/reddit/bitcoin/3600".format(self.path)
+		os.makedirs(path_other)
+		ladh.cache_data_by_day(path_other, records, dt_bin_size=3600)
+		self.assertEqual(cch.list_partitions(path_other), [])
+
+if __name__ == '__main__':
+	unittest.main()
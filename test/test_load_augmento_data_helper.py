@@ -0,0 +1,380 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import datetime
+import unittest
+import zlib
+import msgpack
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import load_augmento_data_helper as ladh
+import cache_manifest_helper as cmh
+import datetime_helper as dh
+from augmento_stand_in_server import AugmentoStandIn
+
+
+class TestAugmentoDownloader(unittest.TestCase):
+	
+	def setUp(self):
+		self.datetime_start = datetime.datetime(2019, 1, 1)
+		self.stand_in = AugmentoStandIn(self.datetime_start, 24 * 10).start()
+		self.path = tempfile.mkdtemp()
+	
+	def tearDown(self):
+		self.stand_in.stop()
+		shutil.rmtree(self.path)
+	
+	def test_concurrent_download_matches_sequential(self):
+		datetime_end = datetime.datetime(2019, 1, 9)
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", self.datetime_start, datetime_end)
+		
+		# one page per sub-range, and several pages per sub-range
+		for count_ptr in [24, 10]:
+			data = ladh.load_aggregated_data("twitter", "bitcoin", "1H", 3600, self.datetime_start, datetime_end,
+			                                 n_workers=4, requests_per_second=None, count_ptr=count_ptr,
+			                                 base_url=self.stand_in.url)
+			self.assertEqual(data, expected)
+		
+		# pages capped by the server below count_ptr
+		self.stand_in.max_page = 7
+		data = ladh.load_aggregated_data("twitter", "bitcoin", "1H", 3600, self.datetime_start, datetime_end,
+		                                 n_workers=4, requests_per_second=None, count_ptr=24,
+		                                 base_url=self.stand_in.url)
+		self.assertEqual(data, expected)
+		
+		# and a range that ends after the last bin the api has, which stops on an empty page
+		self.stand_in.max_page = None
+		self.stand_in.t_now = dh.datetime_to_epoch(datetime.datetime(2019, 1, 1, 20))
+		n_requests = self.stand_in.count_requests("/events/aggregated")
+		data = ladh.load_aggregated_range("twitter", "bitcoin", "1H", self.datetime_start, datetime.datetime(2019, 1, 2),
+		                                  count_ptr=24, base_url=self.stand_in.url, dt_bin_size=3600)
+		self.assertEqual(data, expected[:20])
+		self.assertEqual(self.stand_in.count_requests("/events/aggregated"), n_requests + 2)
+	
+	def test_retries_and_errors(self):
+		datetime_end = datetime.datetime(2019, 1, 3)
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", self.datetime_start, datetime_end)
+		
+		# transient failures are retried
+		self.stand_in.failures = [500, 429, 503]
+		data = ladh.load_aggregated_data("twitter", "bitcoin", "1H", 3600, self.datetime_start, datetime_end,
+		                                 n_workers=2, requests_per_second=None, count_ptr=24, backoff=0.01,
+		                                 base_url=self.stand_in.url)
+		self.assertEqual(data, expected)
+		
+		# but only so many times
+		self.stand_in.failures = [500] * 3
+		with self.assertRaises(Exception):
+			ladh.request_json("{:s}/sources".format(self.stand_in.url), n_retries=2, backoff=0.01)
+		
+		# and client errors are not retried at all
+		n_requests = len(self.stand_in.requests)
+		with self.assertRaises(Exception):
+			ladh.request_json("{:s}/missing".format(self.stand_in.url), n_retries=2, backoff=0.01)
+		self.assertEqual(len(self.stand_in.requests), n_requests + 1)
+	
+	def test_rate_limit(self):
+		rate_limiter = ladh.TokenBucket(20.0)
+		t_start = time.monotonic()
+		for i in range(11):
+			rate_limiter.acquire()
+		self.assertGreaterEqual(time.monotonic() - t_start, 0.45)
+	
+	def test_load_and_cache_data(self):
+		datetime_end = datetime.datetime(2019, 1, 5)
+		ladh.load_and_cache_data(self.path, "reddit", "ethereum", 3600, self.datetime_start, datetime_end,
+		                         requests_per_second=None, base_url=self.stand_in.url)
+		
+		expected = self.stand_in.records("reddit", "ethereum", "1H", self.datetime_start, datetime_end)
+		filenames = sorted([el for el in os.listdir(self.path) if el.endswith(".msgpack.zlib")])
+		self.assertEqual(filenames, ["2019010{:d}.msgpack.zlib".format(i) for i in range(1, 5)])
+		data = []
+		for filename in filenames:
+			with open(os.path.join(self.path, filename), "rb") as f:
+				data.extend(msgpack.unpackb(zlib.decompress(f.read()), raw=False))
+		self.assertEqual(data, expected)
+	
+	
+	def test_session_keep_alive(self):
+		# sequential requests share one pooled connection
+		ladh.get_session().close()
+		for i in range(5):
+			ladh.request_json("{:s}/sources".format(self.stand_in.url))
+		self.assertEqual(len(self.stand_in.connections), 1)
+	
+	def test_metadata_cache(self):
+		datetime_end = datetime.datetime(2019, 1, 2)
+		path_data = os.path.join(self.path, "data")
+		os.makedirs(path_data)
+		for i in range(3):
+			ladh.load_and_cache_data(path_data, "twitter", "bitcoin", 3600, self.datetime_start, datetime_end,
+			                         requests_per_second=None, base_url=self.stand_in.url,
+			                         path_metadata=self.path)
+		self.assertEqual(self.stand_in.count_requests("/sources"), 1)
+		self.assertEqual(self.stand_in.count_requests("/bin_sizes"), 1)
+		
+		# expired entries are refreshed, unless the api is down
+		self.assertEqual(ladh.load_metadata(self.path, "coins", ttl=0.0, base_url=self.stand_in.url),
+		                 self.stand_in.coins)
+		self.assertEqual(self.stand_in.count_requests("/coins"), 2)
+		self.stand_in.failures = [500] * 2
+		self.assertEqual(ladh.load_metadata(self.path, "coins", ttl=0.0, n_retries=1, backoff=0.01,
+		                                    base_url=self.stand_in.url), self.stand_in.coins)
+	
+	def test_load_keys(self):
+		keys = ladh.load_keys(self.path, base_url=self.stand_in.url)
+		self.assertEqual(keys, {v : int(k) for k, v in self.stand_in.topics.items()})
+		self.assertTrue(os.path.exists(os.path.join(self.path, "topics.msgpack.zlib")))
+		
+		# the cached topics are used from then on
+		self.assertEqual(ladh.load_keys(self.path, base_url=self.stand_in.url), keys)
+		self.assertEqual(self.stand_in.count_requests("/topics"), 1)
+	
+	
+	def test_cache_data_by_day(self):
+		# records with a missing day, and a partial last day
+		records = self.stand_in.records("twitter", "bitcoin", "1H", self.datetime_start, datetime.datetime(2019, 1, 8))
+		records = [el for el in records if not el["datetime"].startswith("2019-01-03")][:-5]
+		ladh.cache_data_by_day(self.path, records, n_workers=3)
+		
+		# every day holds exactly the records in that day, and nothing else was left behind
+		filenames = sorted([el for el in os.listdir(self.path) if el != "manifest.json"])
+		self.assertEqual(filenames, ["2019010{:d}.msgpack.zlib".format(i) for i in [1, 2, 4, 5, 6, 7]])
+		for filename in filenames:
+			with open(os.path.join(self.path, filename), "rb") as f:
+				data = msgpack.unpackb(zlib.decompress(f.read()), raw=False)
+			day = "{:s}-{:s}-{:s}".format(*(filename[:4], filename[4:6], filename[6:8]))
+			self.assertEqual(data, [el for el in records if el["datetime"].startswith(day)])
+		self.assertEqual(ladh.partition_data_by_day([]), [])
+	
+	
+	def test_delta_refresh(self):
+		D = datetime.datetime
+		
+		# the api has data up to 04:00 on the 3rd
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 3, 5))
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3, 5),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 3, 5))
+		manifest = cmh.load_manifest(self.path)
+		self.assertEqual([manifest["days"][el]["closed"] for el in ["20190101", "20190102", "20190103"]],
+		                 [True, True, False])
+		
+		# then up to 11:00 on the 5th, of which only the new bins are fetched, merged into the open day
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 5, 12))
+		n_requests = len(self.stand_in.requests)
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 5, 12),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 5, 12))
+		requests = [el[1] for el in self.stand_in.requests[n_requests:] if el[0].endswith("/events/aggregated")]
+		self.assertEqual(min([el["start_datetime"] for el in requests]), "2019-01-03T05:00:00Z")
+		
+		# the closed days weren't touched, and the cache now holds everything
+		manifest_new = cmh.load_manifest(self.path)
+		for day_str in ["20190101", "20190102"]:
+			self.assertEqual(manifest_new["days"][day_str], manifest["days"][day_str])
+		self.assertEqual([manifest_new["days"][el]["closed"] for el in ["20190103", "20190104", "20190105"]],
+		                 [True, True, False])
+		t_data, feat_data = ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 5))
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 6))
+		self.assertTrue(np.array_equal(t_data, [el["t_epoch"] for el in expected]))
+		self.assertTrue(np.array_equal(feat_data, [el["counts"] for el in expected]))
+		
+		# with nothing new, nothing is downloaded
+		n_requests = self.stand_in.count_requests("/events/aggregated")
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 5, 12),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 5, 12))
+		self.assertEqual(self.stand_in.count_requests("/events/aggregated"), n_requests)
+	
+	def test_delta_refresh_reloads_stale_days(self):
+		D = datetime.datetime
+		
+		# the days that ended less than stale_days ago are left open
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 3, 5))
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3, 5),
+		                        requests_per_second=None, base_url=self.stand_in.url, datetime_now=D(2019, 1, 3, 5))
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), ["20190101", "20190102", "20190103"])
+		
+		# so they're downloaded again, picking up any bins published late
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 5, 12))
+		n_requests = len(self.stand_in.requests)
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 5, 12),
+		                        requests_per_second=None, base_url=self.stand_in.url, datetime_now=D(2019, 1, 5, 12))
+		requests = [el[1] for el in self.stand_in.requests[n_requests:] if el[0].endswith("/events/aggregated")]
+		self.assertEqual(min([el["start_datetime"] for el in requests]), "2019-01-01T00:00:00Z")
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), ["20190102", "20190103", "20190104",
+		                                                                     "20190105"])
+		t_data, feat_data = ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 5))
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 6))
+		self.assertTrue(np.array_equal(t_data, [el["t_epoch"] for el in expected]))
+	
+	def test_delta_refresh_from_range_start(self):
+		D = datetime.datetime
+		
+		# a cache with an open day on the 3rd
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 3, 5))
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3, 5),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 3, 5))
+		
+		# a later range is fetched from its start, not from the open day
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 9, 12))
+		n_requests = len(self.stand_in.requests)
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 8, 6), D(2019, 1, 9, 12),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 9, 12))
+		requests = [el[1] for el in self.stand_in.requests[n_requests:] if el[0].endswith("/events/aggregated")]
+		self.assertEqual(min([el["start_datetime"] for el in requests]), "2019-01-08T00:00:00Z")
+		manifest = cmh.load_manifest(self.path)
+		self.assertEqual(sorted(manifest["days"].keys()), ["20190101", "20190102", "20190103", "20190108", "20190109"])
+		self.assertFalse(manifest["days"]["20190103"]["closed"])
+		
+		# and the open day is backfilled once a range covers it
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 9, 12),
+		                        requests_per_second=None, base_url=self.stand_in.url, stale_days=0,
+		                        datetime_now=D(2019, 1, 9, 12))
+		t_data, feat_data = ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 9))
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 10))
+		self.assertTrue(np.array_equal(t_data, [el["t_epoch"] for el in expected]))
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), ["20190109"])
+	
+	def test_bad_days_reloaded(self):
+		D = datetime.datetime
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3),
+		                        requests_per_second=None, base_url=self.stand_in.url)
+		
+		# a same-size corruption is only caught with the checksums, then the day is downloaded again
+		filename = os.path.join(self.path, "20190102.msgpack.zlib")
+		with open(filename, "rb+") as f:
+			f.seek(20)
+			byte = f.read(1)
+			f.seek(20)
+			f.write(bytes([byte[0] ^ 0xff]))
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3),
+		                        requests_per_second=None, base_url=self.stand_in.url)
+		self.assertIn("20190102", cmh.load_manifest(self.path)["days"])
+		n_requests = self.stand_in.count_requests("/events/aggregated")
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3),
+		                        requests_per_second=None, base_url=self.stand_in.url, checksums=True)
+		self.assertGreater(self.stand_in.count_requests("/events/aggregated"), n_requests)
+		t_data, feat_data = ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 3))
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 4))
+		self.assertTrue(np.array_equal(t_data, [el["t_epoch"] for el in expected]))
+		self.assertEqual(cmh.find_bad_days(self.path, cmh.load_manifest(self.path), D(2019, 1, 1), D(2019, 1, 3),
+		                                   checksums=True), [])
+	
+	def test_days_close_past_the_horizon(self):
+		D = datetime.datetime
+		
+		# a day whose last bins the api never returns
+		records = [el for el in self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 2))
+		           if el["t_epoch"] < dh.datetime_to_epoch(D(2019, 1, 1, 20))]
+		
+		# is open while they may still come, for stale_days after the day by default, as the api can
+		# publish bins late
+		for datetime_now in [D(2019, 1, 1, 21), D(2019, 1, 2, 1), D(2019, 1, 4, 23)]:
+			ladh.cache_data_by_day(self.path, records, dt_bin_size=3600, datetime_now=datetime_now)
+			self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), ["20190101"])
+		
+		# and closed after that, so it isn't downloaded again on every refresh
+		ladh.cache_data_by_day(self.path, records, dt_bin_size=3600, datetime_now=D(2019, 1, 5))
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), [])
+		
+		# without a grace period, it's closed once its last bin has ended
+		ladh.cache_data_by_day(self.path, records, dt_bin_size=3600, datetime_now=D(2019, 1, 2, 0, 30), stale_days=0)
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), ["20190101"])
+		ladh.cache_data_by_day(self.path, records, dt_bin_size=3600, datetime_now=D(2019, 1, 2, 1), stale_days=0)
+		self.assertEqual(cmh.find_open_days(cmh.load_manifest(self.path)), [])
+	
+	def test_load_cached_data_errors(self):
+		D = datetime.datetime
+		ladh.update_cached_data(self.path, "twitter", "bitcoin", 3600, D(2019, 1, 1), D(2019, 1, 3),
+		                        requests_per_second=None, base_url=self.stand_in.url)
+		
+		# missing days are skipped, unreadable ones raise
+		os.remove(os.path.join(self.path, "20190102.msgpack.zlib"))
+		t_data, feat_data = ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 3))
+		self.assertEqual(t_data.shape[0], 48)
+		with open(os.path.join(self.path, "20190103.msgpack.zlib"), "wb") as f:
+			f.write(b"not zlib")
+		with self.assertRaises(Exception):
+			ladh.load_cached_data(self.path, D(2019, 1, 1), D(2019, 1, 3))
+	
+	
+	def test_load_augmento_universe(self):
+		D = datetime.datetime
+		coins, sources = ["bitcoin", "ripple"], ["twitter", "reddit", "bitcointalk"]
+		
+		# the api has no data after 06:00 on the 4th
+		self.stand_in.t_now = dh.datetime_to_epoch(D(2019, 1, 4, 6))
+		t_grid, aug_data, aug_keys = ladh.load_augmento_universe(self.path, coins, sources, 3600,
+		                                                         D(2019, 1, 2), D(2019, 1, 4, 12),
+		                                                         n_datasets=3, requests_per_second=None,
+		                                                         base_url=self.stand_in.url)
+		self.assertEqual(aug_data.shape, (2, 3, 24 * 2 + 12, 93))
+		self.assertEqual(t_grid[0], dh.datetime_to_epoch(D(2019, 1, 2)))
+		self.assertTrue(np.all(np.diff(t_grid) == 3600))
+		self.assertEqual(len(aug_keys), 93)
+		
+		# each slice matches its dataset, with nans where there's no data
+		for i_coin, coin in enumerate(coins):
+			for i_source, source in enumerate(sources):
+				expected = self.stand_in.records(source, coin, "1H", D(2019, 1, 2), D(2019, 1, 4, 12))
+				self.assertTrue(np.array_equal(aug_data[i_coin, i_source, :len(expected)],
+				                               [el["counts"] for el in expected]))
+				self.assertTrue(np.all(np.isnan(aug_data[i_coin, i_source, len(expected):])))
+				self.assertTrue(os.path.exists(ladh.augmento_dataset_path(self.path, source, coin, 3600)))
+		
+		# the metadata was only fetched once, for all the datasets
+		self.assertEqual(self.stand_in.count_requests("/sources"), 1)
+		
+		# datasets with no data in the range are left as fill_value, and the metadata can be cached elsewhere
+		path_metadata = os.path.join(self.path, "metadata")
+		os.makedirs(path_metadata)
+		t_grid, aug_data, aug_keys = ladh.load_augmento_universe(self.path, coins, sources, 3600,
+		                                                         D(2019, 1, 5), D(2019, 1, 6),
+		                                                         n_datasets=3, requests_per_second=None,
+		                                                         base_url=self.stand_in.url, path_metadata=path_metadata)
+		self.assertEqual(aug_data.shape, (2, 3, 24, 93))
+		self.assertTrue(np.all(np.isnan(aug_data)))
+		self.assertEqual(self.stand_in.count_requests("/sources"), 2)
+	
+	
+	def test_load_cached_days(self):
+		D = datetime.datetime
+		records = self.stand_in.records("twitter", "bitcoin", "1H", D(2019, 1, 1), D(2019, 1, 9))
+		ladh.cache_data_by_day(self.path, records)
+		
+		# a missing day and unreadable ones: not zlib, valid zlib of bad msgpack or of the wrong records,
+		# and a path that can't be read
+		os.remove(os.path.join(self.path, "20190103.msgpack.zlib"))
+		for day, contents in [("05", b"not zlib"), ("06", zlib.compress(b"\xc1\xc1")), ("07", zlib.compress(msgpack.packb([1, 2])))]:
+			with open(os.path.join(self.path, "201901{:s}.msgpack.zlib".format(day)), "wb") as f:
+				f.write(contents)
+		os.remove(os.path.join(self.path, "20190108.msgpack.zlib"))
+		os.makedirs(os.path.join(self.path, "20190108.msgpack.zlib"))
+		output_data, report = ladh.load_cached_days(self.path, D(2019, 1, 1), D(2019, 1, 10), n_workers=3,
+		                                            fields=("t_epoch", "counts"),
+		                                            dtypes={"counts" : np.int32})
+		self.assertEqual(report, {"missing" : ["20190103", "20190109", "20190110"],
+		                          "unreadable" : ["20190105", "20190106", "20190107", "20190108"]})
+		
+		# the rest are concatenated in order, in their own dtypes
+		expected = [el for el in records if el["datetime"][:10] in ["2019-01-01", "2019-01-02", "2019-01-04"]]
+		self.assertTrue(np.array_equal(output_data["t_epoch"], [el["t_epoch"] for el in expected]))
+		self.assertTrue(np.array_equal(output_data["counts"], [el["counts"] for el in expected]))
+		self.assertEqual(output_data["counts"].dtype, np.int32)
+		
+		# nothing to load gives empty arrays
+		output_data, report = ladh.load_cached_days(self.path, D(2020, 1, 1), D(2020, 1, 2))
+		self.assertEqual(output_data["t_epoch"].shape, (0,))
+
+
+if __name__ == "__main__":
+	unittest.main()
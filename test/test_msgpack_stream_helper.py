@@ -0,0 +1,101 @@
+import os
+import sys
+import shutil
+import tempfile
+import datetime
+import unittest
+import zlib
+import msgpack
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import msgpack_stream_helper as msh
+import load_augmento_data_helper as ladh
+import datetime_helper as dh
+
+
+def make_records(datetime_start, n_hours, n_topics=93, seed=0):
+	# hourly augmento-like records, with bitmex-like prices
+	rng = np.random.RandomState(seed)
+	t_start = dh.datetime_to_epoch(datetime_start)
+	return [{"t_epoch" : int(t_start + 3600 * i),
+	         "datetime" : dh.epoch_to_datetime_str(t_start + 3600 * i),
+	         "counts" : [int(el) for el in rng.poisson(3.0, n_topics)],
+	         "close" : float(rng.uniform(3000.0, 4000.0))} for i in range(n_hours)]
+
+def write_file(filename, data):
+	with open(filename, "wb") as f:
+		f.write(zlib.compress(msgpack.packb(data)))
+
+
+class TestMsgpackStream(unittest.TestCase):
+	
+	def setUp(self):
+		self.path = tempfile.mkdtemp()
+		self.records = make_records(datetime.datetime(2019, 1, 1), 24 * 5)
+		self.filename = os.path.join(self.path, "data.msgpack.zlib")
+		write_file(self.filename, self.records)
+	
+	def tearDown(self):
+		shutil.rmtree(self.path)
+	
+	def test_matches_unpackb(self):
+		# tiny chunks split records (and the array header) across feeds
+		for chunk_size in [7, 1000, 65536]:
+			data = msh.load_msgpack_zlib_arrays(self.filename, ["t_epoch", "counts", "close"],
+			                                    dtypes={"counts" : np.int32}, chunk_size=chunk_size)
+			self.assertEqual(data["counts"].dtype, np.int32)
+			self.assertTrue(np.array_equal(data["t_epoch"], [el["t_epoch"] for el in self.records]))
+			self.assertTrue(np.array_equal(data["counts"], [el["counts"] for el in self.records]))
+			self.assertTrue(np.array_equal(data["close"], [el["close"] for el in self.records]))
+		
+		# only the selected fields are extracted
+		data = msh.load_msgpack_zlib_arrays(self.filename, ["close"])
+		self.assertEqual(list(data.keys()), ["close"])
+		
+		# empty files give empty arrays
+		write_file(self.filename, [])
+		self.assertEqual(msh.load_msgpack_zlib_arrays(self.filename, ["close"])["close"].shape, (0,))
+	
+	def test_growable_array(self):
+		arr = msh.GrowableArray(capacity=1)
+		for i in range(100):
+			arr.append([i, -i])
+		self.assertEqual(arr.to_array().shape, (100, 2))
+		self.assertTrue(np.array_equal(arr.to_array()[:, 1], -np.arange(100)))
+		
+		# the array owns its rows, the buffer can still be appended to
+		out = arr.to_array()
+		self.assertIsNone(out.base)
+		arr.truncate(10)
+		self.assertEqual(len(arr), 10)
+		arr.append([0, 0])
+		self.assertEqual(out[10, 0], 10)
+	
+	def test_truncated_file(self):
+		# a truncated file raises, and leaves the arrays it was decoding into untouched
+		arrays = {"t_epoch" : msh.GrowableArray(), "counts" : msh.GrowableArray()}
+		self.assertEqual(msh.decode_records_into(self.filename, arrays), len(self.records))
+		with open(self.filename, "rb") as f:
+			compressed = f.read()
+		filename_truncated = os.path.join(self.path, "truncated.msgpack.zlib")
+		with open(filename_truncated, "wb") as f:
+			f.write(compressed[:len(compressed) // 2])
+		with self.assertRaises(ValueError):
+			msh.decode_records_into(filename_truncated, arrays, chunk_size=100)
+		self.assertEqual(len(arrays["t_epoch"]), len(self.records))
+		self.assertEqual(len(arrays["counts"]), len(self.records))
+	
+	def test_load_cached_data(self):
+		path_data = os.path.join(self.path, "cache")
+		os.makedirs(path_data)
+		ladh.cache_data_by_day(path_data, self.records)
+		t_data, feat_data = ladh.load_cached_data(path_data, datetime.datetime(2019, 1, 2), datetime.datetime(2019, 1, 3))
+		expected = [el for el in self.records if el["datetime"][:10] in ["2019-01-02", "2019-01-03"]]
+		self.assertTrue(np.array_equal(t_data, [el["t_epoch"] for el in expected]))
+		self.assertTrue(np.array_equal(feat_data, [el["counts"] for el in expected]))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import analysis_helper as ah
+import online_helper as oh
+
+
+class TestOnlineSentimentScores(unittest.TestCase):
+	
+	def setUp(self):
+		# sentiment-like counts, with runs of zeros so we hit constant windows and zero divisions
+		rng = np.random.RandomState(4)
+		self.sent_a = rng.poisson(3.0, 3000).astype(np.float64)
+		self.sent_b = rng.poisson(2.0, 3000).astype(np.float64)
+		self.sent_a[400:600] = 0.0
+		self.sent_b[1000:1100] = 0.0
+	
+	def test_scores_match_batch(self):
+		for win_sizes in [(2, 2), (24, 168), (168, 24), (5000, 3), (24, 1)]:
+			for state, calc_sentiment_score in [(oh.SentimentScoreStateA(*win_sizes), ah.nb_calc_sentiment_score_a),
+			                                    (oh.SentimentScoreStateB(*win_sizes), ah.nb_calc_sentiment_score_b),
+			                                    (oh.SentimentScoreStateC(*win_sizes), ah.nb_calc_sentiment_score_c)]:
+				np.testing.assert_array_equal(state.update_many(self.sent_a, self.sent_b),
+				                              calc_sentiment_score(self.sent_a, self.sent_b, *win_sizes))
+	
+	def test_rolling_states_match_batch(self):
+		ratio = ah.nb_safe_divide(self.sent_a, self.sent_b)
+		for state, rolling_kernel in [(oh.RollingAverageState(48), ah.nb_causal_rolling_average),
+		                              (oh.RollingSdState(48), ah.nb_causal_rolling_sd),
+		                              (oh.RollingNormState(48), ah.nb_causal_rolling_norm)]:
+			np.testing.assert_array_equal([state.update(x) for x in ratio], rolling_kernel(ratio, 48))
+
+
+class TestOnlineBacktests(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(5)
+		self.price = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 2000)))
+		self.sent_score = ah.nb_calc_sentiment_score_a(rng.poisson(3.0, 2000).astype(np.float64),
+		                                               rng.poisson(3.0, 2000).astype(np.float64), 24, 48)
+		self.sent_score[1500] = np.nan
+		self.leading = ah.nb_causal_rolling_average(self.price, 12)
+		self.lagging = ah.nb_causal_rolling_average(self.price, 48)
+	
+	def test_backtest_a_matches_batch(self):
+		state = oh.BacktestStateA(1.0, 0.0075)
+		pnl = [state.update(self.price[i], self.sent_score[i]) for i in range(1000)]
+		
+		# save and restore the state part way through, then bulk append the rest
+		state = oh.BacktestStateA(0.0, 0.0).restore(state.snapshot())
+		pnl.extend(state.update_many(self.price[1000:], self.sent_score[1000:]))
+		
+		np.testing.assert_array_equal(pnl, ah.nb_backtest_a(self.price, self.sent_score, 1.0, 0.0075))
+	
+	def test_sma_crossover_matches_batch(self):
+		state = oh.SmaCrossoverBacktestState(1.0, 0.0075, threshold=0.1)
+		np.testing.assert_array_equal(state.update_many(self.price, self.leading, self.lagging),
+		                              ah.sma_crossover_backtest(self.price, self.leading, self.lagging, 1.0, 0.0075, 0.1))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import shutil
+import tempfile
+import datetime
+import unittest
+import numpy as np
+
+# import the client from the root of the repo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from augmento_client import RequestAugmento
+from augmento_stand_in_server import AugmentoStandIn
+
+
+class TestRequestAugmento(unittest.TestCase):
+	
+	def setUp(self):
+		self.datetime_start = datetime.datetime(2019, 1, 1)
+		self.stand_in = AugmentoStandIn(self.datetime_start, 24 * 100).start()
+		self.client = RequestAugmento(url=self.stand_in.url + "/", logging_level="CRITICAL", backoff=0.01)
+	
+	def tearDown(self):
+		self.stand_in.stop()
+	
+	def test_get_database(self):
+		start, end = "2019-01-01T00:00:00Z", "2019-03-01T00:00:00Z"
+		
+		# pages are fetched concurrently, and merged in order
+		progress = []
+		df = self.client.get_database("twitter", "bitcoin", "1H", start, end, n_workers=3,
+		                              progress=lambda n_done, n_pages : progress.append((n_done, n_pages)))
+		expected = self.stand_in.records("twitter", "bitcoin", "1H", self.datetime_start, datetime.datetime(2019, 3, 1))
+		self.assertEqual(df.shape[0], len(expected))
+		self.assertEqual(list(df.index), [el["datetime"] for el in expected])
+		self.assertTrue(np.array_equal(df["TS"].values, [el["t_epoch"] for el in expected]))
+		self.assertTrue(np.array_equal(df["Topic 0"].values, [el["counts"][0] for el in expected]))
+		self.assertEqual(progress, [(1, 2), (2, 2)])
+	
+	def test_retries(self):
+		# transient failures are retried
+		self.stand_in.failures = [500, 429]
+		self.assertEqual(self.client.send_request("sources"), self.stand_in.sources)
+		
+		# but only so many times, iteratively
+		self.client.max_retries = 2
+		self.stand_in.failures = [503] * 3
+		n_requests = len(self.stand_in.requests)
+		with self.assertRaises(Exception):
+			self.client.send_request("sources")
+		self.assertEqual(len(self.stand_in.requests), n_requests + 3)
+		
+		# and client errors are not retried
+		n_requests = len(self.stand_in.requests)
+		with self.assertRaises(Exception):
+			self.client.send_request("missing")
+		self.assertEqual(len(self.stand_in.requests), n_requests + 1)
+		
+		# bodies cut in transit are retried too
+		self.client.max_retries = 5
+		self.stand_in.failures = ["truncated"] * 2
+		n_requests = len(self.stand_in.requests)
+		self.assertEqual(self.client.send_request("coins"), self.stand_in.coins)
+		self.assertEqual(len(self.stand_in.requests), n_requests + 3)
+	
+	def test_connection_pool(self):
+		# one connection is kept alive per worker
+		url = self.stand_in.url + "/"
+		self.assertEqual(self.client.session.get_adapter(url)._pool_maxsize, 4)
+		self.client.get_database("twitter", "bitcoin", "1H", "2019-01-01T00:00:00Z", "2019-03-01T00:00:00Z", n_workers=6)
+		self.assertEqual(self.client.session.get_adapter(url)._pool_maxsize, 6)
+
+	
+	def test_get_dataframe(self):
+		start, end = "2019-01-02T00:00:00Z", "2019-01-04T00:00:00Z"
+		df = self.client.get_dataframe("reddit", "ripple", "1H", start, end)
+		data = self.client.get_data("reddit", "ripple", "1H", start, end)
+		
+		# the same frame as built from the rows of get_data, with typed columns
+		self.assertEqual(list(df.columns), ["Topic {:d}".format(i) for i in range(93)] + ["TS"])
+		self.assertEqual(df.index.name, "date")
+		self.assertEqual(list(df.index), [el[93] for el in data])
+		self.assertTrue(np.array_equal(df.values, [el[:93] + [el[94]] for el in data]))
+		self.assertTrue(all([dtype == np.int64 for dtype in df.dtypes]))
+	
+	def test_topic_cache(self):
+		start, end = "2019-01-02T00:00:00Z", "2019-01-03T00:00:00Z"
+		
+		# the topics are only requested once per client
+		for i in range(3):
+			self.client.get_dataframe("reddit", "ripple", "1H", start, end)
+		self.assertEqual(self.stand_in.count_requests("/topics"), 1)
+		
+		# or once between clients, with a topics file
+		path = tempfile.mkdtemp()
+		try:
+			topics_path = os.path.join(path, "topics.json")
+			for i in range(2):
+				client = RequestAugmento(url=self.stand_in.url + "/", logging_level="CRITICAL", topics_path=topics_path)
+				self.assertEqual(client.get_topics(), self.stand_in.topics)
+			self.assertEqual(self.stand_in.count_requests("/topics"), 2)
+			
+			# until it expires
+			client = RequestAugmento(url=self.stand_in.url + "/", logging_level="CRITICAL", topics_path=topics_path,
+			                         topics_ttl=0.)
+			client.get_topics()
+			self.assertEqual(self.stand_in.count_requests("/topics"), 3)
+		finally:
+			shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import socket
+import asyncio
+import datetime
+import unittest
+
+# import the client from the root of the repo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from augmento_client import StreamAugmento
+from augmento_client.stream_api import ConnectionClosed
+from augmento_stand_in_server import AugmentoStreamStandIn
+
+
+class TestStreamAugmento(unittest.TestCase):
+	
+	def setUp(self):
+		self.datetime_start = datetime.datetime(2019, 1, 1)
+	
+	def run_stream(self, coroutine, **kwargs):
+		# run a coroutine with a fresh stand-in and stream, closing both after
+		async def main():
+			stand_in = await AugmentoStreamStandIn(self.datetime_start, 24 * 10).start()
+			try:
+				async with StreamAugmento("twitter", "bitcoin", url=stand_in.url, backoff=0.01,
+				                          logging_level="CRITICAL", **kwargs) as stream:
+					return await asyncio.wait_for(coroutine(stand_in, stream), 10.)
+			finally:
+				await stand_in.stop()
+		return asyncio.run(main())
+	
+	def next_bars(self, stream, n_bars):
+		return asyncio.gather(*[stream.__anext__() for i in range(n_bars)])
+	
+	def expected(self, stand_in, i_start, i_end):
+		return stand_in.records("twitter", "bitcoin", "1H", self.datetime_start + datetime.timedelta(hours=i_start),
+		                        self.datetime_start + datetime.timedelta(hours=i_end))
+	
+	def test_stream(self):
+		# bars are pushed as they are published, with their latency
+		async def consume(stand_in, stream):
+			await asyncio.sleep(0.05)
+			await stand_in.publish(5)
+			bars = []
+			async for bar in stream:
+				bars.append(bar)
+				if len(bars) == 5:
+					break
+			self.assertEqual([{k : v for k, v in el.items() if k != "latency"} for el in bars],
+			                 self.expected(stand_in, 0, 5))
+			self.assertEqual(len(stream.latencies), 5)
+			self.assertTrue(all([0. <= el < 5. for el in stream.latencies]))
+		self.run_stream(consume)
+	
+	def test_reconnect(self):
+		# a lost connection is reopened, resuming after the last bar received
+		async def consume(stand_in, stream):
+			await asyncio.sleep(0.05)
+			await stand_in.publish(3)
+			bars = await self.next_bars(stream, 3)
+			stand_in.drop()
+			await stand_in.publish(3)
+			bars += await self.next_bars(stream, 3)
+			self.assertEqual([el["t_epoch"] for el in bars], [el["t_epoch"] for el in self.expected(stand_in, 0, 6)])
+			self.assertEqual(stream.n_reconnections, 1)
+			self.assertEqual(len(stand_in.subscriptions), 2)
+			self.assertEqual(stand_in.subscriptions[1]["since"], bars[2]["t_epoch"])
+		self.run_stream(consume)
+	
+	def test_not_bars(self):
+		# messages that are not bars are skipped
+		async def consume(stand_in, stream):
+			await asyncio.sleep(0.05)
+			stand_in.notify(json.dumps({"type" : "subscribed"}))
+			stand_in.notify(json.dumps([{"type" : "heartbeat"}, "ping"]))
+			stand_in.notify("ping")
+			await stand_in.publish(2)
+			bars = await self.next_bars(stream, 2)
+			self.assertEqual([el["t_epoch"] for el in bars], [el["t_epoch"] for el in self.expected(stand_in, 0, 2)])
+			self.assertEqual(stream.n_reconnections, 0)
+		self.run_stream(consume)
+	
+	def test_close(self):
+		# a closed stream can be connected again, resuming after the last bar received
+		async def consume(stand_in, stream):
+			await asyncio.sleep(0.05)
+			await stand_in.publish(2)
+			bars = await self.next_bars(stream, 2)
+			await stream.close()
+			self.assertIsNone(stream._task)
+			self.assertIsNone(stream._queue)
+			await stand_in.publish(2)
+			bars += await self.next_bars(stream, 2)
+			self.assertEqual([el["t_epoch"] for el in bars], [el["t_epoch"] for el in self.expected(stand_in, 0, 4)])
+			self.assertEqual(stand_in.subscriptions[-1]["since"], bars[1]["t_epoch"])
+		self.run_stream(consume)
+	
+	def test_since(self):
+		# bars already known are skipped
+		async def consume(stand_in, stream):
+			await stand_in.publish(6)
+			bars = await self.next_bars(stream, 2)
+			self.assertEqual([el["t_epoch"] for el in bars], [el["t_epoch"] for el in self.expected(stand_in, 4, 6)])
+		since = int((self.datetime_start - datetime.datetime(1970, 1, 1)).total_seconds()) + 3 * 3600
+		self.run_stream(consume, since=since)
+	
+	def test_backpressure(self):
+		# the buffer doesn't grow past its size while the consumer lags, and nothing is lost
+		async def consume(stand_in, stream):
+			await asyncio.sleep(0.05)
+			await stand_in.publish(50)
+			await asyncio.sleep(0.2)
+			self.assertEqual(stream._queue.qsize(), 2)
+			bars = await self.next_bars(stream, 50)
+			self.assertEqual([el["t_epoch"] for el in bars], [el["t_epoch"] for el in self.expected(stand_in, 0, 50)])
+		self.run_stream(consume, buffer_size=2)
+	
+	def test_give_up(self):
+		# no server, so the connection fails max_retries + 1 times
+		with socket.socket() as s:
+			s.bind(("127.0.0.1", 0))
+			url = "ws://127.0.0.1:{:d}/v0.1".format(s.getsockname()[1])
+		async def consume():
+			async with StreamAugmento("twitter", "bitcoin", url=url, max_retries=2, backoff=0.01,
+			                          logging_level="CRITICAL") as stream:
+				async for bar in stream:
+					pass
+		with self.assertRaises(ConnectionClosed):
+			asyncio.run(consume())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import zlib
+import msgpack
+import numpy as np
+
+# import files from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import time_index_helper as tih
+import example_helper as eh
+
+
+def ref_strip_data_by_time(t_data, data, t_min, t_max):
+	data = np.array([s for s, t in zip(data, t_data) if t >= t_min and t <= t_max])
+	t_data = np.array([t for t in t_data if t >= t_min and t <= t_max])
+	return t_data, data
+
+
+class TestTimeIndex(unittest.TestCase):
+	
+	def setUp(self):
+		rng = np.random.RandomState(0)
+		self.t_grid = 3600.0 * np.arange(100, 120)
+		
+		# hourly series with gaps, one with a sample off the grid
+		self.t_a = np.delete(self.t_grid, [0, 5, 6])
+		self.a = rng.poisson(3.0, (self.t_a.shape[0], 4)).astype(np.int32)
+		self.t_b = np.sort(np.append(np.delete(self.t_grid, [10, 19]), 3600.0 * 110.5))
+		self.b = rng.uniform(1.0, 2.0, self.t_b.shape[0])
+	
+	def test_strip_data_by_time(self):
+		for t_min, t_max in [(3600.0 * 103, 3600.0 * 110), (3600.0 * 103.5, 3600.0 * 110.5), (0.0, 1e9), (1e9, 2e9)]:
+			t_data, data = tih.strip_data_by_time(self.t_a, self.a, t_min, t_max)
+			t_ref, data_ref = ref_strip_data_by_time(self.t_a, self.a, t_min, t_max)
+			self.assertTrue(np.array_equal(t_data, t_ref))
+			self.assertEqual(data.shape[0], t_ref.shape[0])
+			if data_ref.shape[0] > 0:
+				self.assertTrue(np.array_equal(data, data_ref))
+	
+	def test_join_policies(self):
+		series = [(self.t_a, self.a), (self.t_b, self.b)]
+		
+		# mask keeps every bin, with nans in the gaps
+		t_grid, (a, b), masks, reports = tih.join_on_grid(self.t_grid, series, gap_policy="mask")
+		self.assertTrue(np.array_equal(t_grid, self.t_grid))
+		self.assertTrue(np.array_equal(np.flatnonzero(~masks[0]), [0, 5, 6]))
+		self.assertTrue(np.array_equal(np.flatnonzero(~masks[1]), [10, 19]))
+		self.assertTrue(np.all(np.isnan(a[[0, 5, 6]])))
+		self.assertTrue(np.array_equal(a[masks[0]], self.a))
+		
+		# drop keeps the bins both have, in the data's own dtype
+		t_grid, (a, b), masks, reports = tih.join_on_grid(self.t_grid, series, gap_policy="drop")
+		keep = np.ones(20, dtype=np.bool_)
+		keep[[0, 5, 6, 10, 19]] = False
+		self.assertTrue(np.array_equal(t_grid, self.t_grid[keep]))
+		self.assertEqual(a.dtype, np.int32)
+		self.assertTrue(np.array_equal(a, self.a[np.isin(self.t_a, t_grid)]))
+		self.assertTrue(np.array_equal(b, self.b[np.isin(self.t_b, t_grid)]))
+		self.assertTrue(np.all(masks))
+		
+		# ffill carries the last values forward, dropping the bins before the first
+		t_grid, (a, b), masks, reports = tih.join_on_grid(self.t_grid, series, gap_policy="ffill")
+		self.assertTrue(np.array_equal(t_grid, self.t_grid[1:]))
+		self.assertTrue(np.array_equal(a[4], a[3]) and np.array_equal(a[5], a[3]))
+		self.assertEqual(b[18], b[17])
+		
+		# the report has the gaps as [first, last] times, and the bins off the grid
+		self.assertEqual(reports[0]["gaps"], [(3600.0 * 100, 3600.0 * 100), (3600.0 * 105, 3600.0 * 106)])
+		self.assertEqual(reports[0]["n_missing"], 3)
+		self.assertEqual(reports[1]["n_off_grid"], 1)
+		
+		with self.assertRaises(Exception):
+			tih.join_on_grid(self.t_grid, series, gap_policy="interpolate")
+	
+	def test_check_aligned(self):
+		tih.check_aligned(self.t_grid, self.t_grid.copy())
+		with self.assertRaises(Exception):
+			tih.check_aligned(self.t_a, self.t_grid)
+	
+	def test_load_example_data(self):
+		# example data where the prices are missing a bin
+		path = tempfile.mkdtemp()
+		try:
+			filenames = [os.path.join(path, el) for el in ["topics", "augmento", "bitmex"]]
+			data = [{"0" : "Bullish", "1" : "Bearish"},
+			        [{"t_epoch" : t, "counts" : [i, 2 * i]} for i, t in enumerate(self.t_grid)],
+			        [{"t_epoch" : t, "close" : 100.0 + i} for i, t in enumerate(self.t_grid) if i != 7]]
+			for filename, el in zip(filenames, data):
+				with open(filename, "wb") as f:
+					f.write(zlib.compress(msgpack.packb(el)))
+			
+			# by default the series are left as they are
+			_, _, t_aug_data, aug_data, t_price_data, price_data = eh.load_example_data(*filenames)
+			self.assertEqual((t_aug_data.shape[0], t_price_data.shape[0]), (20, 19))
+			with self.assertRaises(Exception):
+				tih.check_aligned(t_aug_data, t_price_data)
+			
+			# or joined on request
+			_, _, t_aug_data, aug_data, t_price_data, price_data = eh.load_example_data(*filenames, gap_policy="drop")
+			tih.check_aligned(t_aug_data, t_price_data)
+			self.assertEqual(t_aug_data.shape[0], 19)
+			self.assertTrue(np.array_equal(aug_data[:, 0], np.delete(np.arange(20), 7)))
+			self.assertTrue(np.array_equal(price_data, 100.0 + np.delete(np.arange(20), 7)))
+		finally:
+			shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+	unittest.main()